@@ -33,6 +33,7 @@ from numpy.random import uniform
 from algo.const import NUM_SETS, RANK_SIZE, REP
 from util.aux import sigmoid, sigmoid_der1
 from perf.metrics import calculate_rmse, calculate_avg_ndcg
+from util.splits import load_split
 
 
 _K = 5          # number of latent dimensions
@@ -464,9 +465,7 @@ def main():
 
   for i in xrange(NUM_SETS):
     print 'Reading pickles'
-    train = load(open('%s/train-%d.pkl' % (_PKL_DIR, i), 'r'))
-    val = load(open('%s/validation-%d.pkl' % (_PKL_DIR, i), 'r'))
-    test = load(open('%s/test-%d.pkl' % (_PKL_DIR, i), 'r'))
+    train, val, test = load_split(i, _PKL_DIR)
     reviews = load(open('%s/reviews-%d.pkl' % (_PKL_DIR, i), 'r'))
   
     train_reviews_ids = set([vote['review'] for vote in train])
@@ -16,3 +16,6 @@ NR_TOL = 1e-4
 NR_STEP = 0.1     # In paper: 1
 
 ETA = 0 
+
+BLOCKED = True # whether groups are drawn at once in Gibbs Sampling
+STREAM = True # whether running statistics are kept instead of Gibbs samples
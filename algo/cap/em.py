@@ -15,15 +15,20 @@ from random import shuffle
 from numpy.random import normal, multivariate_normal, seed
 from math import sqrt
 from numpy import array, identity, zeros, ones, isnan
-from numpy.linalg import pinv
+from numpy.linalg import pinv, cholesky, solve, eigvalsh, LinAlgError
 from multiprocessing import Pool
 
 from algo.cap.models import ScalarVariable, ArrayVariable, EntityScalarVariable, \
-    InteractionScalarGroup, InteractionScalarVariable, EntityArrayGroup
+    InteractionScalarGroup, InteractionScalarVariable, EntityArrayGroup, \
+    RunningStats
 from algo.cap import const
+from algo.cap.state import CapState
 from util.aux import sigmoid
 
 
+_MIN_PIVOT = 1e-8 # smallest ratio of Cholesky pivots of a regular precision
+
+
 def expectation_maximization(groups, votes):
   """ Expectation Maximization algorithm for CAP baseline. Iterates over E and
       M-steps, fitting latent variables and parameters, respectively.
@@ -57,7 +62,7 @@ def expectation_maximization(groups, votes):
       print '------------------------'
 
 
-def perform_e_step(groups, votes, n_samples, n_burnin):
+def perform_e_step(groups, votes, n_samples, n_burnin, stream=const.STREAM):
   """ Performs E-step of EM algorithm. Consists of calculating the expectation
       of the complete log-likelihood with respect to the posterior of latent
       variables (distribution of latent variables given data and parameters).
@@ -74,36 +79,52 @@ def perform_e_step(groups, votes, n_samples, n_burnin):
           expectation.
         n_burnin: number of burn in samples, that is, amount of initial samples
           to ignore.
+        stream: whether running statistics of samples are kept instead of
+          samples.
  
       Returns:
         None. The variables will have samples, empiric mean and variance
       attributes updated. 
   """
-  reset_variables_samples(groups)
-  gibbs_sample(groups, votes, n_samples, n_burnin)
+  reset_variables_samples(groups, stream)
+  gibbs_sample(groups, votes, n_samples, n_burnin, stream=stream)
   calculate_empiric_mean_and_variance(groups)
 
 
-def reset_variables_samples(groups):
+def reset_variables_samples(groups, stream=False):
   """ Resets sample of variables between EM iterations.
 
       Args:
         groups: dictionary of Group objects.
+        stream: whether running statistics of the next samples are kept
+          instead of the samples.
 
       Returns:
         None. The samples of variables are updated (cleaned).
   """
   for group in groups.itervalues():
     for variable in group.iter_variables():
-      variable.reset_samples()
+      variable.reset_samples(stream)
 
 
-def gibbs_sample(groups, votes, n_samples, n_burnin):
+def gibbs_sample(groups, votes, n_samples, n_burnin, blocked=const.BLOCKED,
+    stream=False):
   """ Performs Gibbs Sampling over groups.
 
       Observations:
       - Each Variable object has a list of samples. Once a new sample is
       generated, the value used for the variable is the new sample.
+      - Current values are kept in a CapState, whose residual of votes gives
+      the rest values of conditional distributions without walking groups.
+      - Variables of a scalar group are conditionally independent given the
+      other groups, as are variables of u given v and of v given u. If
+      blocked, each group is drawn at once, which is equivalent in
+      distribution to drawing its variables one at a time.
+      - If streaming, variables keep running statistics of samples, and so
+      does the prediction of each vote, whose variances are then set in the
+      prediction variance parameter.
+      - Burn-in samples are used as current values only, whether streaming or
+      not.
       - After sampling, the values of latent variables are changed to empiric
       mean of samples.
 
@@ -113,26 +134,156 @@ def gibbs_sample(groups, votes, n_samples, n_burnin):
       training data.
         n_samples: the number of samples to obtain.
         n_burnin: number of initial samples to ignore.
+        blocked: whether groups are sampled as blocks.
+        stream: whether variables keep running statistics instead of samples
+      (refer to reset_variables_samples).
 
       Returns:
         None. The samples are inserted into Variable objects.
   """
-  burn_count = 0
-  for _ in xrange(n_samples + n_burnin):
+  state = CapState(groups, votes)
+  pred_stats = RunningStats()
+  for i in xrange(n_samples + n_burnin):
+    burn_in = i < n_burnin
     for g_name in ['alpha', 'beta', 'xi', 'u', 'v', 'gamma', 'lambda']:
       group = groups[g_name]
       if isinstance(group, EntityArrayGroup):
-        for variable in group.iter_variables():
-          mean, var = variable.get_cond_mean_and_var(groups, votes)
-          sample = multivariate_normal(mean.reshape(-1), var)
-          variable.add_sample(sample.reshape(sample.size, 1))
+        if blocked:
+          sample_array_group(state, g_name, burn_in)
+        else:
+          sample_array_variables(state, g_name,
+              xrange(len(state.variables[g_name])), burn_in)
+      elif blocked:
+        sample_scalar_group(state, g_name, burn_in)
       else:
-        for variable in group.iter_variables():
-          mean, var = variable.get_cond_mean_and_var(groups, votes)
+        for j, variable in enumerate(state.variables[g_name]):
+          mean, var = variable.calculate_cond_mean_and_var(group,
+              state.get_rest(g_name, j))
           sample = normal(mean, sqrt(var))
-          variable.add_sample(sample)
-      if burn_count < n_burnin:
-        burn_count += 1
+          state.update(g_name, j, sample)
+          variable.add_sample(sample, burn_in)
+    if stream and not burn_in:
+      pred_stats.add(state.truth - state.residual)
+  var_H = groups.itervalues().next().var_H
+  var_H.pred_var = pred_stats.get_var() if stream else None
+
+
+def sample_scalar_group(state, g_name, burn_in=False):
+  """ Samples all variables of a scalar group at once, with a single vectorized
+      draw from their conditional distributions.
+
+      Args:
+        state: the CapState object with current values.
+        g_name: the name of the scalar group.
+        burn_in: whether the samples are burn-in ones.
+
+      Returns:
+        None. The state is updated and the samples are inserted into Variable
+      objects.
+  """
+  variables = state.variables[g_name]
+  if not variables:
+    return
+  means, variances = state.get_cond_means_and_vars(g_name)
+  samples = normal(means, variances ** 0.5)
+  state.update_group(g_name, samples)
+  for variable, sample in zip(variables, samples.tolist()):
+    variable.add_sample(sample, burn_in)
+
+
+def sample_array_group(state, g_name, burn_in=False):
+  """ Samples all variables of an array group at once. The conditional
+      precisions are factored by a batched Cholesky decomposition, L L^T, and
+      each sample is drawn as L^-T (L^-1 b + z), where b is the precision times
+      the mean and z is a standard normal vector, with triangular solves.
+
+      Observation:
+      - Variables whose precision is singular, or nearly so, are drawn one at a
+      time from covariances obtained by pseudo-inverse. The other variables are
+      still sampled at once (refer to factor_precisions).
+
+      Args:
+        state: the CapState object with current values.
+        g_name: the name of the array group.
+        burn_in: whether the samples are burn-in ones.
+
+      Returns:
+        None. The state is updated and the samples are inserted into Variable
+      objects.
+  """
+  variables = state.variables[g_name]
+  if not variables:
+    return
+  precisions, shifts = state.get_cond_precisions(g_name)
+  chol = factor_precisions(precisions)
+  pivots = chol.diagonal(axis1=1, axis2=2)
+  regular = (pivots > _MIN_PIVOT * pivots.max(axis=1)[:, None]).all(axis=1)
+  samples = state.values[g_name].copy()
+  if regular.any():
+    chol = chol[regular]
+    half = solve(chol, shifts[regular][:, :, None])
+    half += normal(size=half.shape)
+    samples[regular] = solve(chol.transpose(0, 2, 1), half)[:, :, 0]
+    state.update_group(g_name, samples)
+  for j in regular.nonzero()[0]:
+    variables[j].add_sample(samples[j].reshape(const.K, 1), burn_in)
+  sample_array_variables(state, g_name, (~regular).nonzero()[0], burn_in)
+
+
+def factor_precisions(precisions):
+  """ Factors a stack of precision matrices by a batched Cholesky
+      decomposition. A non positive definite matrix makes the whole batch fail,
+      in which case the matrices with a non positive eigenvalue are left out
+      and the others are factored again at once, or one at a time if some
+      still fails.
+
+      Args:
+        precisions: an array of precision matrices, of shape (m, K, K).
+
+      Returns:
+        An array with the lower triangular factor of each precision, of shape
+      (m, K, K), which is null for the precisions left out.
+  """
+  try:
+    return cholesky(precisions)
+  except LinAlgError:
+    pass
+  chol = zeros(precisions.shape)
+  positive = (eigvalsh(precisions).min(axis=1) > 0).nonzero()[0]
+  try:
+    chol[positive] = cholesky(precisions[positive])
+  except LinAlgError:
+    for j in positive:
+      try:
+        chol[j] = cholesky(precisions[j])
+      except LinAlgError:
+        pass
+  return chol
+
+
+def sample_array_variables(state, g_name, positions, burn_in=False):
+  """ Samples variables of an array group one at a time, with covariances
+      obtained by pseudo-inverse.
+
+      Args:
+        state: the CapState object with current values.
+        g_name: the name of the array group.
+        positions: the positions of the variables to sample in the group.
+        burn_in: whether the samples are burn-in ones.
+
+      Returns:
+        None. The state is updated and the samples are inserted into Variable
+      objects.
+  """
+  group = state.groups[g_name]
+  for j in positions:
+    variable = state.variables[g_name][j]
+    pair_values = state.get_pair_values(g_name, j)
+    mean, var = variable.calculate_cond_mean_and_var(group,
+        state.get_rest(g_name, j, pair_values), pair_values)
+    sample = multivariate_normal(mean.reshape(-1), var)
+    state.update(g_name, j, sample, pair_values)
+    variable.add_sample(sample.reshape(sample.size, 1), burn_in)
 
 
 def calculate_empiric_mean_and_variance(groups):
@@ -40,6 +40,7 @@ from perf.metrics import calculate_rmse, calculate_avg_ndcg
 from util.aux import sigmoid
 from util.avg_model import compute_avg_user, compute_avg_model
 from util.scaling import fit_scaler, scale_features
+from util.splits import load_split
 
 
 _OUTPUT_DIR = 'out/test'
@@ -285,9 +286,7 @@ def main():
     print 'Reading data'
     reviews = load(open('%s/reviews-%d.pkl' % (_PKL_DIR, i), 'r'))
     users = load(open('%s/users-%d.pkl' % (_PKL_DIR, i), 'r'))
-    train = load(open('%s/train-%d.pkl' % (_PKL_DIR, i), 'r'))
-    test = load(open('%s/test-%d.pkl' % (_PKL_DIR, i), 'r'))
-    val = load(open('%s/validation-%d.pkl' % (_PKL_DIR, i), 'r'))
+    train, val, test = load_split(i, _PKL_DIR)
     trusts = load(open('%s/trusts.pkl' % _PKL_DIR, 'r'))
     sim = load(open('%s/sim-%d.pkl' % (_PKL_DIR, i), 'r'))
     conn = load(open('%s/conn-%d.pkl' % (_PKL_DIR, i), 'r'))
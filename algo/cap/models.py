@@ -8,7 +8,8 @@
 """
 
 
-from numpy import array, reshape, mean, std, identity, zeros, ones
+from numpy import array, reshape, mean, std, identity, zeros, ones, \
+    bincount, concatenate, int32, nan
 from numpy.random import uniform
 from scipy.linalg import pinv2 as pinv
 
@@ -160,6 +161,7 @@ class PredictionVarianceParameter(ScalarVarianceParameter):
           None.
     """
     super(PredictionVarianceParameter, self).__init__(name)
+    self.pred_var = None # empiric variances of predictions, if streaming
   
   def optimize(self, groups, votes):
     """ Optimizes the value of the parameter using the prediction and truth
@@ -169,6 +171,9 @@ class PredictionVarianceParameter(ScalarVarianceParameter):
         - The variance is calculated using RSS (residual sum of squares) of
           predicted and true values of helpfulness votes and empirical variance
           of predicted values.
+        - If the E-step kept running statistics instead of samples, the
+          empirical variance of predicted values of each vote is taken from
+          pred_var.
 
         Args:
           groups: list of variable group which determines the predicted value.
@@ -180,10 +185,11 @@ class PredictionVarianceParameter(ScalarVarianceParameter):
     size = len(votes) 
     sse = 0 # same as rss
     var_sum = 0
-    for vote in votes:
+    stream = self.pred_var is not None
+    for j, vote in enumerate(votes):
       truth = vote['vote']
       pred = 0
-      num_samples = groups.values()[0].get_num_samples()
+      num_samples = 0 if stream else groups.values()[0].get_num_samples()
       pred_samples = [0.0] * num_samples
       for g in groups.itervalues():
         inst = g.get_instance(vote)
@@ -198,7 +204,7 @@ class PredictionVarianceParameter(ScalarVarianceParameter):
           pred += inst.empiric_mean
           for i in xrange(num_samples):
             pred_samples[i] += inst.samples[i]
-      var_sum += std(pred_samples, ddof=1) ** 2
+      var_sum += self.pred_var[j] if stream else std(pred_samples, ddof=1) ** 2
       sse += (truth - pred) ** 2
     self.update((float) (sse + var_sum) / size)
 
@@ -437,11 +443,59 @@ class InteractionScalarParameter(Parameter):
     return der 
 
 
+class RunningStats(object):
+  """ Class of the running mean and variance of a sequence of values, floats or
+      arrays, by Welford's method, without storing the values.
+  """
+
+  def __init__(self):
+    """ Constructor of RunningStats.
+
+        Args:
+          None.
+
+        Returns:
+          None.
+    """
+    self.count = 0
+    self.mean = 0.0
+    self.sq_dev = 0.0 # sum of squared deviations from the mean
+
+  def add(self, value):
+    """ Adds a value to the statistics.
+
+        Args:
+          value: a float or an array.
+
+        Returns:
+          None. The count, mean and squared deviations are updated.
+    """
+    self.count += 1
+    delta = value - self.mean
+    self.mean = self.mean + delta / self.count
+    self.sq_dev = self.sq_dev + delta * (value - self.mean)
+
+  def get_var(self):
+    """ Gets the unbiased variance (ddof=1) of the values added.
+
+        Args:
+          None.
+
+        Returns:
+          A float or an array with the variance, nan if less than two values
+        were added.
+    """
+    if self.count < 2:
+      return self.sq_dev * nan
+    return self.sq_dev / (self.count - 1)
+
+
 class Variable(Value):
   """ Class defining a latent variable.
   """
   
-  def __init__(self, name, shape, entity_id, e_type, features, votes): 
+  def __init__(self, name, shape, entity_id, e_type, features, votes,
+      related_votes=None): 
     """ Constructor of Variable.
     
         Args:
@@ -452,6 +506,10 @@ class Variable(Value):
           e_type: a string or a 2-tuple of strings with entities types related
             to this variable.
           features: array of observed features associated with the variable.
+          votes: list of votes (training set).
+          related_votes: an optional array with the indices of votes related to
+            the variable (refer to VoteIndex), found by scanning votes if not
+            given.
           
         Returns:
           None.
@@ -467,28 +525,42 @@ class Variable(Value):
     self.feat_matrix = None # on demand 
     self.samples = []
     self.num_samples = 0
+    self.stream = False
+    self.stats = None
+    self.last_sample = None
     self.empiric_mean = None
     self.empiric_var = None
     self.cond_var = None
     self.var_dot = None
-    self.related_votes = self.get_related_votes(votes)
+    self.related_votes = self.get_related_votes(votes) if related_votes is \
+        None else related_votes
     self.num_votes = len(self.related_votes) 
 
-  def add_sample(self, value):
+  def add_sample(self, value, burn_in=False):
     """ Add a sample of this variable to the list of samples.
 
         Observations:
         - The sample is used for Gibbs Sampling when approximating the joint
         distribution of latent and observed variables.
+        - Burn-in samples are only kept as the last sample, neither stored nor
+        accumulated.
+        - If streaming, only the last sample and running statistics are kept.
 
         Args:
           value: a value of the type of the variable.
+          burn_in: whether the sample is a burn-in one.
           
         Returns:
           None. The value is added to the list of samples    
     """
+    self.last_sample = value
+    if burn_in:
+      return
     self.num_samples += 1
-    self.samples.append(value)
+    if self.stream:
+      self.stats.add(value)
+    else:
+      self.samples.append(value)
 
   def get_last_sample(self):
     """ Gets the last sampled value of this variable.
@@ -499,6 +571,8 @@ class Variable(Value):
         Returns:
           A value of this variable, with its type.
     """
+    if self.last_sample is not None:
+      return self.last_sample
     if not self.num_samples:
       return self.value # initial value
     return self.samples[-1]
@@ -535,11 +609,12 @@ class Variable(Value):
         rest = rest - var_value
     return rest
 
-  def reset_samples(self):
+  def reset_samples(self, stream=False):
     """ Resets sample information after one iteration of EM.
 
         Args:
-          None.
+          stream: whether running statistics of the next samples are kept
+            instead of the samples.
 
         Returns:
           None. The object is modified with initial values for sample related
@@ -547,6 +622,9 @@ class Variable(Value):
     """ 
     self.num_samples = 0
     self.samples = []
+    self.stream = stream
+    self.stats = RunningStats() if stream else None
+    self.last_sample = None
     self.cond_var = None
     self.var_dot = None
   
@@ -568,7 +646,8 @@ class ScalarVariable(Variable):
   """ Class defining a scalar latent variable.
   """
   
-  def __init__(self, name, entity_id, e_type, features, votes): 
+  def __init__(self, name, entity_id, e_type, features, votes,
+      related_votes=None): 
     """ Constructor of Variable.
     
         Args:
@@ -578,12 +657,15 @@ class ScalarVariable(Variable):
             variable (review, author, voter or (author, voter)).
           features: array of observed features associated with the variable.
           votes: list of votes (training set).
+          related_votes: an optional array with the indices of votes related to
+            the variable (refer to VoteIndex), found by scanning votes if not
+            given.
 
         Returns:
           None.
     """
     super(ScalarVariable, self).__init__(name, 1, entity_id, e_type, features,
-        votes)
+        votes, related_votes)
   
   def calculate_empiric_mean(self):
     """ Calculates the empiric mean of this variable using the samples.
@@ -594,7 +676,8 @@ class ScalarVariable(Variable):
         Returns:
           None. The empiric mean field is updated in this object.
     """
-    self.empiric_mean = mean(self.samples)
+    self.empiric_mean = self.stats.mean if self.stream else \
+        mean(self.samples)
     self.update(float(self.empiric_mean))
 
   def calculate_empiric_var(self):
@@ -606,14 +689,18 @@ class ScalarVariable(Variable):
         Returns:
           None. The empiric variance field is updated in this object.
     """
-    self.empiric_var = std(self.samples, ddof=1) ** 2
+    if self.stream:
+      self.empiric_var = self.stats.get_var()
+    else:
+      self.empiric_var = std(self.samples, ddof=1) ** 2
 
 
 class ArrayVariable(Variable):
   """ Class defining a latent variable.
   """
   
-  def __init__(self, name, shape, entity_id, e_type, features, votes): 
+  def __init__(self, name, shape, entity_id, e_type, features, votes,
+      related_votes=None): 
     """ Constructor of Variable.
     
         Args:
@@ -625,12 +712,15 @@ class ArrayVariable(Variable):
             tuple of strings if two entities are.
           features: array of observed features associated with the variable.
           votes: list of votes (training set).
+          related_votes: an optional array with the indices of votes related to
+            the variable (refer to VoteIndex), found by scanning votes if not
+            given.
           
         Returns:
           None.
     """
     super(ArrayVariable, self).__init__(name, shape, entity_id, e_type,
-        features, votes)
+        features, votes, related_votes)
 
   def calculate_empiric_mean(self):
     """ Calculates the empiric mean of this variable using the samples, 
@@ -642,7 +732,10 @@ class ArrayVariable(Variable):
         Returns:
           None. The empiric mean field is updated in this object.
     """
-    self.empiric_mean = (1.0 / self.num_samples) * sum(self.samples)
+    if self.stream:
+      self.empiric_mean = self.stats.mean
+    else:
+      self.empiric_mean = (1.0 / self.num_samples) * sum(self.samples)
     self.update(self.empiric_mean)
 
   def calculate_empiric_var(self):
@@ -658,30 +751,35 @@ class ArrayVariable(Variable):
         Returns:
           None. The empiric variance field is updated in this object.
     """
+    if self.stream:
+      self.empiric_var = self.stats.get_var()
+      return
     samples = array([s.reshape(-1) for s in self.samples])
     n_dim = samples.shape[1]
     self.empiric_var = reshape(array([[std(samples[:,i], ddof=1) ** 2 for i in
         xrange(n_dim)]]), (n_dim, 1))
 
-  def add_sample(self, value):
+  def add_sample(self, value, burn_in=False):
     """ Adds a sample to the variable. Differently from other variables, 
         it guarantees the proper shape. 
 
         Args:
           value: the value of the new sample.
+          burn_in: whether the sample is a burn-in one.
 
         Returns:
           None.
     """
     value = array(value).reshape(self.shape)
-    super(ArrayVariable, self).add_sample(value)
+    super(ArrayVariable, self).add_sample(value, burn_in)
 
 
 class EntityScalarVariable(ScalarVariable):
   """ Class defining a scalar latent variable associated to an entity.
   """
   
-  def __init__(self, name, entity_id, e_type, features, votes): 
+  def __init__(self, name, entity_id, e_type, features, votes,
+      related_votes=None): 
     """ Constructor of EntityScalarLatentVariable.
     
         Args:
@@ -691,12 +789,15 @@ class EntityScalarVariable(ScalarVariable):
             variable.
           features: array of observed features associated to the variable.
           votes: list of votes (training set).
+          related_votes: an optional array with the indices of votes related to
+            the variable (refer to VoteIndex), found by scanning votes if not
+            given.
           
         Returns:
           None.
     """
     super(EntityScalarVariable, self).__init__(name, entity_id, e_type,
-        features, votes)
+        features, votes, related_votes)
 
   def get_cond_mean_and_var(self, groups, votes):
     """ Gets the conditional mean and variance of this variable.
@@ -715,14 +816,22 @@ class EntityScalarVariable(ScalarVariable):
         Returns:
           A 2-tuple with the mean and variance, both floats.
     """
-    variance = 0.0
-    rest_term = 0.0
-    var_group = groups[self.name]
-    for i in self.related_votes:
-      vote = votes[i] 
-      rest = self.get_rest_value(groups, vote)
-      rest_term += rest
-    rest_term /= var_group.var_H.value 
+    rest = array([self.get_rest_value(groups, votes[i]) for i in
+        self.related_votes])
+    return self.calculate_cond_mean_and_var(groups[self.name], rest)
+
+  def calculate_cond_mean_and_var(self, var_group, rest):
+    """ Calculates the conditional mean and variance of this variable given the
+        rest values of its related votes (refer to get_rest_value).
+
+        Args:
+          var_group: the Group object of this variable.
+          rest: an array with the rest value of each related vote.
+
+        Returns:
+          A 2-tuple with the mean and variance, both floats.
+    """
+    rest_term = rest.sum() / var_group.var_H.value
     if self.cond_var is None:
       self.cond_var = 1.0 / (1.0 / var_group.var_param.value + \
           float(self.num_votes) / var_group.var_H.value)
@@ -737,7 +846,8 @@ class EntityArrayVariable(ArrayVariable):
   """ Class defining an array latent variable associated to an entity.
   """
   
-  def __init__(self, name, shape, entity_id, e_type, features, votes): 
+  def __init__(self, name, shape, entity_id, e_type, features, votes,
+      related_votes=None): 
     """ Constructor of Variable.
     
         Args:
@@ -749,12 +859,15 @@ class EntityArrayVariable(ArrayVariable):
             variable.
           features: array of observed features associated with the variable.
           votes: list of votes (training set).
+          related_votes: an optional array with the indices of votes related to
+            the variable (refer to VoteIndex), found by scanning votes if not
+            given.
           
         Returns:
           None.
     """
     super(EntityArrayVariable, self).__init__(name, shape, entity_id, e_type,
-        features, votes)
+        features, votes, related_votes)
     self.inv_var = None
 
   def get_cond_mean_and_var(self, groups, votes):
@@ -775,19 +888,34 @@ class EntityArrayVariable(ArrayVariable):
           A 2-tuple with the mean, a vector of size K, and the covariance, a
         matrix of size (K, K).
     """
-    variance = zeros((const.K, const.K))
-    rest_term = zeros((const.K, 1))
-    var_group = groups[self.name]
-    pair_group = groups[var_group.pair_name]
+    pair_group = groups[groups[self.name].pair_name]
+    rest = array([self.get_rest_value(groups, votes[i]) for i in
+        self.related_votes])
+    pair_values = array([pair_group.get_instance(votes[i]).get_last_sample()
+        .reshape(-1) for i in self.related_votes]).reshape(-1, const.K)
+    return self.calculate_cond_mean_and_var(groups[self.name], rest,
+        pair_values)
+
+  def calculate_cond_mean_and_var(self, var_group, rest, pair_values):
+    """ Calculates the conditional mean and variance of this variable given the
+        rest values of its related votes (refer to get_rest_value) and the
+        values of the pair variable in these votes.
+
+        Args:
+          var_group: the Group object of this variable.
+          rest: an array with the rest value of each related vote.
+          pair_values: a matrix with the value of the pair variable of each
+        related vote as a row.
+
+        Returns:
+          A 2-tuple with the mean, a vector of size K, and the covariance, a
+        matrix of size (K, K).
+    """
     if self.inv_var is None:
       var_matrix = var_group.var_param.value * identity(const.K)
       self.inv_var = pinv(var_matrix)
-    for i in self.related_votes:
-      vote = votes[i] 
-      rest = self.get_rest_value(groups, vote)
-      pair_value = pair_group.get_instance(vote).get_last_sample()
-      variance += pair_value.dot(pair_value.T)
-      rest_term += rest * pair_value
+    variance = pair_values.T.dot(pair_values)
+    rest_term = pair_values.T.dot(rest).reshape(const.K, 1)
     rest_term /= var_group.var_H.value
     variance = pinv(variance / var_group.var_H.value + self.inv_var)
     if self.var_dot is None:
@@ -796,17 +924,18 @@ class EntityArrayVariable(ArrayVariable):
     mean = variance.dot(self.var_dot + rest_term)
     return mean, variance
 
-  def reset_samples(self):
+  def reset_samples(self, stream=False):
     """ Resets values of fields related to the sampling process, which should be
         initialized between EM iterations.
 
         Args:
-          None.
+          stream: whether running statistics of the next samples are kept
+            instead of the samples.
 
         Returns:
           None.
     """
-    super(EntityArrayVariable, self).reset_samples()
+    super(EntityArrayVariable, self).reset_samples(stream)
     self.inv_var = None
   
 
@@ -815,19 +944,23 @@ class InteractionScalarVariable(ScalarVariable):
       interaction of entities.
   """
   
-  def __init__(self, name, entity_id, e_type, features, votes): 
+  def __init__(self, name, entity_id, e_type, features, votes,
+      related_votes=None): 
     """ Constructor of Variable.
     
         Args:
           entity_id: id of the entity holding this variable.
           features: array of observed features associated with the variable.
           votes: list of votes (training set).
+          related_votes: an optional array with the indices of votes related to
+            the variable (refer to VoteIndex), found by scanning votes if not
+            given.
           
         Returns:
           None.
     """
     super(InteractionScalarVariable, self).__init__(name, entity_id,
-        e_type, features, votes)
+        e_type, features, votes, related_votes)
  
   def get_cond_mean_and_var(self, groups, votes):
     """ Gets the conditional mean and variance of this variable.
@@ -846,14 +979,22 @@ class InteractionScalarVariable(ScalarVariable):
         Returns:
           A 2-tuple with the mean and variance, both float values.
     """
-    variance = 0.0
-    mean = 0.0
-    for i in self.related_votes:
-      vote = votes[i] 
-      rest = self.get_rest_value(groups, vote)
-      mean += rest
-    var_group = groups[self.name]
-    mean /= var_group.var_H.value
+    rest = array([self.get_rest_value(groups, votes[i]) for i in
+        self.related_votes])
+    return self.calculate_cond_mean_and_var(groups[self.name], rest)
+
+  def calculate_cond_mean_and_var(self, var_group, rest):
+    """ Calculates the conditional mean and variance of this variable given the
+        rest values of its related votes (refer to get_rest_value).
+
+        Args:
+          var_group: the Group object of this variable.
+          rest: an array with the rest value of each related vote.
+
+        Returns:
+          A 2-tuple with the mean and variance, both float values.
+    """
+    mean = rest.sum() / var_group.var_H.value
     if self.cond_var is None: 
       self.cond_var = 1.0 / (1.0 / var_group.var_param.value + \
           float(self.num_votes) / var_group.var_H.value)
@@ -877,6 +1018,52 @@ class InteractionScalarVariable(ScalarVariable):
         self.entity_id[0] and vote[self.e_type[1]] == self.entity_id[1]]
 
 
+class VoteIndex(object):
+  """ Class of an inverted index from entities to the indices of their votes,
+      in CSR format: indices of votes grouped by entity, in increasing order,
+      and offsets of the groups.
+  """
+
+  def __init__(self, votes, e_type):
+    """ Constructor of VoteIndex, built in a single pass over votes.
+
+        Args:
+          votes: list of votes (training set).
+          e_type: a string or a 2-tuple of strings with the entity types of
+            the keys.
+
+        Returns:
+          None.
+    """
+    self.votes = votes
+    self.keys = {}
+    key_ids = []
+    for vote in votes:
+      if type(e_type) is tuple:
+        key = vote[e_type[0]], vote[e_type[1]]
+      else:
+        key = vote[e_type]
+      key_ids.append(self.keys.setdefault(key, len(self.keys)))
+    key_ids = array(key_ids, dtype=int32)
+    self.indices = key_ids.argsort(kind='mergesort').astype(int32) # stable
+    self.offsets = concatenate(([0], bincount(key_ids,
+        minlength=len(self.keys)).cumsum())).astype(int32)
+
+  def get(self, entity_id):
+    """ Gets the indices of the votes of an entity.
+
+        Args:
+          entity_id: the id of the entity.
+
+        Returns:
+          An int array, a slice of the index, with the indices of the votes.
+    """
+    if entity_id not in self.keys:
+      return self.indices[:0]
+    key = self.keys[entity_id]
+    return self.indices[self.offsets[key]:self.offsets[key+1]]
+
+
 class Group(object):
   """ Class container of a set of variables of the same type but regarding 
       different entities.
@@ -904,6 +1091,7 @@ class Group(object):
     self.variables = {} 
     self.size = 0
     self.pair_name = None
+    self.vote_index = None
 
   def iter_variables(self):
     """ Iterates over the instances of variables in this group.
@@ -992,6 +1180,21 @@ class Group(object):
     """
     return self.iter_variables().next().shape
 
+  def get_related_votes(self, entity_id, votes):
+    """ Gets the indices of the votes related to an entity of this group, by
+        an index of votes built once for the given list of votes.
+
+        Args:
+          entity_id: the id of the entity.
+          votes: list of votes (training set).
+
+        Returns:
+          An int array with the indices of the votes.
+    """
+    if self.vote_index is None or self.vote_index.votes is not votes:
+      self.vote_index = VoteIndex(votes, self.e_type)
+    return self.vote_index.get(entity_id)
+
   def set_pair_name(self, pair_name):
     """ Sets pair name of a variable group. A pair name is the name of another
         variable group whose term in the prediction formula is associated to
@@ -1027,6 +1230,18 @@ class EntityScalarGroup(Group):
     super(EntityScalarGroup, self).__init__(name, 1, e_type,
         weight_param, var_param, var_H)
 
+  def get_prior_mean(self, features):
+    """ Gets the prior means of variables of this group, the regression on their
+        features.
+
+        Args:
+          features: a matrix with the features of a variable in each row.
+
+        Returns:
+          An array with the prior mean of each variable.
+    """
+    return features.dot(self.weight_param.value).reshape(-1)
+
   def add_instance(self, entity_id, features, votes):
     """ Adds an instance variable of this group with the appropriate Variable
         subclass.
@@ -1043,7 +1258,8 @@ class EntityScalarGroup(Group):
     if entity_id in self.variables:
       return 
     self.variables[entity_id] = EntityScalarVariable(self.name, entity_id,
-        self.e_type, features, votes)
+        self.e_type, features, votes, self.get_related_votes(entity_id,
+        votes))
     self.size += 1
 
 
@@ -1085,7 +1301,8 @@ class EntityArrayGroup(Group):
     if entity_id in self.variables:
       return 
     self.variables[entity_id] = EntityArrayVariable(self.name, self.shape,
-        entity_id, self.e_type, features, votes)
+        entity_id, self.e_type, features, votes,
+        self.get_related_votes(entity_id, votes))
     self.size += 1
 
 
@@ -1109,6 +1326,18 @@ class InteractionScalarGroup(Group):
     super(InteractionScalarGroup, self).__init__(name, 1, e_type, weight_param,
         var_param, var_H)
 
+  def get_prior_mean(self, features):
+    """ Gets the prior means of variables of this group, the sigmoid of the
+        regression on their features.
+
+        Args:
+          features: a matrix with the features of a variable in each row.
+
+        Returns:
+          An array with the prior mean of each variable.
+    """
+    return sigmoid(features.dot(self.weight_param.value).reshape(-1))
+
   def add_instance(self, entity_id, features, votes): 
     """ Adds an instance variable of this group with the appropriate Variable
         subclass.
@@ -1125,5 +1354,6 @@ class InteractionScalarGroup(Group):
     if entity_id in self.variables:
       return 
     self.variables[entity_id] = InteractionScalarVariable(self.name,
-        entity_id, self.e_type, features, votes)
+        entity_id, self.e_type, features, votes,
+        self.get_related_votes(entity_id, votes))
     self.size += 1
@@ -0,0 +1,295 @@
+""" State Module
+    ------------
+
+    Defines the sampling state of CAP as arrays: a vector of values for each
+    scalar group (alpha, beta, xi, gamma and lambda) and a matrix for each
+    array group (u and v), indexed by the position of the variable in its
+    group. Each vote holds the positions of its variables, and a residual
+    vector keeps the truth minus the full prediction of each vote, updated in
+    place whenever a variable is resampled. Thus, the rest value of a vote
+    regarding a variable is its residual plus the variable term.
+
+    Variables of a scalar group are conditionally independent given the other
+    groups, since each vote holds at most one of them. Hence, the conditional
+    means and variances of a whole scalar group are obtained at once by segment
+    sums of rest values over the positions of votes, and the group is updated
+    as a block. The same holds for u given v and for v given u, whose
+    conditional precisions are segment sums of outer products of pair values.
+
+    Not directly callable.
+"""
+
+
+from numpy import array, asarray, zeros, ones, identity, arange, bincount, \
+    einsum, int32
+from scipy.linalg import pinv2 as pinv
+from scipy.sparse import csr_matrix
+
+from algo.cap import const
+
+
+class CapState(object):
+  """ Array state of the variables of CAP for Gibbs Sampling.
+  """
+
+  def __init__(self, groups, votes):
+    """ Constructor of CapState. Values are the last samples of variables.
+
+        Args:
+          groups: dictionary of Group objects, indexed by name.
+          votes: list of votes (training set).
+
+        Returns:
+          None.
+    """
+    self.groups = groups
+    self.truth = array([vote['vote'] for vote in votes], dtype=float)
+    self.variables = {}
+    self.related = {}
+    self.values = {}
+    self.indices = {}
+    self.rows = {}
+    self.prior_terms = {}
+    self.segments = {}
+    for name, group in groups.iteritems():
+      variables = list(group.iter_variables())
+      self.variables[name] = variables
+      self.related[name] = [asarray(variable.related_votes, dtype=int32) for
+          variable in variables]
+      indices = -ones(len(votes), dtype=int32) # -1 means no instance
+      for j, related in enumerate(self.related[name]):
+        indices[related] = j
+      self.indices[name] = indices
+      self.rows[name] = (indices >= 0).nonzero()[0]
+      if group.pair_name:
+        self.values[name] = array([variable.get_last_sample().reshape(-1) for
+            variable in variables]).reshape(-1, const.K)
+      else:
+        self.values[name] = array([variable.get_last_sample() for variable in
+            variables], dtype=float)
+    self.residual = self.truth - self.get_predictions()
+
+  def get_term(self, name, rows=None):
+    """ Gets the term of a scalar group in the prediction of votes.
+
+        Args:
+          name: the name of the group.
+          rows: an optional int array of votes, all of them by default.
+
+        Returns:
+          An array with the value of the variable of each vote, zero if the vote
+        has no instance of the group.
+    """
+    indices = self.indices[name] if rows is None else \
+        self.indices[name][rows]
+    term = zeros(len(indices))
+    present = indices >= 0
+    term[present] = self.values[name][indices[present]]
+    return term
+
+  def get_predictions(self):
+    """ Gets the full prediction of each vote with current values.
+
+        Args:
+          None.
+
+        Returns:
+          An array of predictions.
+    """
+    pred = (self.values['u'][self.indices['u']] *
+        self.values['v'][self.indices['v']]).sum(axis=1)
+    for name in self.groups:
+      if not self.groups[name].pair_name:
+        pred += self.get_term(name)
+    return pred
+
+  def get_pair_values(self, name, j):
+    """ Gets the values of the pair variable in the votes related to a variable
+        of an array group.
+
+        Args:
+          name: the name of the array group.
+          j: the position of the variable in the group.
+
+        Returns:
+          A matrix with the value of the pair variable of each related vote as a
+        row.
+    """
+    pair_name = self.groups[name].pair_name
+    rows = self.related[name][j]
+    return self.values[pair_name][self.indices[pair_name][rows]]
+
+  def get_rest(self, name, j, pair_values=None):
+    """ Gets the rest values of the votes related to a variable, the truth
+        minus all terms except the one of the variable (refer to
+        Variable.get_rest_value).
+
+        Args:
+          name: the name of the group.
+          j: the position of the variable in the group.
+          pair_values: the values of the pair variable in related votes, if the
+        group is an array group (refer to get_pair_values).
+
+        Returns:
+          An array with the rest value of each related vote.
+    """
+    residual = self.residual[self.related[name][j]]
+    if pair_values is None:
+      return residual + self.values[name][j]
+    return residual + pair_values.dot(self.values[name][j])
+
+  def update(self, name, j, value, pair_values=None):
+    """ Sets the value of a variable, updating the residual of related votes.
+
+        Args:
+          name: the name of the group.
+          j: the position of the variable in the group.
+          value: the new value, a float or an array of size K.
+          pair_values: the values of the pair variable in related votes, if the
+        group is an array group (refer to get_pair_values).
+
+        Returns:
+          None. The values and the residual are updated in place.
+    """
+    delta = value - self.values[name][j]
+    related = self.related[name][j]
+    if pair_values is None:
+      self.residual[related] -= delta
+    else:
+      self.residual[related] -= pair_values.dot(delta)
+    self.values[name][j] = value
+
+  def get_prior_terms(self, name):
+    """ Gets the terms of the conditional distributions of a group which are
+        constant in the same EM iteration, cached by group (as cond_var,
+        inv_var and var_dot of variables).
+
+        Args:
+          name: the name of the group.
+
+        Returns:
+          A 2-tuple. For a scalar group, an array of conditional variances and
+        an array of prior means over the prior variance, by position in the
+        group. For an array group, the inverse prior covariance, a matrix of
+        size (K, K), and a matrix with the prior mean times the inverse prior
+        covariance of each variable as a row.
+    """
+    if name not in self.prior_terms:
+      group = self.groups[name]
+      variables = self.variables[name]
+      num_features = group.weight_param.shape[1 if group.pair_name else 0]
+      features = array([variable.features.reshape(-1) for variable in
+          variables]).reshape(len(variables), num_features)
+      if group.pair_name:
+        inv_var = pinv(group.var_param.value * identity(const.K))
+        var_dot = features.dot(group.weight_param.value.T).dot(inv_var)
+        self.prior_terms[name] = inv_var, var_dot
+      else:
+        num_votes = array([variable.num_votes for variable in variables],
+            dtype=float)
+        cond_var = 1.0 / (1.0 / group.var_param.value + num_votes /
+            group.var_H.value)
+        var_dot = group.get_prior_mean(features) / group.var_param.value
+        self.prior_terms[name] = cond_var, var_dot
+    return self.prior_terms[name]
+
+  def get_segments(self, name):
+    """ Gets the matrix summing values of votes by the position of their
+        variable in a group, cached by group.
+
+        Args:
+          name: the name of the group.
+
+        Returns:
+          A sparse matrix with a row for each variable and a column for each
+        vote with an instance of the group (refer to rows).
+    """
+    if name not in self.segments:
+      rows = self.rows[name]
+      self.segments[name] = csr_matrix((ones(len(rows)),
+          (self.indices[name][rows], arange(len(rows)))),
+          shape=(len(self.variables[name]), len(rows)))
+    return self.segments[name]
+
+  def get_cond_means_and_vars(self, name):
+    """ Gets the conditional means and variances of all variables of a scalar
+        group (refer to ScalarVariable.calculate_cond_mean_and_var), summing
+        the rest values of votes by the position of their variable.
+
+        Args:
+          name: the name of the scalar group.
+
+        Returns:
+          A 2-tuple with an array of means and an array of variances, by
+        position in the group.
+    """
+    rows = self.rows[name]
+    positions = self.indices[name][rows]
+    values = self.values[name]
+    rest = self.residual[rows] + values[positions]
+    rest_sum = bincount(positions, weights=rest, minlength=len(values))
+    cond_var, var_dot = self.get_prior_terms(name)
+    mean = cond_var * (rest_sum / self.groups[name].var_H.value + var_dot)
+    return mean, cond_var
+
+  def get_cond_precisions(self, name):
+    """ Gets the conditional precisions of all variables of an array group,
+        the inverses of their covariances (refer to
+        EntityArrayVariable.calculate_cond_mean_and_var), with the outer
+        products of pair values of votes summed by the position of their
+        variable.
+
+        Args:
+          name: the name of the array group.
+
+        Returns:
+          A 2-tuple with an array of precision matrices, of shape (m, K, K),
+        and a matrix with the precision times the mean of each variable as a
+        row, of shape (m, K), where m is the size of the group.
+    """
+    rows = self.rows[name]
+    pair_values = self.get_pair_rows(name)
+    values = self.values[name][self.indices[name][rows]]
+    rest = self.residual[rows] + (pair_values * values).sum(axis=1)
+    segments = self.get_segments(name)
+    var_H = self.groups[name].var_H.value
+    inv_var, var_dot = self.get_prior_terms(name)
+    outer = einsum('ni,nj->nij', pair_values, pair_values)
+    precisions = segments.dot(outer.reshape(len(rows), -1)).reshape(-1,
+        const.K, const.K) / var_H + inv_var
+    shifts = segments.dot(pair_values * rest[:, None]) / var_H + var_dot
+    return precisions, shifts
+
+  def get_pair_rows(self, name):
+    """ Gets the values of the pair variable in the votes with an instance of
+        an array group.
+
+        Args:
+          name: the name of the array group.
+
+        Returns:
+          A matrix with the value of the pair variable of each vote as a row,
+        following rows.
+    """
+    pair_name = self.groups[name].pair_name
+    return self.values[pair_name][self.indices[pair_name][self.rows[name]]]
+
+  def update_group(self, name, values):
+    """ Sets the values of all variables of a group, updating the residual of
+        votes.
+
+        Args:
+          name: the name of the group.
+          values: an array with the new value of each variable, by position, or
+        a matrix with them as rows for an array group.
+
+        Returns:
+          None. The values and the residual are updated in place.
+    """
+    rows = self.rows[name]
+    delta = (values - self.values[name])[self.indices[name][rows]]
+    if self.groups[name].pair_name:
+      self.residual[rows] -= (self.get_pair_rows(name) * delta).sum(axis=1)
+    else:
+      self.residual[rows] -= delta
+    self.values[name][:] = values
@@ -29,6 +29,7 @@ from perf.metrics import calculate_rmse, calculate_avg_ndcg
 from util.avg_model import compute_avg_user, compute_avg_model 
 from util.bias import BiasModel
 from util.scaling import fit_scaler, fit_scaler_by_query, scale_features
+from util.splits import load_split
 
 
 _C = 0.01
@@ -194,9 +195,7 @@ def predict():
     print 'Reading data'
     reviews = load(open('%s/reviews-%d.pkl' % (_PKL_DIR, i), 'r'))
     users = load(open('%s/users-%d.pkl' % (_PKL_DIR, i), 'r'))
-    train = load(open('%s/train-%d.pkl' % (_PKL_DIR, i), 'r'))
-    test = load(open('%s/test-%d.pkl' % (_PKL_DIR, i), 'r'))
-    val = load(open('%s/validation-%d.pkl' % (_PKL_DIR, i), 'r'))
+    train, val, test = load_split(i, _PKL_DIR)
     sim = load(open('%s/sim-%d.pkl' % (_PKL_DIR, i), 'r'))
     conn = load(open('%s/conn-%d.pkl' % (_PKL_DIR, i), 'r'))
    
@@ -15,6 +15,7 @@ from pickle import load
 
 from algo.const import NUM_SETS, RANK_SIZE
 from perf.metrics import calculate_rmse, calculate_avg_ndcg
+from util.splits import load_split
 
 
 _PREDICTORS = ['om', 'rm', 'am', 'vm']
@@ -198,8 +199,7 @@ def main():
   load_args()
 
   for i in xrange(NUM_SETS):
-    train = load(open('%s/train-%d.pkl' % (_PKL_DIR, i), 'r'))
-    test = load(open('%s/test-%d.pkl' % (_PKL_DIR, i), 'r'))
+    train, _, test = load_split(i, _PKL_DIR)
     reviews = load(open('%s/reviews-%d.pkl'% (_PKL_DIR, i), 'r'))
     predictor = fit_predictor(train)
     pred = [predictor(v) for v in train]
@@ -31,6 +31,7 @@ from pickle import load
 
 from algo.const import NUM_SETS, RANK_SIZE, REP 
 from perf.metrics import calculate_rmse, calculate_avg_ndcg
+from util.splits import load_split
 
 
 _K = 5
@@ -168,6 +169,7 @@ class MF_Model(object):
         Returns:
           None. Instance fields are updated.
     """
+    votes = votes[:] # shallow
     self._initialize_matrices(votes)
     if _BIAS:
       self._calculate_bias(votes)
@@ -255,9 +257,7 @@ def main():
   
   for i in xrange(NUM_SETS):
     print 'Reading pickles'
-    train = load(open('%s/train-%d.pkl' % (_PKL_DIR, i), 'r'))
-    val = load(open('%s/validation-%d.pkl' % (_PKL_DIR, i), 'r'))
-    test = load(open('%s/test-%d.pkl' % (_PKL_DIR, i), 'r'))
+    train, val, test = load_split(i, _PKL_DIR)
     reviews = load(open('%s/reviews-%d.pkl' % (_PKL_DIR, i), 'r'))
     truth = [v['vote'] for v in train]
     
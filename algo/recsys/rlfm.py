@@ -28,6 +28,7 @@ from algo.const import NUM_SETS, RANK_SIZE, REP, REVIEW_FEATS, \
 from perf.metrics import calculate_rmse, calculate_avg_ndcg
 from util.avg_model import compute_avg_user, compute_avg_model
 from util.scaling import fit_scaler, scale_features 
+from util.splits import load_split
 
 
 _K = 5
@@ -280,9 +281,7 @@ def main():
     print 'Reading data'
     reviews = load(open('%s/reviews-%d.pkl' % (_PKL_DIR, i), 'r'))
     users = load(open('%s/users-%d.pkl' % (_PKL_DIR, i), 'r'))
-    train = load(open('%s/train-%d.pkl' % (_PKL_DIR, i), 'r'))
-    test = load(open('%s/test-%d.pkl' % (_PKL_DIR, i), 'r'))
-    val = load(open('%s/validation-%d.pkl' % (_PKL_DIR, i), 'r'))
+    train, val, test = load_split(i, _PKL_DIR)
     sim = load(open('%s/sim-%d.pkl' % (_PKL_DIR, i), 'r'))
     conn = load(open('%s/conn-%d.pkl' % (_PKL_DIR, i), 'r'))
     
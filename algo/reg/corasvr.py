@@ -36,6 +36,7 @@ from util.avg_model import compute_avg_user, compute_avg_model
 from util.aux import sigmoid, sigmoid_der1
 from util.bias import BiasModel
 from util.scaling import fit_scaler, fit_scaler_by_query, scale_features
+from util.splits import load_split
 
 
 _ITER = 1000000 # number of iterations of stochastic gradient descent
@@ -290,9 +291,7 @@ def main():
   for i in xrange(NUM_SETS):
     t = time()
     print 'Reading pickles'
-    train = load(open('%s/train-%d.pkl' % (_PKL_DIR, i), 'r'))
-    val = load(open('%s/validation-%d.pkl' % (_PKL_DIR, i), 'r'))
-    test = load(open('%s/test-%d.pkl' % (_PKL_DIR, i), 'r'))
+    train, val, test = load_split(i, _PKL_DIR)
     reviews = load(open('%s/new-reviews-%d.pkl' % (_PKL_DIR, i), 'r'))
     users = load(open('%s/users-%d.pkl' % (_PKL_DIR, i), 'r'))
     sim = load(open('%s/new-sim-%d.pkl' % (_PKL_DIR, i), 'r'))
@@ -1,66 +1,207 @@
 """ SentiWordNet Module
     -------------------
-    
+
     Contains a simplified sentiwordnet wrapper which uses the first
   meaning of a word under a given tag.
-  
+
+    The raw data file is compiled once into a binary lexicon, an array of
+  sorted "word<TAB>tag" keys with positive and negative scores, which is
+  memory mapped on the first lookup and shared by forked processes. The size
+  and modification time of the raw data file are kept next to the lexicon,
+  which is compiled again when they change.
+
     This module is used by other modules and should not be directly called.
 """
 
+from os import makedirs
+from os.path import isfile, isdir, dirname, getsize, getmtime
+
+from numpy import array, load, save, searchsorted, zeros
+
 FILE = 'lib/sentiment/SentiWordNet_3.0.0.txt' # default
+COMPILED_FILE = 'out/pkl/sentiwordnet.npy' # default
+_SOURCE_SUFFIX = '.source' # of the file with the stamp of the raw data file
+
+
+def parse_sentiwordnet(input_file=FILE):
+  """ Parses the data file, creating a dictionary indexed firstly by word,
+      secondly by tag and lastly by 'pos_score' and 'neg_score', having polarity
+      float scores as highest order values.
+
+      Args:
+        input_file: The file containing SentiWordNet data.
+
+      Returns:
+        The dictionary of scores.
+  """
+  sentiment = {}
+  with open(input_file) as swnfile:
+    line = swnfile.readline()
+    while (line[0] == '#'):
+      line = swnfile.readline()
+    while line:
+      if line[0] == '\t':
+        line = swnfile.readline()
+        continue
+      tag, _, pos, neg, words_raw, _ = line.split('\t')
+      try:
+        pos, neg = float(pos), float(neg)
+      except:
+        print line
+      words = [w.split('#')[0] for w in words_raw.split(' ') if w.split('#')[1] == '1']
+      for word in words:
+        if word not in sentiment:
+          sentiment[word] = {}
+        sentiment[word][tag] = {'pos_score': pos, 'neg_score': neg}
+      line = swnfile.readline()
+  return sentiment
+
+
+def get_key(word, tag):
+  """ Gets the lexicon key of a word under a tag.
+
+      Args:
+        word: the string with the word.
+        tag: the tag of the word.
+
+      Returns:
+        A byte string with the key.
+  """
+  if isinstance(word, unicode):
+    word = word.encode('utf-8')
+  return '%s\t%s' % (word, tag)
+
+
+def get_source_stamp(input_file=FILE):
+  """ Gets the stamp of a SentiWordNet data file, identifying its contents.
+
+      Args:
+        input_file: The file containing SentiWordNet data.
+
+      Returns:
+        A string with the size and the modification time of the file.
+  """
+  return '%d %r' % (getsize(input_file), getmtime(input_file))
+
+
+def compile_lexicon(input_file=FILE, output_file=COMPILED_FILE):
+  """ Compiles SentiWordNet data file into a binary lexicon, a structured array
+      sorted by key, along with the stamp of the data file. This is performed
+      only once for each version of the data file.
+
+      Args:
+        input_file: The file containing SentiWordNet data.
+        output_file: the path of the compiled lexicon.
+
+      Returns:
+        None. The files are written.
+  """
+  sentiment = parse_sentiwordnet(input_file)
+  entries = sorted((get_key(word, tag), sentiment[word][tag]['pos_score'],
+      sentiment[word][tag]['neg_score']) for word in sentiment for tag in
+      sentiment[word])
+  width = max(len(key) for key, _, _ in entries)
+  lexicon = array(entries, dtype=[('key', 'S%d' % width), ('pos', 'f8'),
+      ('neg', 'f8')])
+  if dirname(output_file) and not isdir(dirname(output_file)):
+    makedirs(dirname(output_file))
+  save(output_file, lexicon)
+  with open(output_file + _SOURCE_SUFFIX, 'w') as f:
+    f.write(get_source_stamp(input_file))
+
 
 class SimplifiedSentiWordNet(object):
   """ Simplified SentiWordNet wrapper. It is simplified because it considers the first meaning for a word under a given tag.
-  
+
       Args:
         self: the SimplifiedSentiWordNet wrapper object.
         input_file: The file containing SentiWordNet data.
+        compiled_file: The file containing the compiled lexicon, created from
+      input_file if it does not exist or input_file has changed.
   """
-  def __init__(self, input_file=FILE):
-    self._parse(input_file)
+  def __init__(self, input_file=FILE, compiled_file=COMPILED_FILE):
+    self.input_file = input_file
+    self.compiled_file = compiled_file
+    self.keys = None
+    self.pos = None
+    self.neg = None
+
+  """ Memory maps the compiled lexicon, compiling it before if it is missing
+      or was compiled from another version of the data file, when present.
+      Nothing is done if the lexicon is already loaded.
 
-  """ Parses the data file, creating a readily available dictionary
-      indexed firstly by word, secondly by tag and lastly by 'pos'
-      and 'neg', having polarity float scores as highest order values.
-      
       Args:
         self: the SimplifiedSentiWordNet wrapper object.
-        input_file: The file containing SentiWordNet data.
-      
+
       Returns:
         None.
   """
-  def _parse(self, input_file):
-    self.sentiment = {}
-    with open(input_file) as swnfile:
-      line = swnfile.readline()
-      while (line[0] == '#'):
-        line = swnfile.readline()
-      while line:
-        if line[0] == '\t':
-          line = swnfile.readline()
-          continue
-        tag, _, pos, neg, words_raw, _ = line.split('\t')
-        try:
-          pos, neg = float(pos), float(neg)
-        except:
-          print line
-        words = [w.split('#')[0] for w in words_raw.split(' ') if w.split('#')[1] == '1']
-        for word in words:
-          if word not in self.sentiment:
-            self.sentiment[word] = {}
-          self.sentiment[word][tag] = {'pos_score': pos, 'neg_score': neg}
-        line = swnfile.readline()
-  
+  def load(self):
+    if self.keys is not None:
+      return
+    stamp_file = self.compiled_file + _SOURCE_SUFFIX
+    stamp = None
+    if isfile(self.compiled_file) and isfile(stamp_file):
+      with open(stamp_file) as f:
+        stamp = f.read()
+    if stamp is None or (isfile(self.input_file) and stamp !=
+        get_source_stamp(self.input_file)):
+      compile_lexicon(self.input_file, self.compiled_file)
+    lexicon = load(self.compiled_file, mmap_mode='r')
+    self.keys = lexicon['key']
+    self.pos = lexicon['pos']
+    self.neg = lexicon['neg']
+
+  """ Finds the positions of keys in the lexicon.
+
+      Args:
+        self: the SimplifiedSentiWordNet wrapper object.
+        keys: a non-empty list of byte string keys.
+
+      Returns:
+        A pair with the array of positions and the boolean array indicating which
+      keys were found.
+  """
+  def _find(self, keys):
+    self.load()
+    width = self.keys.dtype.itemsize
+    fits = array([len(key) <= width for key in keys], dtype=bool)
+    keys = array(keys, dtype=self.keys.dtype) # longer keys are truncated
+    idx = searchsorted(self.keys, keys)
+    idx[idx == len(self.keys)] = 0
+    found = (self.keys[idx] == keys) & fits
+    return idx, found
+
   """ Looks up the positive and negative scores of a word classified as certain tag.
-  
+
       Args:
         word: the string with the word whose polarity is desirable.
         tag: the classified tag of the word.
-      
+
       Returns:
         A dictionary with keys 'pos' and 'neg' containing the positive and negative scores of the word. If the word is not in SentiWordNet, then None is returned.
   """
   def scores(self, word, tag):
-    return self.sentiment[word][tag] if word in self.sentiment and \
-        tag in self.sentiment[word] else None
+    pos, neg, found = self.scores_array([word], [tag])
+    return {'pos_score': pos[0], 'neg_score': neg[0]} if found[0] else None
+
+  """ Looks up the positive and negative scores of many words at once.
+
+      Args:
+        words: a sequence of strings with the words.
+        tags: a sequence with the classified tag of each word.
+
+      Returns:
+        A triple with the arrays of positive scores, of negative scores and of
+      booleans indicating which words are in SentiWordNet. Scores of missing
+      words are zero.
+  """
+  def scores_array(self, words, tags):
+    keys = [get_key(word, tag) for word, tag in zip(words, tags)]
+    pos, neg = zeros(len(keys)), zeros(len(keys))
+    if not keys:
+      return pos, neg, zeros(0, dtype=bool)
+    idx, found = self._find(keys)
+    pos[found] = self.pos[idx[found]]
+    neg[found] = self.neg[idx[found]]
+    return pos, neg, found
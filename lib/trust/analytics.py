@@ -0,0 +1,257 @@
+""" Trust Analytics Module
+    ----------------------
+
+    Contains node statistics of the trust network (pagerank, eigenvector
+  centrality, in-degree and out-degree) as numpy arrays over interned node
+  ids. They are computed by sparse power iteration, reproducing networkx
+  definitions, and cached in a file keyed by the fingerprint of the pickled
+  trust network and by the version of the class, whose previous values warm
+  start a new computation.
+
+    This module is used by other modules and should not be directly called.
+"""
+
+from hashlib import md5
+from os.path import isfile
+from pickle import load, dump, HIGHEST_PROTOCOL
+
+from networkx import NetworkXError
+from numpy import array, ones, zeros, abs as np_abs, nan, float64, int32
+from numpy.linalg import norm
+from scipy.sparse import csr_matrix
+
+ALPHA = 0.85
+MAX_ITER = 100
+TOL = 1e-06
+
+
+def get_fingerprint(path):
+  """ Gets the fingerprint of a file.
+
+      Args:
+        path: the path of the file.
+
+      Returns:
+        A string with the hexadecimal MD5 digest of the file contents.
+  """
+  digest = md5()
+  with open(path, 'rb') as f:
+    for block in iter(lambda: f.read(1 << 20), ''):
+      digest.update(block)
+  return digest.hexdigest()
+
+
+def get_adjacency(trusts, nodes, index):
+  """ Gets the sparse adjacency matrix of the trust network.
+
+      Args:
+        trusts: nx.DiGraph object with trust network.
+        nodes: a list of nodes, defining the matrix order.
+        index: a dictionary from node to its position in nodes.
+
+      Returns:
+        A CSR matrix with a one in row u and column v for each edge (u, v).
+  """
+  rows = []
+  cols = []
+  for node in nodes:
+    for nbr in trusts.successors_iter(node):
+      rows.append(index[node])
+      cols.append(index[nbr])
+  return csr_matrix((ones(len(rows)), (array(rows, dtype=int32), array(cols,
+      dtype=int32))), shape=(len(nodes), len(nodes)))
+
+
+def calculate_pagerank(adjacency, out_degree, nstart=None, alpha=ALPHA,
+    max_iter=MAX_ITER, tol=TOL):
+  """ Calculates pagerank by power iteration as networkx.pagerank, with uniform
+      personalization and dangling weights.
+
+      Args:
+        adjacency: a CSR adjacency matrix.
+        out_degree: an array with the out-degree of each node.
+        nstart: an optional array with the starting vector.
+        alpha: the damping factor.
+        max_iter: the maximum number of iterations.
+        tol: the error tolerance by node.
+
+      Returns:
+        An array with the pagerank of each node.
+  """
+  num_nodes = adjacency.shape[0]
+  x = ones(num_nodes) / num_nodes if nstart is None else nstart / nstart.sum()
+  dangling = out_degree == 0
+  inv_degree = zeros(num_nodes)
+  inv_degree[~dangling] = 1.0 / out_degree[~dangling]
+  transposed = adjacency.T.tocsr()
+  for _ in xrange(max_iter):
+    xlast = x
+    danglesum = alpha * xlast[dangling].sum()
+    x = alpha * transposed.dot(xlast * inv_degree) + \
+        (danglesum + 1.0 - alpha) / num_nodes
+    if np_abs(x - xlast).sum() < num_nodes * tol:
+      return x
+  raise NetworkXError('pagerank: power iteration failed to converge '
+      'in %d iterations.' % max_iter)
+
+
+def calculate_eigenvector(adjacency, nstart=None, max_iter=MAX_ITER, tol=TOL):
+  """ Calculates eigenvector centrality by power iteration over incoming edges
+      as networkx.eigenvector_centrality.
+
+      Args:
+        adjacency: a CSR adjacency matrix.
+        nstart: an optional array with the starting vector.
+        max_iter: the maximum number of iterations.
+        tol: the error tolerance by node.
+
+      Returns:
+        An array with the eigenvector centrality of each node.
+  """
+  num_nodes = adjacency.shape[0]
+  x = ones(num_nodes) / num_nodes if nstart is None else nstart / nstart.sum()
+  transposed = adjacency.T.tocsr()
+  for _ in xrange(max_iter):
+    xlast = x
+    x = transposed.dot(xlast)
+    length = norm(x)
+    x = x / length if length else x
+    if np_abs(x - xlast).sum() < num_nodes * tol:
+      return x
+  raise NetworkXError('eigenvector_centrality(): power iteration failed to '
+      'converge in %d iterations.' % max_iter)
+
+
+class TrustAnalytics(object):
+  """ Node statistics and CSR adjacency matrix of the trust network over
+      interned node ids.
+
+      Args:
+        self: the TrustAnalytics object.
+        trusts: nx.DiGraph object with trust network.
+        fingerprint: an optional fingerprint identifying the network.
+        warm_start: an optional TrustAnalytics object of a previous network,
+      whose values are used as starting vectors.
+  """
+
+  VERSION = 2 # of the attributes, to be increased when they change
+
+  def __init__(self, trusts, fingerprint=None, warm_start=None):
+    self.version = self.VERSION
+    self.fingerprint = fingerprint
+    self.nodes = trusts.nodes()
+    self.index = {node: i for i, node in enumerate(self.nodes)}
+    self.adjacency = adjacency = get_adjacency(trusts, self.nodes, self.index)
+    self.in_degree = array(adjacency.sum(axis=0)).ravel().astype(int32)
+    self.out_degree = array(adjacency.sum(axis=1)).ravel().astype(int32)
+    self.pagerank = None
+    self.eigenvector = None
+    if not self.nodes:
+      return
+    pr_start = eigen_start = None
+    if warm_start is not None:
+      pr_start = warm_start.get_array('pagerank', self.nodes)
+      eigen_start = warm_start.get_array('eigenvector', self.nodes)
+    self.pagerank = calculate_pagerank(adjacency, self.out_degree, pr_start)
+    try:
+      self.eigenvector = calculate_eigenvector(adjacency, eigen_start)
+    except NetworkXError:
+      self.eigenvector = None # not every network converges
+
+  def __contains__(self, node):
+    """ Checks whether a node is in the trust network.
+
+        Args:
+          self: the TrustAnalytics object.
+          node: the node id.
+
+        Returns:
+          True if the node is in the network and False otherwise.
+    """
+    return node in self.index
+
+  def get_value(self, feature, node, default=nan):
+    """ Gets a statistic of a node.
+
+        Args:
+          self: the TrustAnalytics object.
+          feature: one of "pagerank", "eigenvector", "in_degree" and
+        "out_degree".
+          node: the node id.
+          default: the value returned for nodes out of the network.
+
+        Returns:
+          The value of the statistic.
+    """
+    values = getattr(self, feature)
+    if node not in self.index or values is None:
+      return default
+    return values[self.index[node]].item()
+
+  def get_user_adjacency(self, u_ids):
+    """ Gets the adjacency matrix restricted to a list of users, some of which
+        may be out of the network.
+
+        Args:
+          self: the TrustAnalytics object.
+          u_ids: a list of user ids, defining the matrix order.
+
+        Returns:
+          A CSR matrix with a one in row i and column j if the i-th user trusts
+        the j-th user.
+    """
+    rows = [i for i, u_id in enumerate(u_ids) if u_id in self.index]
+    cols = [self.index[u_ids[i]] for i in rows]
+    selection = csr_matrix((ones(len(rows)), (array(rows, dtype=int32),
+        array(cols, dtype=int32))), shape=(len(u_ids), len(self.nodes)))
+    return selection.dot(self.adjacency).dot(selection.T).tocsr()
+
+  def get_array(self, feature, nodes):
+    """ Gets a statistic of many nodes as a starting vector, filling nodes out
+        of the network with the mean value.
+
+        Args:
+          self: the TrustAnalytics object.
+          feature: "pagerank" or "eigenvector".
+          nodes: a list of node ids.
+
+        Returns:
+          An array with the values of the nodes or None if the statistic is not
+        available.
+    """
+    values = getattr(self, feature)
+    if values is None or not len(values):
+      return None
+    fill = values.mean()
+    result = array([values[self.index[node]] if node in self.index else fill
+        for node in nodes], dtype=float64)
+    return result if result.sum() > 0 else None
+
+
+def load_trust_analytics(trusts, trusts_file, cache_file):
+  """ Loads the trust analytics from the cache file if it was computed for the
+      same pickled network by the same version of TrustAnalytics, computing
+      and caching it otherwise. Cached analytics of another version are not
+      used as warm start either.
+
+      Args:
+        trusts: nx.DiGraph object with trust network.
+        trusts_file: the path of the pickled trust network.
+        cache_file: the path of the analytics cache.
+
+      Returns:
+        A TrustAnalytics object.
+  """
+  fingerprint = get_fingerprint(trusts_file)
+  previous = None
+  if isfile(cache_file):
+    with open(cache_file, 'rb') as f:
+      previous = load(f)
+    if getattr(previous, 'version', None) != TrustAnalytics.VERSION:
+      previous = None
+    elif previous.fingerprint == fingerprint:
+      return previous
+  analytics = TrustAnalytics(trusts, fingerprint, previous)
+  with open(cache_file, 'wb') as f:
+    dump(analytics, f, HIGHEST_PROTOCOL)
+  return analytics
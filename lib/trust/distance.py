@@ -0,0 +1,243 @@
+""" Graph Distance Module
+    ---------------------
+
+    Contains a distance service over the CSR adjacency of the trust network.
+  Pair distances are found by bidirectional breadth-first search bounded by a
+  number of hops, and closeness centrality (as networkx, over outgoing
+  distances) is estimated from breadth-first searches of sampled pivots, with
+  confidence bounds. An exact mode, running a full search by source, is kept
+  for validation. Results are cached by node and pair, being reused across
+  splits of the same network.
+
+    This module is used by other modules and should not be directly called.
+"""
+
+from math import log, sqrt
+
+from numpy import isfinite, nan, float32, float64
+from numpy.random import RandomState
+from scipy.sparse.csgraph import shortest_path
+
+MAX_HOPS = 6
+NUM_PIVOTS = 100
+CONFIDENCE = 0.95
+
+
+def get_bidirectional_distance(successors, predecessors, source, target,
+    max_hops):
+  """ Gets the distance between two nodes by bidirectional breadth-first search,
+      expanding a level of the smaller frontier at a time.
+
+      Args:
+        successors: a CSR adjacency matrix, whose rows are outgoing edges.
+        predecessors: the transpose of successors, in CSR format.
+        source: the index of the source node.
+        target: the index of the target node.
+        max_hops: the maximum distance searched.
+
+      Returns:
+        An integer with the length of the shortest path from source to target,
+      or None if it is longer than max_hops or there is no path.
+  """
+  if source == target:
+    return 0
+  forward, backward = {source: 0}, {target: 0}
+  f_front, b_front = [source], [target]
+  f_depth = b_depth = 0
+  while f_front and b_front and f_depth + b_depth < max_hops:
+    if len(f_front) <= len(b_front):
+      matrix, front, seen, other = successors, f_front, forward, backward
+      f_depth = depth = f_depth + 1
+    else:
+      matrix, front, seen, other = predecessors, b_front, backward, forward
+      b_depth = depth = b_depth + 1
+    new_front = []
+    for node in front:
+      for nbr in matrix.indices[matrix.indptr[node]:
+          matrix.indptr[node+1]].tolist():
+        if nbr in other:
+          return depth + other[nbr]
+        if nbr not in seen:
+          seen[nbr] = depth
+          new_front.append(nbr)
+    if matrix is successors:
+      f_front = new_front
+    else:
+      b_front = new_front
+  return None
+
+
+class GraphDistance(object):
+  """ Distance service of the trust network.
+
+      Args:
+        self: the GraphDistance object.
+        analytics: a TrustAnalytics object of the trust network.
+        exact: whether distances and closeness are computed by full searches
+      from each source, as networkx, instead of bounded and sampled searches.
+        max_hops: the maximum distance searched between pairs, if not exact.
+        num_pivots: the number of sampled pivots estimating closeness, if not
+      exact.
+        seed: the seed of the pivots sampling.
+  """
+
+  def __init__(self, analytics, exact=False, max_hops=MAX_HOPS,
+      num_pivots=NUM_PIVOTS, seed=None):
+    self.analytics = analytics
+    self.exact = exact
+    self.max_hops = max_hops
+    self.num_pivots = min(num_pivots, len(analytics.nodes))
+    self.seed = seed
+    self.successors = analytics.adjacency
+    self.predecessors = analytics.adjacency.T.tocsr()
+    self.pivots = None
+    self.pivot_distances = None
+    self.rows = {}
+    self.distances = {}
+    self.closeness_values = {}
+
+  def _get_row(self, index):
+    """ Gets the distances from a node to every node by a full search, cached
+        by node.
+
+        Args:
+          self: the GraphDistance object.
+          index: the index of the source node.
+
+        Returns:
+          An array of distances, infinite for unreachable nodes.
+    """
+    if index not in self.rows:
+      self.rows[index] = shortest_path(self.successors, unweighted=True,
+          indices=index).astype(float32)
+    return self.rows[index]
+
+  def _load_pivots(self):
+    """ Samples pivots and computes the distances from every node to them, by
+        searches from the pivots over incoming edges. Nothing is done if the
+        pivots are already loaded.
+
+        Args:
+          self: the GraphDistance object.
+
+        Returns:
+          None.
+    """
+    if self.pivots is not None:
+      return
+    state = RandomState(self.seed)
+    self.pivots = state.choice(len(self.analytics.nodes), self.num_pivots,
+        replace=False)
+    self.pivot_distances = shortest_path(self.predecessors, unweighted=True,
+        indices=self.pivots).astype(float32)
+
+  def distance(self, source, target):
+    """ Gets the distance from source to target.
+
+        Args:
+          self: the GraphDistance object.
+          source: the id of the source user.
+          target: the id of the target user.
+
+        Returns:
+          An integer with the length of the shortest path, or None if there is
+        no path (or it is longer than the maximum hops if not exact) or any
+        user is out of the network.
+    """
+    index = self.analytics.index
+    if source not in index or target not in index:
+      return None
+    if (source, target) not in self.distances:
+      if self.exact:
+        value = self._get_row(index[source])[index[target]]
+        value = int(value) if isfinite(value) else None
+      else:
+        value = get_bidirectional_distance(self.successors, self.predecessors,
+            index[source], index[target], self.max_hops)
+      self.distances[(source, target)] = value
+    return self.distances[(source, target)]
+
+  def _get_pivot_stats(self, index):
+    """ Gets the statistics of distances from a node to the pivots other than
+        itself.
+
+        Args:
+          self: the GraphDistance object.
+          index: the index of the node.
+
+        Returns:
+          A triple with the number of other pivots, the fraction of them which
+        are reachable and the mean distance to reachable ones (nan if none).
+    """
+    self._load_pivots()
+    column = self.pivot_distances[self.pivots != index, index]
+    reachable = column[isfinite(column)]
+    fraction = float(len(reachable)) / len(column) if len(column) else 0.0
+    mean = reachable.mean().item() if len(reachable) else nan
+    return len(column), fraction, mean
+
+  def closeness(self, node):
+    """ Gets the closeness centrality of a node, as networkx: the number of
+        reachable nodes over the sum of their distances, scaled by the
+        fraction of nodes which are reachable. If not exact, both the fraction
+        and the mean distance are estimated over the pivots.
+
+        Args:
+          self: the GraphDistance object.
+          node: the id of the user.
+
+        Returns:
+          A float with the closeness centrality, nan if the user is out of the
+        network.
+    """
+    if node not in self.analytics.index:
+      return nan
+    if node not in self.closeness_values:
+      index = self.analytics.index[node]
+      num_nodes = len(self.analytics.nodes)
+      if self.exact:
+        row = self._get_row(index)
+        reachable = row[isfinite(row)]
+        total = reachable.sum(dtype=float64).item()
+        num_reachable = len(reachable) - 1.0
+        value = (num_reachable / total) * (num_reachable / (num_nodes - 1)) \
+            if total > 0 and num_nodes > 1 else 0.0
+      else:
+        _, fraction, mean = self._get_pivot_stats(index)
+        value = fraction / mean if fraction > 0 else 0.0
+      self.closeness_values[node] = value
+    return self.closeness_values[node]
+
+  def closeness_interval(self, node, confidence=CONFIDENCE):
+    """ Gets bounds of the closeness centrality of a node estimated by pivots.
+        Hoeffding bounds of the reachable fraction and of the mean distance,
+        whose range is taken as the largest distance to pivots, are combined.
+
+        Args:
+          self: the GraphDistance object.
+          node: the id of the user.
+          confidence: the confidence level of the bounds.
+
+        Returns:
+          A pair with the lower and upper bounds, both nan if the user is out of
+        the network. Exact values have equal bounds.
+    """
+    if node not in self.analytics.index:
+      return nan, nan
+    if self.exact:
+      value = self.closeness(node)
+      return value, value
+    num_pivots, fraction, mean = self._get_pivot_stats(
+        self.analytics.index[node])
+    if not num_pivots:
+      return 0.0, 1.0
+    log_term = log(4.0 / (1.0 - confidence))
+    fraction_err = sqrt(log_term / (2.0 * num_pivots))
+    if fraction == 0:
+      return 0.0, min(1.0, fraction_err)
+    finite = self.pivot_distances[isfinite(self.pivot_distances)]
+    mean_err = finite.max().item() * sqrt(log_term / (2.0 * fraction *
+        num_pivots))
+    lower = max(0.0, fraction - fraction_err) / (mean + mean_err)
+    upper = min(1.0, fraction + fraction_err) / max(1.0, mean - mean_err)
+    return lower, min(1.0, upper)
@@ -0,0 +1,215 @@
+""" Katz Index Module
+    -----------------
+
+    Contains a Katz index of the trust network computed only for requested
+  pairs of source and target users, by the truncated power series
+  sum_{k>=1} beta^k A^k, evaluated with sparse products over blocks of
+  sources. Only the entries of requested pairs are kept, as sorted numpy arrays
+  of pair keys and values, which are looked up by binary search and shared by
+  forked processes without copies. Computed entries are kept in a small file
+  cache, bounded in size and keyed by the fingerprint of the network and by the
+  series parameters.
+
+    This module is used by other modules and should not be directly called.
+"""
+
+from os import makedirs
+from os.path import isfile, isdir, dirname
+from pickle import load, dump, HIGHEST_PROTOCOL
+
+from numpy import array, ones, arange, zeros, unique, concatenate, \
+    searchsorted, setdiff1d, argsort, int32, int64, float64
+from scipy.sparse import csr_matrix
+
+BETA = 0.005
+MAX_LENGTH = 20
+TOL = 1e-12
+BLOCK_SIZE = 500
+MAX_CACHED = 1 << 21 # entries of the file cache, of 16 bytes each
+
+
+class KatzIndex(object):
+  """ Katz index of the trust network over requested pairs of users.
+
+      Args:
+        self: the KatzIndex object.
+        analytics: a TrustAnalytics object of the trust network.
+        beta: the attenuation factor of paths.
+        max_length: the maximum length of paths (number of terms of the series).
+        tol: the series stops when the largest new term of a block of rows is
+      below this tolerance.
+        cache_file: an optional path of the entries cache.
+        max_cached: the maximum number of entries written to the cache file.
+  """
+
+  def __init__(self, analytics, beta=BETA, max_length=MAX_LENGTH, tol=TOL,
+      cache_file=None, max_cached=MAX_CACHED):
+    self.analytics = analytics
+    self.beta = beta
+    self.max_length = max_length
+    self.tol = tol
+    self.cache_file = cache_file
+    self.max_cached = max_cached
+    self.key = (analytics.fingerprint, beta, max_length, tol)
+    self.keys = zeros(0, dtype=int64)
+    self.values = zeros(0, dtype=float64)
+    if cache_file and isfile(cache_file) and self.key[0] is not None:
+      with open(cache_file, 'rb') as f:
+        cache = load(f)
+      if cache.get('key') == self.key and 'keys' in cache: # not old rows
+        self.keys, self.values = cache['keys'], cache['values']
+    self.cached_keys = self.keys
+
+  def get_keys(self, sources, targets):
+    """ Gets the keys of pairs of node positions, ordered by source and then by
+        target.
+
+        Args:
+          self: the KatzIndex object.
+          sources: an int array with the node positions of sources.
+          targets: an int array with the node positions of targets.
+
+        Returns:
+          An int64 array with the key of each pair.
+    """
+    return sources.astype(int64) * len(self.analytics.nodes) + targets
+
+  def find(self, keys):
+    """ Finds keys amongst the computed entries.
+
+        Args:
+          self: the KatzIndex object.
+          keys: an int64 array of pair keys.
+
+        Returns:
+          A pair with the array of positions of keys in the entries and the
+        boolean array indicating which keys were found.
+    """
+    pos = searchsorted(self.keys, keys)
+    found = pos < len(self.keys)
+    found[found] = self.keys[pos[found]] == keys[found]
+    return pos, found
+
+  def compute_block(self, block):
+    """ Computes the Katz rows of a block of sources.
+
+        Args:
+          self: the KatzIndex object.
+          block: an int array with the node positions of sources.
+
+        Returns:
+          A CSR matrix with a row for each source and a column for each node.
+    """
+    adjacency = self.analytics.adjacency
+    num_nodes = adjacency.shape[0]
+    walks = csr_matrix((ones(len(block)), (arange(len(block)), block)),
+        shape=(len(block), num_nodes))
+    katz = csr_matrix((len(block), num_nodes))
+    for _ in xrange(self.max_length):
+      walks = self.beta * walks.dot(adjacency)
+      katz = katz + walks
+      if not walks.nnz or abs(walks.data).max() < self.tol:
+        break
+    return katz.tocsr()
+
+  def compute_pairs(self, pairs, block_size=BLOCK_SIZE):
+    """ Computes the Katz index of pairs which are in the network and not yet
+        computed. The rows of a block of sources are computed at once, of which
+        only the entries of requested targets are kept.
+
+        Args:
+          self: the KatzIndex object.
+          pairs: an iterable of (source id, target id) pairs.
+          block_size: the number of rows computed at once.
+
+        Returns:
+          None. The entries are stored in the object.
+    """
+    index = self.analytics.index
+    pairs = [(index[s], index[t]) for s, t in pairs if s in index and t in
+        index]
+    if not pairs:
+      return
+    num_nodes = len(self.analytics.nodes)
+    keys = unique(self.get_keys(array([s for s, _ in pairs], dtype=int64),
+        array([t for _, t in pairs], dtype=int64)))
+    keys = keys[~self.find(keys)[1]]
+    if not len(keys):
+      return
+    sources = unique(keys // num_nodes)
+    values = zeros(len(keys))
+    for start in xrange(0, len(sources), block_size):
+      block = sources[start:start+block_size]
+      begin, end = searchsorted(keys, [block[0] * num_nodes, (block[-1] + 1)
+          * num_nodes])
+      rows = searchsorted(block, keys[begin:end] // num_nodes)
+      katz = self.compute_block(block.astype(int32))
+      values[begin:end] = array(katz[rows, keys[begin:end] % num_nodes]).ravel()
+    keys = concatenate([self.keys, keys])
+    values = concatenate([self.values, values])
+    order = argsort(keys, kind='mergesort')
+    self.keys, self.values = keys[order], values[order]
+
+  def get(self, source, target):
+    """ Gets the Katz index from source to target.
+
+        Args:
+          self: the KatzIndex object.
+          source: the id of the source user.
+          target: the id of the target user, the pair having been computed.
+
+        Returns:
+          A float with the Katz index, zero if there is no path or either user
+        is out of the network.
+    """
+    index = self.analytics.index
+    if source not in index or target not in index:
+      return 0.0
+    key = self.get_keys(array([index[source]]), array([index[target]]))
+    pos, found = self.find(key)
+    if not found[0]:
+      raise KeyError((source, target))
+    return self.values[pos[0]].item()
+
+  def get_array(self, sources, targets):
+    """ Gets the Katz index of many pairs of users in the network at once.
+
+        Args:
+          self: the KatzIndex object.
+          sources: an int array with the node positions of sources.
+          targets: an int array with the node positions of targets, the pairs
+        having been computed.
+
+        Returns:
+          A float array with the Katz index of each pair.
+    """
+    pos, found = self.find(self.get_keys(sources, targets))
+    if not found.all():
+      raise KeyError(zip(sources[~found], targets[~found])[0])
+    return self.values[pos]
+
+  def dump(self):
+    """ Writes the cache file, if any, when entries were computed. The entries
+        computed by this object are kept first, and then previously cached
+        ones, up to the maximum number of cached entries.
+
+        Args:
+          self: the KatzIndex object.
+
+        Returns:
+          None.
+    """
+    if not self.cache_file or self.key[0] is None:
+      return
+    new = setdiff1d(self.keys, self.cached_keys, assume_unique=True)
+    if not len(new):
+      return
+    old = self.cached_keys[:max(0, self.max_cached - len(new))]
+    keys = unique(concatenate([new[:self.max_cached], old]))
+    values = self.values[searchsorted(self.keys, keys)]
+    if dirname(self.cache_file) and not isdir(dirname(self.cache_file)):
+      makedirs(dirname(self.cache_file))
+    with open(self.cache_file, 'wb') as f:
+      dump({'key': self.key, 'keys': keys, 'values': values}, f,
+          HIGHEST_PROTOCOL)
+    self.cached_keys = keys
@@ -0,0 +1,176 @@
+""" WordNet Lemma Index Module
+    --------------------------
+
+    Contains a precompiled index of WordNet lemmas which answers whether a word
+  has any synset, exactly as "wordnet.synsets(word) != []", without loading
+  the WordNet corpus reader. Lemmas are kept in frozen sets per part of speech
+  and the morphological fallback (exception lists and suffix substitutions)
+  is cached by word. The index keeps the version of WordNet it was compiled
+  from, being compiled again if the installed corpus has another version.
+
+    This module is used by other modules and should not be directly called.
+"""
+
+from collections import OrderedDict
+from os import makedirs
+from os.path import isfile, isdir, dirname
+from pickle import load, dump, HIGHEST_PROTOCOL
+from re import search
+
+FILE = 'out/pkl/wordnet-lemmas.pkl' # default
+POS_LIST = ['n', 'v', 'a', 'r'] # same order as wordnet.synsets
+CACHE_SIZE = 100000
+
+
+def get_wordnet_version():
+  """ Gets the version of the installed WordNet corpus from the header of its
+      adjective data file, as the corpus reader does, without loading it.
+
+      Args:
+        None.
+
+      Returns:
+        A string with the version, or None if the corpus is not installed.
+  """
+  from nltk.data import find
+  try:
+    pointer = find('corpora/wordnet/data.adj')
+  except LookupError:
+    return None
+  data_file = pointer.open()
+  try:
+    for line in data_file:
+      match = search(r'WordNet (\d+\.\d+) Copyright', line)
+      if match is not None:
+        return match.group(1)
+  finally:
+    data_file.close()
+  return None
+
+
+def compile_index(output_file=FILE):
+  """ Compiles the lemma index from NLTK WordNet corpus into a binary file.
+      This is performed only once.
+
+      Args:
+        output_file: the path of the compiled index.
+
+      Returns:
+        None. The file is written.
+  """
+  from nltk.corpus import wordnet
+  index = {'version': wordnet.get_version(), 'lemmas': {}, 'exceptions': {},
+      'substitutions': {}}
+  for pos in POS_LIST:
+    index['lemmas'][pos] = sorted(wordnet.all_lemma_names(pos))
+    index['exceptions'][pos] = dict(wordnet._exception_map[pos])
+    index['substitutions'][pos] = list(wordnet.MORPHOLOGICAL_SUBSTITUTIONS[pos])
+  if dirname(output_file) and not isdir(dirname(output_file)):
+    makedirs(dirname(output_file))
+  with open(output_file, 'wb') as f:
+    dump(index, f, HIGHEST_PROTOCOL)
+
+
+class LemmaIndex(object):
+  """ Index of known English lemmas. The index file is loaded on first query
+      and compiled from WordNet if it does not exist or was compiled from
+      another version of WordNet than the installed one.
+
+      Args:
+        self: the LemmaIndex object.
+        input_file: the file containing the compiled index.
+        cache_size: the number of words whose morphological fallback is cached.
+  """
+
+  def __init__(self, input_file=FILE, cache_size=CACHE_SIZE):
+    self.input_file = input_file
+    self.cache_size = cache_size
+    self.lemmas = None
+    self.all_lemmas = None
+    self.exceptions = None
+    self.substitutions = None
+    self._cache = OrderedDict()
+
+  def load(self):
+    """ Loads the compiled index, compiling it before if necessary. Nothing is
+        done if the index is already loaded.
+
+        Args:
+          self: the LemmaIndex object.
+
+        Returns:
+          None.
+    """
+    if self.lemmas is not None:
+      return
+    index = None
+    if isfile(self.input_file):
+      with open(self.input_file, 'rb') as f:
+        index = load(f)
+      version = get_wordnet_version()
+      if version is not None and index.get('version') != version:
+        index = None
+    if index is None:
+      compile_index(self.input_file)
+      with open(self.input_file, 'rb') as f:
+        index = load(f)
+    self.lemmas = {pos: frozenset(index['lemmas'][pos]) for pos in POS_LIST}
+    self.all_lemmas = frozenset().union(*self.lemmas.values())
+    self.exceptions = index['exceptions']
+    self.substitutions = index['substitutions']
+
+  def _morphy(self, form, pos):
+    """ Finds base forms of a word under a part of speech, reproducing WordNet
+        morphy: exception lists first, then suffix substitutions applied
+        repeatedly until a known lemma is found.
+
+        Args:
+          self: the LemmaIndex object.
+          form: the lower case word.
+          pos: a part of speech in POS_LIST.
+
+        Returns:
+          A list with the known base forms, empty if there is none.
+    """
+    lemmas = self.lemmas[pos]
+    substitutions = self.substitutions[pos]
+
+    def apply_rules(forms):
+      return [f[:-len(old)] + new for f in forms for old, new in substitutions
+          if f.endswith(old)]
+
+    def filter_forms(forms):
+      return [f for f in forms if f in lemmas]
+
+    if form in self.exceptions[pos]:
+      return filter_forms([form] + self.exceptions[pos][form])
+    forms = apply_rules([form])
+    results = filter_forms([form] + forms)
+    while forms and not results:
+      forms = apply_rules(forms)
+      results = filter_forms(forms)
+    return results
+
+  def is_known(self, word):
+    """ Checks whether a word has any WordNet synset.
+
+        Args:
+          self: the LemmaIndex object.
+          word: the string with the word.
+
+        Returns:
+          True if the word, or any of its base forms, is a WordNet lemma and
+        False otherwise.
+    """
+    self.load()
+    word = word.lower()
+    if word in self.all_lemmas:
+      return True
+    if word in self._cache:
+      known = self._cache.pop(word)
+    else:
+      known = any(self._morphy(word, pos) for pos in POS_LIST)
+      if len(self._cache) >= self.cache_size:
+        self._cache.popitem(last=False)
+    self._cache[word] = known
+    return known
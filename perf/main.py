@@ -28,6 +28,7 @@ from sklearn.metrics import average_precision_score
 from algo.const import NUM_SETS, CONF_QT, RANK_SIZE, REP
 from perf.metrics import calculate_rmse, calculate_ndcg, calculate_ap, \
     calculate_err
+from util.splits import load_split_set
 
 
 def parse_args():
@@ -70,10 +71,10 @@ def load_data(predictor, set_type, index, rep):
         A float with sample size and a string with predictor name. 
   """
   if set_type == 'val': 
-    votes = load(open('out/pkl/validation-%d.pkl' % index, 'r'))
+    votes = load_split_set('validation', index)
     predfile = open('out/val/%s-%d-%d.dat'% (predictor, index, rep), 'r')
   else:
-    votes = load(open('out/pkl/test-%d.pkl' % index, 'r'))
+    votes = load_split_set('test', index)
     predfile = open('out/test/%s-%d-%d.dat'% (predictor, index, rep), 'r')
   reviews = load(open('out/pkl/reviews-%d.pkl' % index, 'r'))
   pred = [float(line.strip()) for line in predfile]
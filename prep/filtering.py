@@ -0,0 +1,201 @@
+""" Filtering module
+    ----------------
+
+    Filters the raw reviews file in a single streaming pass: invalid reviews
+    and reviews with mostly foreign text are ignored, and the votes of ranking
+    groups (product-voter pairs) with too few elements are removed.
+
+    Usage:
+      $ python -m prep.filtering [-f <foreign_ratio>] [-g <min_group>]
+        [-p <processes>]
+    in project root directory, where
+    <foreign_ratio> is a float with the ratio of foreign words from which a
+      review text is ignored,
+    <min_group> is an integer with the minimum size of a ranking group,
+    <processes> is an integer with the number of processes parsing byte ranges
+      of the raw file in parallel.
+"""
+
+
+from marshal import dump, load
+from re import match
+from sys import argv, exit
+from tempfile import TemporaryFile
+
+from nltk.tokenize import RegexpTokenizer
+
+from lib.wordnet.lemma_index import LemmaIndex
+from prep.parsing import parse_review_line, create_type_ignored, \
+    iter_parsed_lines, print_parsing_summary
+
+
+_FILE = 'data/rating.txt'
+_NEWFILE = 'data/reviews_filtered.txt'
+_FOREIGN_RATIO = 0.4
+_MIN_GROUP = 10
+_NUM_PROCS = 1
+_LEMMAS = LemmaIndex()
+
+
+def load_args():
+  """ Loads arguments.
+
+      Args:
+        None.
+
+      Returns:
+        None. Global variables are updated.
+  """
+  global _FOREIGN_RATIO, _MIN_GROUP, _NUM_PROCS
+  i = 1
+  while i < len(argv):
+    if argv[i] == '-f':
+      _FOREIGN_RATIO = float(argv[i+1])
+    elif argv[i] == '-g':
+      _MIN_GROUP = int(argv[i+1])
+    elif argv[i] == '-p':
+      _NUM_PROCS = int(argv[i+1])
+    else:
+      print ('Usage: $ python -m prep.filtering [-f <foreign_ratio>] '
+          '[-g <min_group>] [-p <processes>]')
+      exit()
+    i = i + 2
+
+
+def get_foreign_ratio(text):
+  """ Get ratio of foreign (or unidentified) words in a text.
+
+      Args:
+        text: a string containing the text.
+
+      Returns:
+        A real value with the ratio of foreign words.
+  """
+  text = text.lower()
+  word_tokenizer = RegexpTokenizer(r'\w+')
+  words = word_tokenizer.tokenize(text)
+  fw = [w for w in words if match('[a-z]+', w) and not _LEMMAS.is_known(w)]
+  if len(words) > 0:  
+    return float(len(fw)) / len(words)
+  else:
+    return 0
+
+
+class CandidateParser(object):
+  """ Callable which validates a raw line and extracts what the filtering
+      needs from it. It is picklable, so it can be sent to worker processes.
+  """
+
+  def __init__(self, foreign_ratio):
+    """ Constructor of the parser.
+
+        Args:
+          foreign_ratio: ratio of foreign words from which a text is invalid.
+
+        Returns:
+          None.
+    """
+    self.foreign_ratio = foreign_ratio
+
+  def is_valid_text(self, text):
+    """ Checks whether a text is mostly written in English.
+
+        Args:
+          text: a string containing the text.
+
+        Returns:
+          True if the ratio of foreign words is below the threshold.
+    """
+    return get_foreign_ratio(text) < self.foreign_ratio
+
+  def __call__(self, line):
+    """ Validates a raw line of the reviews file.
+
+        Args:
+          line: a string with the raw line.
+
+        Returns:
+          A tuple (product, voters, fields), with the product name, the list of
+        counted voters (as in parse_votes) and the list of raw fields of the
+        line. If the line is invalid, an exception is raised with the name of
+        the invalid field.
+    """
+    _, product, _, _, _, _, votes = parse_review_line(line,
+        self.is_valid_text)
+    return product, votes.keys(), line.strip().split('::::')
+
+
+def filter_votes(fields, product, group_size, min_group):
+  """ Removes votes of a review belonging to too small ranking groups.
+
+      Args:
+        fields: list of raw fields of a line of the reviews file.
+        product: the product name of the review.
+        group_size: dictionary from (product, voter) to the group size.
+        min_group: the minimum size of a ranking group.
+
+      Returns:
+        The list of fields with the votes field rewritten, or None if no vote
+      remains.
+  """
+  new_str_votes = [str_vote for str_vote in fields[7].split(':::') if
+      group_size.get((product, str_vote.split(':')[0]), 0) >= min_group]
+  if not new_str_votes:
+    return None
+  new_str_votes.append('</endperson>')
+  fields[7] = ':::'.join(new_str_votes)
+  return fields
+
+
+def filter_reviews(input_file=_FILE, output_file=_NEWFILE,
+    foreign_ratio=_FOREIGN_RATIO, min_group=_MIN_GROUP, num_procs=1):
+  """ Filters the raw reviews file. In one streaming pass, lines are validated,
+      the sizes of ranking groups are counted and valid lines are spilled to a
+      temporary file; then, the spill is rewritten without the votes of small
+      groups. Memory is bounded by the number of (product, voter) keys.
+
+      Args:
+        input_file: path of the raw reviews file.
+        output_file: path of the filtered reviews file.
+        foreign_ratio: ratio of foreign words from which a text is ignored.
+        min_group: the minimum size of a ranking group.
+        num_procs: number of processes parsing the raw file.
+
+      Returns:
+        A dictionary of counters of ignored lines by type.
+  """
+  _LEMMAS.load() # before forking, so workers share the index
+  type_ignored = create_type_ignored()
+  group_size = {}
+  spill = TemporaryFile()
+  lines = iter_parsed_lines(input_file, CandidateParser(foreign_ratio),
+      type_ignored, num_procs)
+  try:
+    for _, (product, voters, fields) in lines:
+      for voter in voters:
+        key = product, voter
+        group_size[key] = group_size.get(key, 0) + 1
+      dump((product, fields), spill)
+  finally:
+    lines.close() # terminates the workers if the loop failed
+
+  spill.seek(0)
+  output = open(output_file, 'w')
+  while True:
+    try:
+      product, fields = load(spill)
+    except EOFError:
+      break
+    fields = filter_votes(fields, product, group_size, min_group)
+    if fields:
+      print >> output, '::::'.join(fields)
+  output.close()
+  spill.close()
+  return type_ignored
+
+
+if __name__ == '__main__':
+  load_args()
+  print_parsing_summary('Filtering', filter_reviews(
+      foreign_ratio=_FOREIGN_RATIO, min_group=_MIN_GROUP,
+      num_procs=_NUM_PROCS))
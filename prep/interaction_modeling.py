@@ -10,19 +10,26 @@
 
 
 from math import log, isnan
-from os.path import isfile
+from multiprocessing import Pool
 
-from numpy import identity, nan
-from numpy.linalg import pinv
-from networkx import adjacency_matrix
-from pickle import load, dump
+from numpy import nan, array, zeros, where, errstate, int32, log as np_log, \
+    sqrt, clip, ones_like, isnan as np_isnan
+from scipy.sparse import csr_matrix
 from scipy.stats import pearsonr
 
+from lib.trust.analytics import TrustAnalytics
+from lib.trust.katz import KatzIndex
+from prep.user_modeling import get_rating_matrix
 from util.aux import cosine, vectorize
 
 
 _BETA = 0.005
-_KATZ_PKL = 'out/pkl/katz.pkl'
+_KATZ_MAX_LENGTH = 20
+_KATZ_TOL = 1e-12
+_KATZ_PKL = 'out/pkl/katz-rows.pkl'
+_BATCH_SIZE = 10000
+_SHARDS_PER_PROC = 4
+_SHARED = {} # read-only state inherited by forked workers
 
 
 def jaccard(set_a, set_b):
@@ -84,28 +91,24 @@ def adamic_adar_trustees(trusts, user_a, user_b):
   return score
 
 
-def get_katz_matrix(trusts):
-  """ Computes Katz matrix. For each pair of uesrs, it is defined as the sum 
-      over simple path lengths of the number of paths with the respective 
-      length times beta. Directed paths are considered.
+def get_katz_index(analytics, pairs):
+  """ Gets the Katz index of the trust network for given pairs of users.
+      The index of each pair of users is the sum over path lengths of the number
+      of directed paths with the respective length times beta to the length,
+      truncated at _KATZ_MAX_LENGTH or when terms fall below _KATZ_TOL.
 
       Args:
-        trusts: networkx DiGraph object with trust network.
+        analytics: a TrustAnalytics object of the trust network.
+        pairs: an iterable with (source id, target id) pairs, of voters and
+      authors.
 
       Returns:
-        A matrix indexed by node ids with katz index of each pair. 
-  """      
-  if isfile(_KATZ_PKL):
-    katz = load(open(_KATZ_PKL, 'r'))
-  else:
-    n = len(trusts.nodes())
-    A = adjacency_matrix(trusts, sorted(trusts.nodes()))
-    katz = pinv(identity(n) - _BETA * A) - identity(n)
-    dump(katz, open(_KATZ_PKL, 'w'))
-  nodes_index = {}
-  for i, node in enumerate(sorted(trusts.nodes())):
-    nodes_index[node] = i
-  return katz, nodes_index
+        A KatzIndex object with the pairs computed.
+  """
+  katz = KatzIndex(analytics, _BETA, _KATZ_MAX_LENGTH, _KATZ_TOL, _KATZ_PKL)
+  katz.compute_pairs(pairs)
+  katz.dump()
+  return katz
 
 
 def calculate_authoring_similarity(author, voter):
@@ -151,12 +154,14 @@ def calculate_authoring_similarity(author, voter):
   return features
 
 
-def calculate_connection_strength(author, voter, trusts, katz, nodes_index):
+def calculate_connection_strength(author, voter, trusts, katz):
   """ Calculates connection strength features between author and voter.
 
       Args:
         author: a dictionary with author containing individual user features.
         voter: a dictionary with voter containing individual user features.
+        trusts: networkx DiGraph object with trust network.
+        katz: a KatzIndex object with the pair of voter and author computed.
       
       Returns:
         A dictionary with features represeting connection strength in trust
@@ -181,74 +186,343 @@ def calculate_connection_strength(author, voter, trusts, katz, nodes_index):
         author['id'], voter['id'])
     features['adamic_adar_trustors'] = adamic_adar_trustors(trusts,
         author['id'], voter['id'])
-    features['katz'] = 0
-    if author['id'] in nodes_index and author['id'] in nodes_index:
-      a_index = nodes_index[author['id']]
-      v_index = nodes_index[voter['id']]
-      features['katz'] = katz[v_index,a_index]
+    features['katz'] = katz.get(voter['id'], author['id'])
   return features
 
 
-def model_author_voter_similarity(train, users, test_pairs):
-  """ Models users similarities using votes in the training set. 
+def get_rating_profile(users):
+  """ Gets the rating profile of users, a sparse user x product rating matrix
+      with counts, sums, norms, average, maximum and minimum ratings by user.
+      It is read-only, thus shared by forked processes.
 
       Args:
-        train: list of votes in the training set.
         users: dictionary of user models.
 
       Returns:
-        A dictionary of similarity features indexed by a pair of user ids.
+        A dictionary with the rating profile.
+  """
+  u_ids, ratings = get_rating_matrix(users)
+  rated = csr_matrix((ones_like(ratings.data), ratings.indices,
+      ratings.indptr), shape=ratings.shape)
+  return {
+    'index': {u_id: i for i, u_id in enumerate(u_ids)},
+    'ratings': ratings,
+    'rated': rated,
+    'num_rated': rated.getnnz(axis=1).astype(float),
+    'total': array(ratings.sum(axis=1)).ravel(),
+    'sq_total': array(ratings.multiply(ratings).sum(axis=1)).ravel(),
+    'avg': array([users[u_id]['avg_rating'] for u_id in u_ids], dtype=float),
+    'top': array([max(users[u_id]['ratings'].values()) if
+        users[u_id]['ratings'] else nan for u_id in u_ids], dtype=float),
+    'bottom': array([min(users[u_id]['ratings'].values()) if
+        users[u_id]['ratings'] else nan for u_id in u_ids], dtype=float)
+  }
+
+
+def calculate_authoring_similarity_batch(pairs, users, profile=None,
+    batch_size=_BATCH_SIZE):
+  """ Calculates authoring similarity features (refer to
+      calculate_authoring_similarity) of many pairs at once. Rows of a sparse
+      user x product rating matrix are gathered for each batch of pairs and
+      multiplied element-wise, while counts, sums, norms, maximum and minimum
+      ratings are precomputed by user.
+
+      Args:
+        pairs: a list of distinct (author id, voter id) pairs.
+        users: dictionary of user models.
+        profile: an optional rating profile of users (refer to
+      get_rating_profile), computed if not given.
+        batch_size: the number of pairs whose rows are gathered at once.
+
+      Returns:
+        A dictionary of similarity features indexed by pair.
   """
   sim_features = {}
-  for vote in train:
-    author_id = vote['author']
-    voter_id = vote['voter']
-    if (author_id, voter_id) in sim_features:
-      continue
-    sim_features[(author_id, voter_id)] = \
-        calculate_authoring_similarity(users[author_id], users[voter_id])
-  for author_id, voter_id in test_pairs:
-    if (author_id, voter_id) in sim_features:
-      continue
+  valid = []
+  for author_id, voter_id in pairs:
     if author_id in users and voter_id in users:
-      sim_features[(author_id, voter_id)] = \
-          calculate_authoring_similarity(users[author_id], users[voter_id])
+      valid.append((author_id, voter_id))
     else:
       sim_features[(author_id, voter_id)] = \
           calculate_authoring_similarity(None, None)
+  if profile is None:
+    profile = get_rating_profile(users)
+  index = profile['index']
+  ratings, rated = profile['ratings'], profile['rated']
+  num_rated, total = profile['num_rated'], profile['total']
+  sq_total, avg = profile['sq_total'], profile['avg']
+  top, bottom = profile['top'], profile['bottom']
+  for start in xrange(0, len(valid), batch_size):
+    batch = valid[start:start+batch_size]
+    a_idx = array([index[a] for a, _ in batch], dtype=int32)
+    v_idx = array([index[v] for _, v in batch], dtype=int32)
+    common = array(rated[a_idx].multiply(rated[v_idx]).sum(axis=1)).ravel()
+    dot = array(ratings[a_idx].multiply(ratings[v_idx]).sum(axis=1)).ravel()
+    size = num_rated[a_idx] + num_rated[v_idx] - common
+    with errstate(divide='ignore', invalid='ignore'):
+      jacc = where(size > 0, common / size, 0.0)
+      norms = sqrt(sq_total[a_idx] * sq_total[v_idx])
+      cos = where(norms > 0, dot / norms, 0.0)
+      # pearson over the union of rated products, absent ratings being zero
+      cov = size * dot - total[a_idx] * total[v_idx]
+      var = (size * sq_total[a_idx] - total[a_idx] ** 2) * \
+          (size * sq_total[v_idx] - total[v_idx] ** 2)
+      pear = where(var > 0, clip(cov / sqrt(var), -1.0, 1.0), 0.0)
+    empty = (num_rated[a_idx] == 0) | (num_rated[v_idx] == 0)
+    diff_avg = where(empty, nan, avg[a_idx] - avg[v_idx])
+    diff_max = where(empty, nan, top[a_idx] - top[v_idx])
+    diff_min = where(empty, nan, bottom[a_idx] - bottom[v_idx])
+    for i, pair in enumerate(batch):
+      features = {}
+      features['common_rated'] = int(common[i])
+      features['jacc_rated'] = jacc[i].item()
+      features['cos_ratings'] = cos[i].item()
+      features['pear_ratings'] = pear[i].item()
+      features['diff_avg_ratings'] = diff_avg[i].item()
+      features['diff_max_ratings'] = diff_max[i].item()
+      features['diff_min_ratings'] = diff_min[i].item()
+      sim_features[pair] = features
   return sim_features
 
 
-def model_author_voter_connection(train, users, trusts, test_pairs):
-  """ Models users connection strength using votes in the training set. 
+def get_adamic_adar_weights(analytics):
+  """ Gets the Adamic-Adar weight of each node of the trust network, the inverse
+      of the log of its degree (both out and in).
 
       Args:
-        train: list of votes in the training set.
+        analytics: a TrustAnalytics object of the trust network.
+
+      Returns:
+        An array with the weight of each node, zero for nodes of degree one.
+  """
+  degree = (analytics.in_degree + analytics.out_degree).astype(float)
+  with errstate(divide='ignore'):
+    return where(degree > 1, 1.0 / np_log(degree), 0.0)
+
+
+def calculate_overlap_batch(adjacency, degree, weights, a_idx, v_idx):
+  """ Calculates Jaccard and Adamic-Adar indices of neighbourhoods of pairs of
+      nodes, by the element-wise product of their gathered adjacency rows.
+
+      Args:
+        adjacency: a CSR adjacency matrix, whose rows are neighbourhoods.
+        degree: an array with the number of neighbours of each node.
+        weights: an array with the Adamic-Adar weight of each node.
+        a_idx: an int array with the first node of each pair.
+        v_idx: an int array with the second node of each pair.
+
+      Returns:
+        A pair of arrays with the Jaccard and Adamic-Adar indices of each pair.
+  """
+  common = adjacency[a_idx].multiply(adjacency[v_idx]).tocsr()
+  num_common = array(common.sum(axis=1)).ravel()
+  union = degree[a_idx] + degree[v_idx] - num_common
+  with errstate(divide='ignore', invalid='ignore'):
+    jacc = where(union > 0, num_common / union, 0.0)
+  return jacc, common.dot(weights)
+
+
+def get_overlap_profile(analytics):
+  """ Gets the neighbourhood profile of the trust network, the CSR adjacency
+      and its transpose with out and in-degrees and Adamic-Adar weights. It is
+      read-only, thus shared by forked processes.
+
+      Args:
+        analytics: a TrustAnalytics object of the trust network.
+
+      Returns:
+        A dictionary with the neighbourhood profile.
+  """
+  return {
+    'trustees': analytics.adjacency,
+    'trustors': analytics.adjacency.T.tocsr(),
+    'out_degree': analytics.out_degree.astype(float),
+    'in_degree': analytics.in_degree.astype(float),
+    'weights': get_adamic_adar_weights(analytics)
+  }
+
+
+def calculate_connection_strength_batch(pairs, users, analytics, katz,
+    profile=None, batch_size=_BATCH_SIZE):
+  """ Calculates connection strength features (refer to
+      calculate_connection_strength) of many pairs at once, over the CSR
+      adjacency of the trust network and its transpose.
+
+      Args:
+        pairs: a list of distinct (author id, voter id) pairs.
         users: dictionary of user models.
-        trusts: networkx Digraph with trust network.
+        analytics: a TrustAnalytics object of the trust network.
+        katz: a KatzIndex object with the pairs of voters and authors computed.
+        profile: an optional neighbourhood profile of the network (refer to
+      get_overlap_profile), computed if not given.
+        batch_size: the number of pairs whose rows are gathered at once.
 
       Returns:
-        A dictionary of connection features indexed by a pair of user ids.
+        A dictionary of connection features indexed by pair.
   """
   conn_features = {}
-  katz, nodes_index = get_katz_matrix(trusts) 
-  for vote in train:
-    author_id = vote['author']
-    voter_id = vote['voter']
-    if (author_id, voter_id) in conn_features:
-      continue
-    conn_features[(author_id, voter_id)] = \
-        calculate_connection_strength(users[author_id], users[voter_id], trusts,
-        katz, nodes_index)
-  for author_id, voter_id in test_pairs:
-    if (author_id, voter_id) in conn_features:
-      continue
-    if author_id in users and voter_id in users:
-      conn_features[(author_id, voter_id)] = \
-          calculate_connection_strength(users[author_id], users[voter_id], trusts,
-          katz, nodes_index)
+  valid = []
+  for author_id, voter_id in pairs:
+    if author_id in users and voter_id in users and author_id in analytics \
+        and voter_id in analytics:
+      valid.append((author_id, voter_id))
     else:
-      conn_features[(author_id, voter_id)] = \
-          calculate_connection_strength(None, None, trusts, katz, nodes_index)
+      conn_features[(author_id, voter_id)] = {'jacc_trustees': 0.0,
+          'jacc_trustors': 0.0, 'adamic_adar_trustees': 0.0,
+          'adamic_adar_trustors': 0.0, 'katz': 0.0}
+  if profile is None:
+    profile = get_overlap_profile(analytics)
+  trustees, trustors = profile['trustees'], profile['trustors']
+  out_degree, in_degree = profile['out_degree'], profile['in_degree']
+  weights = profile['weights']
+  for start in xrange(0, len(valid), batch_size):
+    batch = valid[start:start+batch_size]
+    a_idx = array([analytics.index[a] for a, _ in batch], dtype=int32)
+    v_idx = array([analytics.index[v] for _, v in batch], dtype=int32)
+    jacc_trustees, aa_trustees = calculate_overlap_batch(trustees, out_degree,
+        weights, a_idx, v_idx)
+    jacc_trustors, aa_trustors = calculate_overlap_batch(trustors, in_degree,
+        weights, a_idx, v_idx)
+    katz_values = katz.get_array(v_idx, a_idx)
+    for i, (author_id, voter_id) in enumerate(batch):
+      features = {}
+      features['jacc_trustees'] = jacc_trustees[i].item()
+      features['jacc_trustors'] = jacc_trustors[i].item()
+      features['adamic_adar_trustees'] = aa_trustees[i].item()
+      features['adamic_adar_trustors'] = aa_trustors[i].item()
+      features['katz'] = katz_values[i].item()
+      conn_features[(author_id, voter_id)] = features
   return conn_features
 
+
+def get_distinct_pairs(train, test_pairs):
+  """ Gets distinct (author, voter) pairs of train votes and test pairs, in
+      order of first occurrence.
+
+      Args:
+        train: list of votes in the training set.
+        test_pairs: list of (author id, voter id) pairs in test.
+
+      Returns:
+        A list of distinct pairs.
+  """
+  seen = set()
+  pairs = []
+  for pair in [(v['author'], v['voter']) for v in train] + list(test_pairs):
+    if pair not in seen:
+      seen.add(pair)
+      pairs.append(pair)
+  return pairs
+
+
+def similarity_shard(pairs):
+  """ Calculates authoring similarity features of a shard of pairs over the
+      state shared by the parent process, being used as pool task.
+
+      Args:
+        pairs: a list of distinct (author id, voter id) pairs.
+
+      Returns:
+        A dictionary of similarity features indexed by pair.
+  """
+  return calculate_authoring_similarity_batch(pairs, _SHARED['users'],
+      _SHARED['profile'])
+
+
+def connection_shard(pairs):
+  """ Calculates connection strength features of a shard of pairs over the
+      state shared by the parent process, being used as pool task.
+
+      Args:
+        pairs: a list of distinct (author id, voter id) pairs.
+
+      Returns:
+        A dictionary of connection features indexed by pair.
+  """
+  return calculate_connection_strength_batch(pairs, _SHARED['users'],
+      _SHARED['analytics'], _SHARED['katz'], _SHARED['profile'])
+
+
+def calculate_pair_features(shard_function, pairs, shared, num_procs):
+  """ Calculates pair features by shards of the pair list. The read-only state
+      is set as module level before the pool is created, so that workers
+      inherit it by fork instead of receiving it pickled, and only the feature
+      dictionaries of shards are sent back and merged. The largest structures,
+      Katz entries and CSR matrices, are numpy arrays, whose buffers are read
+      by workers without being copied.
+
+      Args:
+        shard_function: module level function which calculates the features of
+      a shard of pairs over the shared state.
+        pairs: a list of distinct (author id, voter id) pairs.
+        shared: a dictionary with the shared state.
+        num_procs: number of worker processes; 1 means serial computation.
+
+      Returns:
+        A dictionary of pair features indexed by pair.
+  """
+  global _SHARED
+  _SHARED = shared
+  try:
+    if num_procs <= 1:
+      return shard_function(pairs)
+    shard_size = max(1, -(-len(pairs) // (num_procs * _SHARDS_PER_PROC)))
+    shards = [pairs[start:start+shard_size] for start in xrange(0,
+        len(pairs), shard_size)]
+    features = {}
+    pool = Pool(processes=num_procs)
+    try:
+      for shard_features in pool.imap_unordered(shard_function, shards):
+        features.update(shard_features)
+      pool.close()
+    except:
+      pool.terminate()
+      raise
+    finally:
+      pool.join()
+    return features
+  finally:
+    _SHARED = {}
+
+
+def model_author_voter_similarity(train, users, test_pairs, num_procs=1):
+  """ Models users similarities using votes in the training set. 
+
+      Args:
+        train: list of votes in the training set.
+        users: dictionary of user models.
+        test_pairs: list of (author id, voter id) pairs in test.
+        num_procs: number of processes computing shards of pairs.
+
+      Returns:
+        A dictionary of similarity features indexed by a pair of user ids.
+  """
+  pairs = get_distinct_pairs(train, test_pairs)
+  shared = {'users': users, 'profile': get_rating_profile(users)}
+  return calculate_pair_features(similarity_shard, pairs, shared, num_procs)
+
+
+def model_author_voter_connection(train, users, trusts, test_pairs,
+    analytics=None, num_procs=1):
+  """ Models users connection strength using votes in the training set. 
+
+      Args:
+        train: list of votes in the training set.
+        users: dictionary of user models.
+        trusts: networkx Digraph with trust network.
+        test_pairs: list of (author id, voter id) pairs in test.
+        analytics: an optional TrustAnalytics object of trusts, computed if not
+      given.
+        num_procs: number of processes computing shards of pairs.
+
+      Returns:
+        A dictionary of connection features indexed by a pair of user ids.
+  """
+  if analytics is None:
+    analytics = TrustAnalytics(trusts)
+  pairs = get_distinct_pairs(train, test_pairs)
+  katz = get_katz_index(analytics, [(voter, author) for author, voter in pairs
+      if author in users and voter in users])
+  shared = {'users': users, 'analytics': analytics, 'katz': katz, 'profile':
+      get_overlap_profile(analytics)}
+  return calculate_pair_features(connection_shard, pairs, shared, num_procs)
@@ -12,15 +12,20 @@
 from pickle import load, dump
 
 from prep.parsing import parse_trusts, parse_reviews
-from prep.review_modeling import model_reviews_parallel
-from prep.user_modeling import model_users
+from prep.review_modeling import model_reviews_parallel, load_text_cache, \
+    dump_text_cache
+from prep.user_modeling import model_users, UserStatistics
 from prep.vote_modeling import model_votes, split_votes
 from prep.interaction_modeling import model_author_voter_similarity, \
     model_author_voter_connection
+from lib.trust.analytics import load_trust_analytics
+from util.splits import get_split_views, dump_splits
 
 
 _NUM_THREADS = 7
 _OUTPUT_DIR = 'out/pkl'
+_TEXT_CACHE = '%s/text-cache.pkl' % _OUTPUT_DIR
+_TRUST_ANALYTICS = '%s/trust-analytics.pkl' % _OUTPUT_DIR
 
 
 def model():
@@ -36,47 +41,52 @@ def model():
   """
   print 'Getting trust'
   trusts = parse_trusts()
-  dump(trusts, open('%s/trusts.pkl' % _OUTPUT_DIR, 'w'))
+  with open('%s/trusts.pkl' % _OUTPUT_DIR, 'w') as trusts_file:
+    dump(trusts, trusts_file)
+  analytics = load_trust_analytics(trusts, '%s/trusts.pkl' % _OUTPUT_DIR,
+      _TRUST_ANALYTICS)
   reviews = {r['id']:r for r in parse_reviews()}
 
   print 'Modeling votes'
-  votes = model_votes(reviews)
-  dump(votes, open('%s/votes.pkl' % _OUTPUT_DIR, 'w'))
+  votes, splits = split_votes(model_votes(reviews))
+  dump_splits(votes, splits, _OUTPUT_DIR)
   print 'Modeling reviews'
-  model_reviews_parallel(_NUM_THREADS, votes, reviews)
+  text_cache = load_text_cache(_TEXT_CACHE)
+  model_reviews_parallel(_NUM_THREADS, votes, reviews, text_cache)
+  dump_text_cache(text_cache, _TEXT_CACHE)
   dump(reviews, open('%s/reviews.pkl' % _OUTPUT_DIR, 'w'))
   for r_id in reviews:
     del reviews[r_id]['text']
   print 'Modeling users'
-  users = model_users(reviews, votes, [], trusts)
+  users = model_users(reviews, votes, [], trusts, analytics=analytics)
   dump(users, open('%s/users.pkl' % _OUTPUT_DIR, 'w'))
-  del reviews
   print 'Modeling sim'
-  sim = model_author_voter_similarity(votes, users, [])
+  sim = model_author_voter_similarity(votes, users, [], _NUM_THREADS)
   dump(sim, open('%s/sim.pkl' % _OUTPUT_DIR, 'w'))
   print 'Modeling conn'
-  conn = model_author_voter_connection(votes, users, trusts, [])
+  conn = model_author_voter_connection(votes, users, trusts, [], analytics,
+      _NUM_THREADS)
   dump(conn, open('%s/conn.pkl' % _OUTPUT_DIR, 'w'))
   
-  sets = split_votes(votes)
-  for (i, split) in enumerate(sets):
-    train, val, test = split
-    dump(train, open('%s/train-%d.pkl' % (_OUTPUT_DIR, i), 'w'))
-    dump(val, open('%s/validation-%d.pkl' % (_OUTPUT_DIR, i), 'w'))
-    dump(test, open('%s/test-%d.pkl' % (_OUTPUT_DIR, i), 'w'))
+  statistics = UserStatistics(reviews)
+  for (i, split) in enumerate(splits):
+    train, val, test = get_split_views(votes, split)
     print 'Modeling reviews %d' % i
-    model_reviews_parallel(_NUM_THREADS, train, reviews)
+    model_reviews_parallel(_NUM_THREADS, train, reviews, text_cache)
     dump(reviews, open('%s/reviews-%d.pkl' % (_OUTPUT_DIR, i), 'w'))
     print 'Modeling users %d' % i
     test_users = set([v['author'] for v in val + test]) \
         .union(set([v['voter'] for v in val + test]))
-    users = model_users(reviews, train, test_users, trusts)
+    users = model_users(reviews, train, test_users, trusts,
+        statistics=statistics, analytics=analytics)
     dump(users, open('%s/users-%d.pkl' % (_OUTPUT_DIR, i), 'w'))
     print 'Modeling author-voter interaction %d' % i
     test_pairs = [(v['author'], v['voter']) for v in val + test]
-    sim = model_author_voter_similarity(train, users, test_pairs)
+    sim = model_author_voter_similarity(train, users, test_pairs,
+        _NUM_THREADS)
     dump(sim, open('%s/sim-%d.pkl' % (_OUTPUT_DIR, i), 'w'))
-    conn = model_author_voter_connection(train, users, trusts, test_pairs)
+    conn = model_author_voter_connection(train, users, trusts, test_pairs,
+        analytics, _NUM_THREADS)
     dump(conn, open('%s/conn-%d.pkl' % (_OUTPUT_DIR, i), 'w'))
 
 
@@ -6,22 +6,499 @@
     This module is used by other modules and should not be directly called.
 """
 
+from array import array
+from collections import deque
+from datetime import datetime
+from multiprocessing import Pool
+from os.path import getsize
 from re import match
 
 from networkx import DiGraph
-from numpy import mean, nan
+from numpy import mean, nan, frombuffer, zeros, int8, int32, float64
 from nltk.tokenize import RegexpTokenizer
 from nltk.corpus import wordnet
 
 
 _FILE = 'data/reviews_filtered.txt'
+_RANGES_PER_PROC = 4
+_MAX_RANGE_SIZE = 1 << 25 # bytes, so that parsed ranges are small
+_PENDING_PER_PROC = 2 # ranges parsed ahead of the consumer, by process
 
 
-def parse_reviews(verbose=False):
-  """ Iterates through reviews, parsing the file content.
+class ReviewTable(object):
+  """ Columnar table of parsed reviews. Authors, voters, products, categories
+      and dates are interned into int32 ids and votes are kept in a CSR-style
+      block: votes of the i-th review are at positions
+      vote_offsets[i]:vote_offsets[i+1] of vote_voters and vote_values.
+  """
+
+  def __init__(self, keep_text=True):
+    """ Initializes an empty table, whose columns are filled by add_review and
+        converted to numpy arrays by freeze.
+
+        Args:
+          keep_text: whether the text of reviews should be kept in memory.
+
+        Returns:
+          None.
+    """
+    self.keep_text = keep_text
+    self.users = []
+    self.products = []
+    self.categories = []
+    self.dates = []
+    self.texts = []
+    self._user_index = {}
+    self._product_index = {}
+    self._category_index = {}
+    self._date_index = {}
+    self._ordinals = []
+    self.id = array('i')
+    self.author = array('i')
+    self.product = array('i')
+    self.category = array('i')
+    self.rating = array('b')
+    self.date = array('i')
+    self.date_ordinal = array('i')
+    self.avg_vote = array('d')
+    self.vote_offsets = array('i', [0])
+    self.vote_voters = array('i')
+    self.vote_values = array('b')
+
+  def __len__(self):
+    """ Gets the number of reviews in the table.
+
+        Args:
+          None.
+
+        Returns:
+          An integer with the number of rows.
+    """
+    return len(self.id)
+
+  def _intern(self, index, values, key):
+    """ Interns a string into an integer id.
+
+        Args:
+          index: dictionary from string to id.
+          values: list from id to string.
+          key: the string to intern.
+
+        Returns:
+          An integer with the id of the string.
+    """
+    if key not in index:
+      index[key] = len(values)
+      values.append(key)
+    return index[key]
+
+  def intern_user(self, user):
+    """ Interns a user id, either author or voter, in a common id space.
+
+        Args:
+          user: a string with the user id.
+
+        Returns:
+          An integer with the interned id.
+    """
+    return self._intern(self._user_index, self.users, user)
+
+  def add_review(self, r_id, fields):
+    """ Appends a parsed review to the table.
+
+        Args:
+          r_id: the integer id of the review (line index in the file).
+          fields: a tuple as returned by parse_review_line.
+
+        Returns:
+          None. The columns are changed in place.
+    """
+    author, product, category, rating, date, text, votes = fields
+    self.id.append(r_id)
+    self.author.append(self.intern_user(author))
+    self.product.append(self._intern(self._product_index, self.products,
+        product))
+    self.category.append(self._intern(self._category_index, self.categories,
+        category))
+    self.rating.append(rating)
+    if date not in self._date_index:
+      self._ordinals.append(get_date_ordinal(date))
+    date_id = self._intern(self._date_index, self.dates, date)
+    self.date.append(date_id)
+    self.date_ordinal.append(self._ordinals[date_id])
+    self.texts.append(text if self.keep_text else None)
+    total = 0
+    for voter, vote in votes.iteritems():
+      self.vote_voters.append(self.intern_user(voter))
+      self.vote_values.append(vote)
+      total += vote
+    self.vote_offsets.append(len(self.vote_voters))
+    self.avg_vote.append(float(total) / len(votes))
+
+  def freeze(self):
+    """ Converts the growing columns into numpy arrays, without copying.
+
+        Args:
+          None.
+
+        Returns:
+          The table itself.
+    """
+    for column, dtype in [('id', int32), ('author', int32),
+        ('product', int32), ('category', int32), ('rating', int8),
+        ('date', int32), ('date_ordinal', int32), ('avg_vote', float64),
+        ('vote_offsets', int32), ('vote_voters', int32),
+        ('vote_values', int8)]:
+      values = getattr(self, column)
+      if isinstance(values, array):
+        setattr(self, column, frombuffer(values, dtype=dtype) if values else
+            zeros(0, dtype=dtype))
+    return self
+
+  def get_votes(self, row):
+    """ Gets the votes of a review as a dictionary.
+
+        Args:
+          row: the row index of the review in the table.
+
+        Returns:
+          A dictionary from voter id (string) to vote value (integer).
+    """
+    start, end = self.vote_offsets[row], self.vote_offsets[row+1]
+    return {self.users[v]: int(h) for v, h in
+        zip(self.vote_voters[start:end], self.vote_values[start:end])}
+
+  def get_review(self, row):
+    """ Gets a review in the dictionary format returned by parse_reviews.
+
+        Args:
+          row: the row index of the review in the table.
+
+        Returns:
+          A dictionary representing the review with keys: "id", "author",
+        "product", "category", "rating", "date", "text", "votes" and
+        "avg_vote".
+    """
+    review = {}
+    review['id'] = int(self.id[row])
+    review['author'] = self.users[self.author[row]]
+    review['product'] = self.products[self.product[row]]
+    review['category'] = self.categories[self.category[row]]
+    review['rating'] = int(self.rating[row])
+    review['date'] = self.dates[self.date[row]]
+    if self.keep_text:
+      review['text'] = self.texts[row]
+    review['votes'] = self.get_votes(row)
+    review['avg_vote'] = self.avg_vote[row]
+    return review
+
+  def iter_reviews(self):
+    """ Iterates over reviews in the dictionary format, in file order.
+
+        Args:
+          None.
+
+        Yields:
+          A dictionary representing a review (refer to get_review).
+    """
+    for row in xrange(len(self)):
+      yield self.get_review(row)
+
+
+def get_date_ordinal(date):
+  """ Converts a review date into a proleptic Gregorian ordinal.
+
+      Args:
+        date: a string with the date in format dd.mm.yyyy.
+
+      Returns:
+        An integer with the ordinal of the date or -1 if it is malformed.
+  """
+  try:
+    return datetime.strptime(date, '%d.%m.%Y').toordinal()
+  except ValueError:
+    return -1
+
+
+def parse_review_line(line, check_text=None):
+  """ Parses and validates a line of the reviews file.
+
+      Args:
+        line: a string with a raw line of the file.
+        check_text: an optional function which receives the text and returns
+      whether it is valid.
+
+      Returns:
+        A tuple (author, product, category, rating, date, text, votes), in which
+      votes is a dictionary as returned by parse_votes. If a field is invalid,
+      an exception is raised with the field name as argument.
+  """
+  l = line.strip().split('::::')
+  author = l[0].strip()
+  if not author:
+    raise Exception('author')
+  product = l[1].strip()
+  if not product:
+    raise Exception('product')
+  category = l[2].strip()
+  if not category:
+    raise Exception('category')
+  try:
+    rating = int(l[3]) / 10
+    if rating < 0 or rating > 5:
+      raise Exception()
+  except Exception:
+    raise Exception('rating')
+  date = l[5].strip()
+  if not date:
+    raise Exception('date')
+  text = l[6].strip()
+  if not text or (check_text and not check_text(text)):
+    raise Exception('text')
+  try:
+    votes = parse_votes(l[7], author)
+  except Exception:
+    raise Exception('votes')
+  if not votes:
+    raise Exception('votes')
+  return author, product, category, rating, date, text, votes
+
+
+def create_type_ignored():
+  """ Creates the counters of ignored lines by type of error.
+
+      Args:
+        None.
+
+      Returns:
+        A dictionary from field name to zero.
+  """
+  return {'author': 0, 'product': 0, 'category': 0, 'rating': 0, 'date': 0,
+      'text': 0, 'votes': 0}
+
+
+def print_parsing_summary(title, type_ignored):
+  """ Prints the summary of ignored lines of a parsing or filtering step.
+
+      Args:
+        title: a string with the name of the step.
+        type_ignored: dictionary from field name to number of ignored lines.
+
+      Returns:
+        None.
+  """
+  print '#############################'
+  print 'Summary of %s:' % title
+  print '~ Ignored: %d' % sum(type_ignored.values())
+  for item in type_ignored.items():
+    print '~ Ignored of type %s: %d' % item
+  print '#############################'
+
+
+def get_byte_ranges(input_file, num_ranges):
+  """ Splits a file into contiguous byte ranges aligned to line boundaries.
+
+      Args:
+        input_file: path of the file.
+        num_ranges: the desired number of ranges.
+
+      Returns:
+        A list of pairs (start, stop) of byte offsets, in file order. Each range
+      starts at the beginning of a line and ends after a newline (or at the end
+      of the file).
+  """
+  size = getsize(input_file)
+  bounds = [0]
+  with open(input_file, 'rb') as f:
+    for i in xrange(1, num_ranges):
+      pos = size * i / num_ranges
+      if pos <= bounds[-1]:
+        continue
+      f.seek(pos - 1)
+      f.readline()
+      pos = f.tell()
+      if pos > bounds[-1] and pos < size:
+        bounds.append(pos)
+  bounds.append(size)
+  return [(bounds[i], bounds[i+1]) for i in xrange(len(bounds) - 1) if
+      bounds[i] < bounds[i+1]]
+
+
+def iter_byte_range(input_file, start, stop, line_parser):
+  """ Iterates over the lines of a byte range of a file, parsing them.
+
+      Args:
+        input_file: path of the file.
+        start: byte offset of the first line.
+        stop: byte offset after the last line.
+        line_parser: function which parses and validates a line, raising an
+      exception named by the invalid field.
+
+      Yields:
+        Tuples (line index in range, parsed value, error), in which error is
+      None for valid lines and a pair (error type, raw line) otherwise.
+  """
+  with open(input_file, 'rb') as f:
+    f.seek(start)
+    pos = start
+    index = 0
+    while pos < stop:
+      line = f.readline()
+      if not line:
+        break
+      pos += len(line)
+      try:
+        yield index, line_parser(line), None
+      except Exception as e:
+        yield index, None, (e.args[0] if e.args else None, line)
+      index += 1
+
+
+def parse_byte_range(args):
+  """ Parses the lines of a byte range of a file. Used by worker processes.
+
+      Args:
+        args: a tuple (input_file, start, stop, line_parser), refer to
+      iter_byte_range.
+
+      Returns:
+        A tuple (num_lines, records, errors), in which records is a list of
+      pairs (line index in range, parsed value) and errors is a list of tuples
+      (line index in range, error type, raw line).
+  """
+  records = []
+  errors = []
+  num_lines = 0
+  for index, record, error in iter_byte_range(*args):
+    if error:
+      errors.append((index, error[0], error[1]))
+    else:
+      records.append((index, record))
+    num_lines = index + 1
+  return num_lines, records, errors
+
+
+def count_ignored_line(type_ignored, index, e_type, line, verbose):
+  """ Accounts an ignored line in the counters by type.
+
+      Args:
+        type_ignored: dictionary of counters of ignored lines by type.
+      Unexpected errors are counted under 'other'.
+        index: the line index in the file.
+        e_type: the error type, the name of the invalid field.
+        line: the raw line.
+        verbose: indicate whether the exception should be printed to stdout.
+
+      Returns:
+        None. The counters are updated in place.
+  """
+  if verbose:
+    print 'Exception on parsing review, line %d, type %s' % (index + 1,
+        e_type)
+    print line.strip().split('::::')
+    print '--------------------------'
+  e_type = e_type if e_type in type_ignored else 'other'
+  type_ignored[e_type] = type_ignored.get(e_type, 0) + 1
+
+
+def iter_parsed_lines(input_file, line_parser, type_ignored, num_procs=1,
+    verbose=False):
+  """ Iterates over parsed lines of a file, in file order, either serially or
+      by parsing newline-aligned byte ranges in a pool of processes.
+
+      Args:
+        input_file: path of the file.
+        line_parser: module level function which parses and validates a line,
+      raising an exception named by the invalid field.
+        type_ignored: dictionary of counters of ignored lines by type, updated
+      in place.
+        num_procs: number of worker processes; 1 means serial parsing.
+        verbose: indicate whether exceptions should be printed to stdout.
+
+      Observation:
+      - In parallel mode, at most _PENDING_PER_PROC ranges by process, of at
+      most about _MAX_RANGE_SIZE bytes, are submitted ahead of the consumer,
+      so parsed lines waiting in memory are bounded regardless of the file
+      size.
+      - The pool is terminated if the iteration does not finish normally, that
+      is, if a worker raises or the iterator is closed early.
+
+      Yields:
+        Pairs (line index, parsed value) of valid lines. The line index is the
+      same in serial and parallel modes.
+  """
+  if num_procs <= 1:
+    for index, record, error in iter_byte_range(input_file, 0,
+        getsize(input_file), line_parser):
+      if error:
+        count_ignored_line(type_ignored, index, error[0], error[1], verbose)
+      else:
+        yield index, record
+    return
+  num_ranges = max(num_procs * _RANGES_PER_PROC, getsize(input_file) /
+      _MAX_RANGE_SIZE + 1)
+  ranges = deque(get_byte_ranges(input_file, num_ranges))
+  pending = deque()
+  pool = Pool(processes=num_procs)
+  offset = 0
+  finished = False
+  try:
+    while ranges or pending:
+      while ranges and len(pending) < num_procs * _PENDING_PER_PROC:
+        start, stop = ranges.popleft()
+        pending.append(pool.apply_async(parse_byte_range, ((input_file, start,
+            stop, line_parser),)))
+      num_lines, records, errors = pending.popleft().get()
+      for index, e_type, line in errors:
+        count_ignored_line(type_ignored, offset + index, e_type, line, verbose)
+      for index, record in records:
+        yield offset + index, record
+      offset += num_lines
+    finished = True
+  finally:
+    if finished:
+      pool.close()
+    else:
+      pool.terminate()
+    pool.join()
+
+
+def parse_reviews_table(verbose=False, keep_text=True, input_file=_FILE,
+    num_procs=1):
+  """ Streams the reviews file into a compact columnar table.
+
+      Args:
+        verbose: indicate whether exceptions should be printed to stdout.
+        keep_text: whether the texts should be kept in the table.
+        input_file: path of the reviews file.
+        num_procs: number of processes parsing byte ranges of the file.
+
+      Returns:
+        A frozen ReviewTable. The id of a review is its line index in the file.
+  """
+  table = ReviewTable(keep_text)
+  type_ignored = create_type_ignored()
+  lines = iter_parsed_lines(input_file, parse_review_line, type_ignored,
+      num_procs, verbose)
+  try:
+    for r_id, fields in lines:
+      table.add_review(r_id, fields)
+  finally:
+    lines.close() # terminates the workers if the loop failed
+
+  if verbose:
+    print_parsing_summary('Parsing Errors', type_ignored)
+
+  return table.freeze()
+
+
+def parse_reviews(verbose=False, num_procs=1):
+  """ Iterates through reviews, parsing the file content. This is a view over
+      the columnar table built by parse_reviews_table.
 
       Args:
           verbose: indicate whether exceptions should be printed to stdout.
+          num_procs: number of processes parsing the file.
 
       Returns:
           A dictionary representing the review with keys: "id",
@@ -29,77 +506,10 @@ def parse_reviews(verbose=False):
       "date", "text", "votes" (dictionary
       indexed by rater ids with helfulness votes as values).
   """
-  f = open(_FILE, 'r')
-  review_count = 0
-  count_lines = 0
-  count_ignored = 0
-  type_ignored = {'user': 0, 'product': 0, 'category': 0, 'rating': 0,
-      'date': 0, 'text': 0, 'votes': 0}
-  for l in f:
-    count_lines += 1
-    try:
-      l = l.strip().split('::::')
-      review = {}
-      review['id'] = review_count
-      review_count += 1
-      if l[0].strip():
-        review['author'] = l[0].strip()
-      else:
-        raise Exception('author')
-      if l[1].strip():
-        review['product'] = l[1].strip()
-        if not review['product']:
-          raise Exception()
-      else:
-        raise Exception('product')
-      if l[2].strip():
-        review['category'] = l[2].strip()
-      else:
-        raise Exception('category')
-      try:
-        review['rating'] = int(l[3]) / 10
-        if review['rating'] < 0 or review['rating'] > 5:
-          raise Exception()
-      except Exception:
-        raise Exception('rating')
-      if l[5].strip():
-        review['date'] = l[5].strip()
-      else:
-        raise Exception('date')
-      if l[6].strip():
-        review['text'] = l[6].strip()
-      else:
-        raise Exception('text')
-      try:
-        review['votes'] = parse_votes(l[7], review['author'])
-      except Exception:
-        raise Exception('votes')
-      if review['votes']:
-        review['avg_vote'] = mean(review['votes'].values())
-      else:
-        raise Exception('votes')
-    except Exception as e:
-      if verbose:
-        print 'Exception on parsing review, line %d, type %s' % (count_lines,
-            e.args[0])
-        print l
-        print '--------------------------'
-        count_ignored += 1
-        if e.args[0] in type_ignored:
-          type_ignored[e.args[0]] += 1
-      continue
+  for review in parse_reviews_table(verbose, num_procs=num_procs) \
+      .iter_reviews():
     yield review
 
-  if verbose:
-    print '#############################'
-    print 'Summary of Parsing Errors:'
-    print '~ Ignored: %d' % count_ignored
-    for item in type_ignored.items():
-      print '~ Ignored of type %s: %d' % item
-    print '#############################'
-
-  f.close()
-
 
 """ Parses review votes from raw string.
 
@@ -9,20 +9,25 @@
 
 
 from string import punctuation
-from math import log, ceil
+from math import log
 from copy import deepcopy
+from hashlib import md5
 from multiprocessing import Pool
+from os.path import isfile
+from pickle import load, dump, HIGHEST_PROTOCOL
 from re import match
 from traceback import print_exc
 
 from textblob import TextBlob
 from nltk.tokenize import word_tokenize, sent_tokenize, RegexpTokenizer
-from nltk import pos_tag
-from nltk.corpus import wordnet
-from numpy import nan, isnan, mean
+from nltk.tag.perceptron import PerceptronTagger
+from numpy import nan, isnan, mean, array, ones, log as np_log, bincount, \
+    float64, int32
+from scipy.sparse import csr_matrix, diags
 
 from prep.parsing import parse_reviews
 from lib.sentiment.sentiwordnet import SimplifiedSentiWordNet
+from lib.wordnet.lemma_index import LemmaIndex
 
 
 _NEGATION = set(['not', 'no', 'n\'t'])
@@ -41,32 +46,161 @@ _PUNCTUATION = set(['!', '?', ':', ';', ',', '.'])
     # source: http://www.nltk.org/api/nltk.tokenize.html
 _SYMBOLS = punctuation
 _SWN = SimplifiedSentiWordNet()
+_LEMMAS = LemmaIndex()
+_WORD_TOKENIZER = RegexpTokenizer(r'\w+')
+_BATCH_SIZE = 100
+_TAGGER = None
+_FEATURES_VERSION = 3 # of text features, to be increased when they change
 
 
-def model_review_text(text_pair):
-  """ Models a review.
+def load_tagger():
+  """ Loads the POS tagger once per process, being used as pool initializer.
 
       Args:
-        text_pair: a pair with review id and review text. 
+        None.
 
       Returns:
-        A pair with review id and a dictionary with keys represented text 
-      related modeled attributes.
+        The loaded tagger, also kept in the module for later calls.
+  """
+  global _TAGGER
+  if _TAGGER is None:
+    _TAGGER = PerceptronTagger()
+  return _TAGGER
+
+
+def model_review_batch(batch):
+  """ Models the text-only features of a batch of reviews as entries of the text
+      features cache.
+
+      Args:
+        batch: a list of pairs with review id and review text.
+
+      Returns:
+        A list of pairs with review id and a dictionary with keys "hash", the
+      digest of the text, "features", the textual features, and "unigram", the
+      word counts of the text.
   """
   try:
-    r_id, text = text_pair
-    review = get_textual_features(text)
-    if _USE_DB:
-      review['_id'] = r_id
-      reviews_db.insert_one(review)
-    else:
-      return r_id, review
+    texts = [text for _, text in batch]
+    features = get_batch_textual_features(texts)
+    entries = []
+    for (r_id, text), text_features in zip(batch, features):
+      entry = {}
+      entry['hash'] = get_text_hash(text)
+      entry['features'] = text_features
+      entry['unigram'] = get_unigram_counts(text)
+      entries.append((r_id, entry))
+    return entries
   except Exception as e:
     print_exc()
     print ''
     raise e
 
 
+def iter_batches(items, batch_size):
+  """ Groups an iterable into lists of consecutive items.
+
+      Args:
+        items: an iterable.
+        batch_size: maximum number of items of each batch.
+
+      Returns:
+        An iterator of lists with at most batch_size items.
+  """
+  batch = []
+  for item in items:
+    batch.append(item)
+    if len(batch) == batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+def get_text_hash(text):
+  """ Gets a digest of a text, used to validate cached text features.
+
+      Args:
+        text: a string with the text.
+
+      Returns:
+        A string with the binary MD5 digest of the text.
+  """
+  if isinstance(text, unicode):
+    text = text.encode('utf-8')
+  return md5(text).digest()
+
+
+def load_text_cache(path):
+  """ Loads the text features cache. A cache persisted with another version of
+      text features (refer to _FEATURES_VERSION) is discarded.
+
+      Args:
+        path: path of the pickled cache.
+
+      Returns:
+        A dictionary indexed by review id and containing cache entries (refer to
+      model_review_batch) as values, empty if the file does not exist or has
+      another version.
+  """
+  if not isfile(path):
+    return {}
+  with open(path, 'rb') as f:
+    data = load(f)
+  if data.get('version') != _FEATURES_VERSION:
+    return {}
+  return data['entries']
+
+
+def dump_text_cache(cache, path):
+  """ Persists the text features cache.
+
+      Args:
+        cache: dictionary of cache entries indexed by review id.
+        path: path of the pickled cache.
+
+      Returns:
+        None.
+  """
+  with open(path, 'wb') as f:
+    dump({'version': _FEATURES_VERSION, 'entries': cache}, f,
+        HIGHEST_PROTOCOL)
+
+
+def update_text_cache(num_threads, reviews, cache):
+  """ Models, in parallel, the text-only features of reviews which are missing
+      in the cache or whose text changed. Reviews without text (already
+      discarded from memory) are trusted to be cached by id, an error being
+      raised otherwise. Reviews are sent to the workers in batches and results
+      are stored as they arrive.
+
+      Args:
+        num_threads: number of parallel jobs.
+        reviews: dictionary of reviews.
+        cache: dictionary of cache entries indexed by review id.
+
+      Returns:
+        None. The cache is updated in place.
+  """
+  for r_id, review in reviews.iteritems():
+    if 'text' not in review and r_id not in cache:
+      raise ValueError('Review %s has neither text nor cached text features' %
+          r_id)
+  missing = [r_id for r_id, review in reviews.iteritems() if 'text' in review
+      and (r_id not in cache or cache[r_id]['hash'] !=
+      get_text_hash(review['text']))]
+  if not missing:
+    return
+  texts = ((r_id, reviews[r_id]['text']) for r_id in missing)
+  pool = Pool(processes=num_threads, initializer=load_tagger)
+  for entries in pool.imap(model_review_batch, iter_batches(texts,
+      _BATCH_SIZE)):
+    for r_id, entry in entries:
+      cache[r_id] = entry
+  pool.close()
+  pool.join()
+
+
 def get_textual_features(text):
   """ Reports different features derived from text, related to length, syntax,
       lexicon and sentiment statistics.
@@ -79,35 +213,72 @@ def get_textual_features(text):
       "get_text_length_stats", "get_pos_stats" and "get_sent_stats" for complete
       list of feature names.
   """
-  lower_text = text.lower()
-  for sub, target in _SUBSTITUTE.items():
-    lower_text = lower_text.replace(sub, target)
+  return get_batch_textual_features([text])[0]
 
-  features = {}
-  length_feat = get_text_length_stats(text)
-  for feat in length_feat:
-    features[feat] = length_feat[feat]
 
-  tokens = word_tokenize(lower_text)
-  tags = pos_tag(tokens)
-  pos_feat = get_pos_stats(tags)
-  for feat in pos_feat:
-    features[feat] = pos_feat[feat]
+def get_batch_textual_features(texts):
+  """ Reports textual features (refer to get_textual_features) of a list of
+      texts, tagging all of them in a single call to the tagger.
 
-  sent_feat = get_sent_stats(tags)
-  for feat in sent_feat:
-    features[feat] = sent_feat[feat]
+      Args:
+        texts: a list of strings with the texts to derive the features from.
 
-  return features
+      Returns:
+        A list of dictionaries from feature names to feature value, in the same
+      order of texts.
+  """
+  tokenized = [tokenize_text(text) for text in texts]
+  tagged = load_tagger().tag_sents([tokens for _, tokens in tokenized])
+
+  result = []
+  for text, (sents, tokens), tags in zip(texts, tokenized, tagged):
+    features = {}
+    length_feat = get_text_length_stats(text, sents, tokens)
+    for feat in length_feat:
+      features[feat] = length_feat[feat]
+
+    pos_feat = get_pos_stats(tags)
+    for feat in pos_feat:
+      features[feat] = pos_feat[feat]
+
+    sent_feat = get_sent_stats(tags)
+    for feat in sent_feat:
+      features[feat] = sent_feat[feat]
+    result.append(features)
+
+  return result
+
+
+def tokenize_text(text):
+  """ Splits a text into sentences and tokens. Sentences are split once over the
+      original text and tokens are obtained from the lowercased sentences, with
+      common contractions and unicode escapes normalized.
+
+      Args:
+        text: a string with the text to tokenize.
+
+      Returns:
+        A pair with the list of sentences and the list of tokens.
+  """
+  sents = sent_tokenize(text)
+  tokens = []
+  for sent in sents:
+    lower_sent = sent.lower()
+    for sub, target in _SUBSTITUTE.items():
+      lower_sent = lower_sent.replace(sub, target)
+    tokens.extend(word_tokenize(lower_sent, preserve_line=True))
+  return sents, tokens
 
 
-def get_text_length_stats(text):
+def get_text_length_stats(text, sents, tokens):
   """ Gets length statistics of the text: number of chars, number of tokens,
       number of words, number of sentences, ratio of unique words, average number
       of tokens by sentence and ratio of capitalized sentences.
 
       Args:
         text: a string with the text to calculate statistics from.
+        sents: a list with the sentences of the text.
+        tokens: a list with the tokens of the text.
 
       Returns:
         A dictionary indexed by keys "num_chars", "num_tokens", "num_words",
@@ -116,11 +287,7 @@ def get_text_length_stats(text):
   """
   features = {}
 
-  word_tokenizer = RegexpTokenizer(r'\w+')
-
-  tokens = word_tokenize(text)
-  words = word_tokenizer.tokenize(text)
-  sents = sent_tokenize(text)
+  words = _WORD_TOKENIZER.tokenize(text)
   capsents = [s for s in sents if match('[A-Z]', s[0])] 
 
   features['num_chars'] = len(text)
@@ -155,7 +322,7 @@ def get_pos_stats(tags):
       'sym_ratio': 0.0, 'num_ratio': 0.0, 'punct_ratio': 0.0}
 
   for word, tag in tags:
-    if tag == 'FW' or (match('[a-z]+', tag) and wordnet.synsets(tag) == []):
+    if tag == 'FW' or (match('[a-z]+', tag) and not _LEMMAS.is_known(tag)):
       features['fw_ratio'] += 1.0 # order is important
     elif tag == 'JJR' or tag == 'RBR':
       features['num_ratio'] += 1.0
@@ -196,7 +363,8 @@ def get_sent_stats(tags):
   features = {}
   negate = False
 
-  features['pos_ratio'] = features['neg_ratio'] = w_count = 0.0
+  w_count = 0.0
+  words, swn_tags, negated = [], [], []
   for word, tag in tags:
     if tag == 'SYM' or tag in _PUNCTUATION:
       negate = False
@@ -214,15 +382,15 @@ def get_sent_stats(tags):
       tag = 'r'
     else:
       continue
-    scores = _SWN.scores(word, tag)
-    if scores:
-      if negate:
-        scores['pos_score'], scores['neg_score'] = scores['neg_score'], \
-            scores['pos_score']
-      if scores['pos_score'] > scores['neg_score']:
-        features['pos_ratio'] += 1
-      elif scores['neg_score'] > scores['pos_score']:
-        features['neg_ratio'] += 1
+    words.append(word)
+    swn_tags.append(tag)
+    negated.append(negate)
+  pos_score, neg_score, found = _SWN.scores_array(words, swn_tags)
+  negated = array(negated, dtype=bool)
+  pos_score[negated], neg_score[negated] = neg_score[negated], \
+      pos_score[negated]
+  features['pos_ratio'] = float((found & (pos_score > neg_score)).sum())
+  features['neg_ratio'] = float((found & (neg_score > pos_score)).sum())
   features['pos_ratio'] = features['pos_ratio'] / w_count if w_count else 0 
   features['neg_ratio'] = features['neg_ratio'] / w_count if w_count else 0
     
@@ -249,43 +417,100 @@ def group_reviews_by_product(reviews):
   return grouped_reviews
 
 
-def calculate_kl_divergence(train_reviews, reviews):
+def get_term_matrix(r_ids, get_counts):
+  """ Builds a sparse review x term matrix of word counts, interning the
+      vocabulary once.
+
+      Args:
+        r_ids: a list of review ids, defining the row order.
+        get_counts: a function which receives a review id and returns a
+      dictionary of word counts.
+
+      Returns:
+        A CSR matrix with one row per review and one column per distinct word.
+  """
+  vocabulary = {}
+  indptr = [0]
+  indices = []
+  data = []
+  for r_id in r_ids:
+    counts = get_counts(r_id)
+    for word in counts:
+      indices.append(vocabulary.setdefault(word, len(vocabulary)))
+      data.append(counts[word])
+    indptr.append(len(indices))
+  return csr_matrix((array(data, dtype=float64), array(indices, dtype=int32),
+      array(indptr, dtype=int32)), shape=(len(r_ids), len(vocabulary)))
+
+
+def normalize_rows(matrix):
+  """ Normalizes each row of a sparse matrix to sum to one, leaving empty rows
+      as zeros.
+
+      Args:
+        matrix: a CSR matrix with non-negative values.
+
+      Returns:
+        A pair with the normalized CSR matrix and an array with the number of
+      non-zero entries of each row.
+  """
+  totals = array(matrix.sum(axis=1)).ravel()
+  totals[totals == 0] = 1.0
+  return diags(1.0 / totals).dot(matrix).tocsr(), matrix.getnnz(axis=1)
+
+
+def calculate_kl_divergence(train_reviews, reviews, cache=None):
   """ Calculates KL divergence between unigram models of review's text and all
       reviews' texts from the corresponding product.
 
+      The unigram models are rows of a sparse review x term matrix and the
+      training unigram of each product is obtained by summing its training rows,
+      so that all divergences are computed at once over the non-zero entries.
+      A review out of training is compared to its product model added to the
+      review's unigram (refer to add_unigrams).
+
       Args:
         train_reviews: a set of reviews which are in training set.
         reviews: a dictionary of reviews.
+        cache: optional dictionary of text features cache entries, whose word
+      counts are used instead of the texts.
 
       Returns:
         None. The KL divergence value is create in each review dictionary under
       the key 'kl'.
   """
-  grouped_reviews = group_reviews_by_product(reviews)
-  for product in grouped_reviews:
-    avg_unigram = {}
-    avg_text = ""
-    for review in grouped_reviews[product]:
-      review['unigram'] = get_unigram_model(review['text'])
-      if review['id'] in train_reviews:
-        avg_text += " " + review['text'] # average only relative to train
-    avg_unigram = get_unigram_model(avg_text)
-    for review in grouped_reviews[product]:
-      if review['id'] in train_reviews:
-        review['kl'] = 0
-        for word in review['unigram']:
-          review['kl'] += review['unigram'][word] * log(review['unigram'][word] /
-              avg_unigram[word])
-        review.pop('unigram', None)
-      else:
-        # if review is in test, than it is like there is just this review
-        # and the others from training set 
-        review['kl'] = 0
-        new_avg_unigram = add_unigrams(avg_unigram, review['unigram'])
-        for word in review['unigram']:
-          review['kl'] += review['unigram'][word] * log(review['unigram'][word] /
-              new_avg_unigram[word])
-        review.pop('unigram', None)
+  r_ids = reviews.keys()
+  if cache is not None:
+    get_counts = lambda r_id: cache[r_id]['unigram']
+  else:
+    get_counts = lambda r_id: get_unigram_counts(reviews[r_id]['text'])
+  counts = get_term_matrix(r_ids, get_counts)
+  unigrams, n_review = normalize_rows(counts)
+  products = {}
+  product_idx = array([products.setdefault(reviews[r_id]['product'],
+      len(products)) for r_id in r_ids], dtype=int32)
+  is_train = array([r_id in train_reviews for r_id in r_ids], dtype=bool)
+  train_rows = is_train.nonzero()[0]
+  grouping = csr_matrix((ones(len(train_rows)), (product_idx[train_rows],
+      train_rows)), shape=(len(products), len(r_ids)))
+  avg_unigrams, n_avg = normalize_rows(grouping.dot(counts).tocsr())
+
+  entries = unigrams.tocoo()
+  rows, cols, p = entries.row, entries.col, entries.data
+  q = array(avg_unigrams[product_idx[rows], cols]).ravel()
+  held_out = ~is_train[rows]
+  if held_out.any():
+    # adds the review's unigram to its product model, weighting each one by its
+    # vocabulary size, as in add_unigrams
+    shared = bincount(rows[held_out], weights=(q[held_out] > 0),
+        minlength=len(r_ids))
+    n_a = n_avg[product_idx[rows[held_out]]]
+    n_b = n_review[rows[held_out]]
+    n_new = n_a + n_b - shared[rows[held_out]]
+    q[held_out] = (q[held_out] * n_a + p[held_out] * n_b) / n_new
+  kl = bincount(rows, weights=p * np_log(p / q), minlength=len(r_ids))
+  for i, r_id in enumerate(r_ids):
+    reviews[r_id]['kl'] = kl[i]
 
 
 def add_unigrams(unigram_a, unigram_b):
@@ -346,29 +571,51 @@ def calculate_kl_divergence_db(train_reviews):
       reviews_db.update({'_id': review["_id"]} , {"$set": review}, upsert=True)
 
 
-def get_unigram_model(text):
-  """ Gets an unigram model for a given text.
-      
-     Args:
-        text: a string with the text to get the model of.
+def get_unigram_counts(text):
+  """ Gets the word counts of a given text.
+
+      Args:
+        text: a string with the text to count words of.
 
       Returns:
-        A dictionary with the frequencies :of words.
+        A dictionary with the counts (floats) of words.
   """
-  unigram = {}
+  counts = {}
   text =  text.replace(".", " ")
   text_blob = TextBlob(text)
 
   for word in text_blob.words:
-    if word.decode() not in unigram:
-      unigram[word.decode()] = 0.0
-    unigram[word.decode()] += 1.0
+    if word.decode() not in counts:
+      counts[word.decode()] = 0.0
+    counts[word.decode()] += 1.0
 
-  for word in unigram:
-    unigram[word] = unigram[word] / len(text_blob.words) if \
-        len(text_blob.words) else 0
+  return counts
 
-  return unigram
+
+def normalize_unigram(counts):
+  """ Gets an unigram model from word counts.
+
+      Args:
+        counts: a dictionary with the counts of words.
+
+      Returns:
+        A dictionary with the frequencies of words.
+  """
+  total = sum(counts.values())
+  return {word: counts[word] / total for word in counts} if total else \
+      dict.fromkeys(counts, 0)
+
+
+def get_unigram_model(text):
+  """ Gets an unigram model for a given text.
+      
+     Args:
+        text: a string with the text to get the model of.
+
+      Returns:
+        A dictionary with the frequencies :of words.
+  """
+  return normalize_unigram(get_unigram_counts(text))
 
 
 def model_products(train_reviews, reviews):
@@ -458,33 +705,34 @@ def calculate_rel_rating_db(train_reviews, reviews):
         products[product]['avg_rating']
 
 
-def model_reviews_parallel(num_threads, train, reviews):
-  """ Models reviews in parallel using num_threads threads.
+def model_reviews_parallel(num_threads, train, reviews, cache=None):
+  """ Models reviews in parallel using num_threads threads. Text-only features
+      are taken from the cache, being computed only for missing reviews, and
+      only split-dependent features (kl, rel_rating and avg_vote) are
+      calculated regarding the training set.
 
       Args:
         num_threads: number of parallel jobs.
         train: a list of votes in training set.
         reviews: dictionary with parsed raw reviews to add features in. 
+        cache: dictionary of text features cache entries, indexed by review id,
+      which is shared across calls (refer to load_text_cache).
 
       Returns:
-        None. Changes are made in place in reviews dictionary. 
+        None. Changes are made in place in reviews dictionary and cache. 
   """
-  texts = [(r_id, reviews[r_id]['text']) for r_id in reviews]
-
-  pool = Pool(processes=num_threads)
-  chunk_size = int(ceil(len(texts) / num_threads))
-  result = pool.imap_unordered(model_review_text, iter(texts), chunk_size)
-  pool.close()
-  pool.join()
-  result = [r for r in result]
+  if cache is None:
+    cache = {}
+  update_text_cache(num_threads, reviews, cache)
+  for r_id in reviews:
+    features = cache[r_id]['features']
+    for feat in features:
+      reviews[r_id][feat] = features[feat]
   train_reviews = set([vote['review'] for vote in train])
-  for r_id, r_dict in result:
-    for feat in r_dict:
-      reviews[r_id][feat] = r_dict[feat]
   if _USE_DB:
     calculate_kl_divergence_db(train_reviews)
     calculate_rel_rating_db(train_reviews)
   else:
-    calculate_kl_divergence(train_reviews, reviews)  
+    calculate_kl_divergence(train_reviews, reviews, cache)  
     calculate_rel_rating(train_reviews, reviews)
   calculate_avg_vote(train_reviews, reviews)
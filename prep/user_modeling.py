@@ -9,10 +9,21 @@
 """
 
 
-from numpy import std, mean, nan, isnan
-from networkx import pagerank
+from time import time
 
-from util.aux import cosine, vectorize
+from numpy import std, nan, isnan, sqrt, array, arange, repeat, diff, \
+    float64, int32, int64, split, argsort, nonzero, zeros, bincount, \
+    errstate, where, ones
+from numpy.random import RandomState
+from scipy.sparse import csr_matrix, diags
+
+from lib.trust.analytics import TrustAnalytics
+
+
+_BLOCK_SIZE = 1000
+_NUM_TABLES = 8
+_NUM_BITS = 12
+_SAMPLE_SIZE = 1000
 
 
 def create_user(user_id):
@@ -50,7 +61,9 @@ def create_user(user_id):
 
 
 def add_user_rating(user, rating, rel_rating, product):
-  """ Adds user rating, updating related features.
+  """ Adds user rating, updating related features. The rating of a product
+      replaces a previous one, thus reviews of a user must be added in
+      increasing id order, so that the latest review of a product is kept.
 
       Args:
         user: a dictionary of the users whose fields must be updated.
@@ -129,8 +142,30 @@ def finalize_vote_related_features(users):
           if users[user]['num_votes_giv'] > 1 else 0.0
 
 
-def calculate_network_agg_features(users, trusts):
+def get_neighbour_means(neighbours, values):
+  """ Calculates the mean value of neighbours of each user, ignoring missing
+      values, as a masked sparse matrix-vector product.
+
+      Args:
+        neighbours: a sparse user x user matrix with the multiplicity of each
+      neighbour (column) of each user (row).
+        values: an array with the value of each user, nan if missing.
+
+      Returns:
+        An array with the mean of each user, nan if no neighbour has a value.
+  """
+  known = ~isnan(values)
+  sums = neighbours.dot(where(known, values, 0.0))
+  counts = neighbours.dot(known.astype(float64))
+  with errstate(divide='ignore', invalid='ignore'):
+    return where(counts > 0, sums / counts, nan)
+
+
+def calculate_network_agg_features(users, trusts, analytics=None):
   """ Calculates aggregated features from immediate social network of user.
+      Neighbours are summed up over the sparse adjacency matrix of users, in
+      which trustors and trustees form the direct network and trustees, the
+      trust network.
 
       Observation:
       - nan encodes missing values.
@@ -138,51 +173,57 @@ def calculate_network_agg_features(users, trusts):
       Args:
         users: dictionary of users.
         trusts: nx.Digraph object with trust network.
+        analytics: an optional TrustAnalytics object of trusts, computed if not
+      given.
 
       Returns:
         None. Changes are made in users dictionary.
   """
-  for u_id in users:
-    if u_id not in trusts:
-      users[u_id]['avg_rating_dir_net'] = nan 
-      users[u_id]['avg_help_giv_tru_net'] = nan
-      continue 
-    direct_net = trusts.predecessors(u_id) + trusts.successors(u_id)
-    trust_net = trusts.successors(u_id)
-    dir_net_avg = [users[n]['avg_rating'] for n in direct_net if n in users
-        and not isnan(users[n]['avg_rating'])]
-    users[u_id]['avg_rating_dir_net'] = mean(dir_net_avg) if dir_net_avg else nan 
-    tru_net_avg = [users[n]['avg_help_giv'] for n in trust_net if n in users
-        and not isnan(users[n]['avg_help_giv'])]
-    users[u_id]['avg_help_giv_tru_net'] = mean(tru_net_avg) if tru_net_avg \
-        else nan
-
-
-def calculate_trust_features(users, test_users, trusts):
+  if analytics is None:
+    analytics = TrustAnalytics(trusts)
+  u_ids = users.keys()
+  trust_net = analytics.get_user_adjacency(u_ids)
+  direct_net = trust_net + trust_net.T
+  avg_rating = array([users[u_id]['avg_rating'] for u_id in u_ids],
+      dtype=float64)
+  avg_help_giv = array([users[u_id]['avg_help_giv'] for u_id in u_ids],
+      dtype=float64)
+  dir_net_avg = get_neighbour_means(direct_net, avg_rating).tolist()
+  tru_net_avg = get_neighbour_means(trust_net, avg_help_giv).tolist()
+  for i, u_id in enumerate(u_ids):
+    in_network = u_id in analytics
+    users[u_id]['avg_rating_dir_net'] = dir_net_avg[i] if in_network else nan
+    users[u_id]['avg_help_giv_tru_net'] = tru_net_avg[i] if in_network else nan
+
+
+def calculate_trust_features(users, test_users, trusts, analytics=None):
   """ Calculates features related to statistics of user in the trust network.
+      Users in test without votes in train but in the trust network are added
+      as cold-start users, with finalized vote related features.
 
       Args:
         users: dictionary of users.
         test_users: ids of users which are in test.
         trusts: nx.Digraph object with trust network.
+        analytics: an optional TrustAnalytics object of trusts, computed if not
+      given.
 
       Returns:
         None. Changes are made in users dictionary.
   """
+  if analytics is None:
+    analytics = TrustAnalytics(trusts)
+  cold_start = {}
   for user in trusts: 
     if user not in users and user in test_users:
       # cold-start in test but in trust network
-      users[user] = create_user(user)
-  prank = pagerank(trusts)
+      cold_start[user] = create_user(user)
+  finalize_vote_related_features(cold_start)
+  users.update(cold_start)
   for user in users:
-    if user not in trusts:
-      users[user]['num_trustors'] = 0 
-      users[user]['num_trustees'] = 0 
-      users[user]['pagerank'] = 0
-    else:
-      users[user]['num_trustors'] = trusts.in_degree(user)
-      users[user]['num_trustees'] = trusts.out_degree(user)
-      users[user]['pagerank'] = prank[user]
+    users[user]['num_trustors'] = analytics.get_value('in_degree', user, 0)
+    users[user]['num_trustees'] = analytics.get_value('out_degree', user, 0)
+    users[user]['pagerank'] = analytics.get_value('pagerank', user, 0)
 
 
 def group_votes_by_review(votes):
@@ -206,7 +247,8 @@ def group_votes_by_review(votes):
 
 
 def calculate_similar_agg_features(users):
-  """ Calculates aggregated features related to similar users.
+  """ Calculates aggregated features related to similar users, as masked sparse
+      matrix-vector products over the matrix of similar users.
       
       Args:
         users: dictionary of users.
@@ -214,43 +256,608 @@ def calculate_similar_agg_features(users):
       Returns:
         None. Changes are made in users dictionary.
   """
-  for user in users:
-    sim_avg = [users[s]['avg_rating'] for s in users[user]['similars']
-        if not isnan(users[s]['avg_rating'])]
-    users[user]['avg_rating_sim'] = mean(sim_avg) if sim_avg else nan 
-    sim_avg = [users[s]['avg_help_giv'] for s in users[user]['similars']
-        if not isnan(users[s]['avg_help_giv'])]
-    users[user]['avg_help_giv_sim'] = mean(sim_avg) if sim_avg else nan 
+  u_ids = users.keys()
+  index = {u_id: i for i, u_id in enumerate(u_ids)}
+  rows = [i for i, u_id in enumerate(u_ids) for _ in users[u_id]['similars']]
+  cols = [index[s] for u_id in u_ids for s in users[u_id]['similars']]
+  similars = csr_matrix((ones(len(rows)), (array(rows, dtype=int32),
+      array(cols, dtype=int32))), shape=(len(u_ids), len(u_ids)))
+  avg_rating = array([users[u_id]['avg_rating'] for u_id in u_ids],
+      dtype=float64)
+  avg_help_giv = array([users[u_id]['avg_help_giv'] for u_id in u_ids],
+      dtype=float64)
+  sim_rating = get_neighbour_means(similars, avg_rating).tolist()
+  sim_help_giv = get_neighbour_means(similars, avg_help_giv).tolist()
+  for i, u_id in enumerate(u_ids):
+    users[u_id]['avg_rating_sim'] = sim_rating[i]
+    users[u_id]['avg_help_giv_sim'] = sim_help_giv[i]
+
+
+def get_rating_matrix(users):
+  """ Builds a sparse user x product matrix of ratings.
 
+      Args:
+        users: a dictionary of users.
+
+      Returns:
+        A pair with the list of user ids, defining the row order, and a CSR
+      matrix with the ratings, having one column per distinct product.
+  """
+  u_ids = users.keys()
+  products = {}
+  indptr = [0]
+  indices = []
+  data = []
+  for user in u_ids:
+    ratings = users[user]['ratings']
+    for product in ratings:
+      indices.append(products.setdefault(product, len(products)))
+      data.append(ratings[product])
+    indptr.append(len(indices))
+  return u_ids, csr_matrix((array(data, dtype=float64), array(indices,
+      dtype=int32), array(indptr, dtype=int32)), shape=(len(u_ids),
+      len(products)))
+
+
+def get_norms(ratings):
+  """ Gets the euclidean norm of each row of a sparse matrix.
+
+      Args:
+        ratings: a CSR user x product matrix of ratings.
 
-def calculate_similar_users(users):
+      Returns:
+        An array with the norms.
+  """
+  return sqrt(array(ratings.multiply(ratings).sum(axis=1)).ravel())
+
+
+def iter_similarity_blocks(ratings, block_size=_BLOCK_SIZE):
+  """ Calculates cosine similarities of users against all users, a block of
+      rows at a time. Users without ratings have null similarity with everyone.
+
+      Args:
+        ratings: a CSR user x product matrix of ratings.
+        block_size: the number of users per block.
+
+      Returns:
+        An iterator of pairs with the index of the first user of the block and a
+      CSR matrix with the similarities of the users of the block (rows) with
+      all users (columns). Missing entries are null similarities.
+  """
+  norms = get_norms(ratings)
+  transposed = ratings.T.tocsc()
+  for start in xrange(0, ratings.shape[0], block_size):
+    block = ratings[start:start+block_size].dot(transposed).tocsr()
+    block.eliminate_zeros()
+    rows = repeat(arange(block.shape[0]), diff(block.indptr))
+    block.data /= norms[rows + start] * norms[block.indices]
+    yield start, block
+
+
+def calculate_similar_users(users, block_size=_BLOCK_SIZE):
   """ Gets similar users for each user. A user B is amongst user A similar users
       if their cosine rating similarity is higher than the average similarity of
       A with all the users.
 
+      Similarities are obtained by sparse matrix products over blocks of users,
+      from which only the average and the similar users are kept.
+
       Args:
         users: a dictionary of users, containing user ids as keys and user
           dictionaries as values.
+        block_size: the number of users whose similarities are held in memory
+          at once.
 
       Returns:
         None. Changes are made in place by adding a 'similars' key in each user
       dictionary with a list of similar users' ids.
   """
-  sim = {}
-  for user in users:
-    sim[user] = {}
-  for user_a in users:
-    a_ratings = users[user_a]['ratings']
-    for user_b in [u for u in users if u > user_a]:
-      b_ratings = users[user_b]['ratings']
-      vec_a, vec_b = vectorize(a_ratings, b_ratings)
-      sim[user_a][user_b] = sim[user_b][user_a] = cosine(vec_a, vec_b)
-  for user in users:
-    avg = mean(sim[user].values())
-    users[user]['similars'] = set([u for u in sim[user] if sim[user][u] > avg])
+  u_ids, ratings = get_rating_matrix(users)
+  if len(u_ids) < 2:
+    for user in u_ids:
+      users[user]['similars'] = set()
+    return
+  for start, block in iter_similarity_blocks(ratings, block_size):
+    num_rows = block.shape[0]
+    self_sim = block.diagonal(k=start)
+    avg = (array(block.sum(axis=1)).ravel() - self_sim) / (len(u_ids) - 1)
+    rows = repeat(arange(num_rows), diff(block.indptr))
+    similar = (block.data > avg[rows]) & (block.indices != rows + start)
+    bounds = block.indptr[1:-1]
+    for i, (cols, mask) in enumerate(zip(split(block.indices, bounds),
+        split(similar, bounds))):
+      users[u_ids[start+i]]['similars'] = set([u_ids[c] for c in cols[mask]])
+
+
+def normalize_ratings(ratings):
+  """ Normalizes each row of the rating matrix to unit norm, so that dot
+      products are cosines. Rows without ratings are kept null.
+
+      Args:
+        ratings: a CSR user x product matrix of ratings.
+
+      Returns:
+        A CSR matrix with the normalized ratings.
+  """
+  norms = get_norms(ratings)
+  norms[norms == 0] = 1.0
+  return diags(1.0 / norms).dot(ratings).tocsr()
+
+
+def estimate_avg_similarity(normalized, sample_size, random):
+  """ Estimates the average cosine similarity of each user with the other users
+      by a random sample of users.
+
+      Args:
+        normalized: a CSR user x product matrix of normalized ratings.
+        sample_size: the number of sampled users.
+        random: a numpy RandomState object.
+
+      Returns:
+        An array with the estimated average similarity of each user.
+  """
+  num_users = normalized.shape[0]
+  sample = random.choice(num_users, min(sample_size, num_users), replace=False)
+  sims = array(normalized.dot(normalized[sample].T).sum(axis=1)).ravel()
+  sampled = zeros(num_users, dtype=bool)
+  sampled[sample] = True
+  self_sims = array(normalized.multiply(normalized).sum(axis=1)).ravel()
+  sims[sampled] -= self_sims[sampled]
+  counts = len(sample) - sampled.astype(int)
+  counts[counts == 0] = 1
+  return sims / counts
+
+
+def add_bucket_similars(users, u_ids, normalized, bucket, avg,
+    block_size=_BLOCK_SIZE):
+  """ Adds as similar users the users of a LSH bucket whose cosine similarity
+      is higher than the average. Similarities are sparse products over blocks
+      of rows of the bucket, so that null similarities are never held.
+
+      Args:
+        users: a dictionary of users.
+        u_ids: the list of user ids, defining the row order.
+        normalized: a CSR user x product matrix of normalized ratings.
+        bucket: an array with the rows of the users in the bucket.
+        avg: an array with the average similarity of each user.
+        block_size: the number of users of the bucket per block.
+
+      Returns:
+        None. Changes are made in place in the 'similars' sets.
+  """
+  transposed = normalized[bucket].T.tocsc()
+  for start in xrange(0, len(bucket), block_size):
+    rows = bucket[start:start+block_size]
+    block = normalized[rows].dot(transposed).tocsr()
+    block.eliminate_zeros()
+    pos = repeat(arange(len(rows)), diff(block.indptr))
+    cols = bucket[block.indices]
+    similar = (block.data > avg[rows][pos]) & (cols != rows[pos])
+    for i, j in zip(rows[pos[similar]], cols[similar]):
+      users[u_ids[i]]['similars'].add(u_ids[j])
+
+
+def calculate_approximate_similar_users(users, num_tables=_NUM_TABLES,
+    num_bits=_NUM_BITS, sample_size=_SAMPLE_SIZE, seed=None,
+    block_size=_BLOCK_SIZE):
+  """ Gets approximate similar users for each user (refer to
+      calculate_similar_users). The average similarity of each user is
+      estimated by sampling and candidate neighbours are the users sharing a
+      bucket of random projection LSH in any table, whose exact similarities
+      are then compared to the average.
+
+      More tables increase recall and more bits per table reduce bucket sizes,
+      trading recall for speed; a larger sample improves the average estimate.
+
+      Args:
+        users: a dictionary of users, containing user ids as keys and user
+          dictionaries as values.
+        num_tables: the number of hash tables.
+        num_bits: the number of random hyperplanes of each table.
+        sample_size: the number of users sampled to estimate averages.
+        seed: the seed of the random generator.
+        block_size: the number of users of a bucket whose similarities are held
+          in memory at once.
+
+      Returns:
+        None. Changes are made in place by adding a 'similars' key in each user
+      dictionary with a set of similar users' ids.
+  """
+  u_ids, ratings = get_rating_matrix(users)
+  for user in u_ids:
+    users[user]['similars'] = set()
+  if len(u_ids) < 2:
+    return
+  random = RandomState(seed)
+  normalized = normalize_ratings(ratings)
+  avg = estimate_avg_similarity(normalized, sample_size, random)
+  rated = nonzero(diff(normalized.indptr))[0]
+  powers = 1 << arange(num_bits, dtype=int64)
+  for _ in xrange(num_tables):
+    planes = random.normal(size=(normalized.shape[1], num_bits))
+    codes = (normalized[rated].dot(planes) > 0).dot(powers)
+    order = argsort(codes, kind='mergesort')
+    bounds = nonzero(diff(codes[order]))[0] + 1
+    for bucket in split(rated[order], bounds):
+      if len(bucket) < 2:
+        continue
+      add_bucket_similars(users, u_ids, normalized, bucket, avg, block_size)
+
+
+def report_approximate_similar_users(users, num_tables=_NUM_TABLES,
+    num_bits=_NUM_BITS, sample_size=_SAMPLE_SIZE, seed=None):
+  """ Compares approximate similar users against the exact ones.
+
+      Args:
+        users: a dictionary of users.
+        num_tables: the number of hash tables.
+        num_bits: the number of random hyperplanes of each table.
+        sample_size: the number of users sampled to estimate averages.
+        seed: the seed of the random generator.
 
+      Returns:
+        A dictionary with keys "recall" and "precision", of approximate similar
+      pairs relative to exact ones, and "exact_time" and "approx_time", the
+      elapsed seconds of each calculation. The approximate similar users are
+      left in users dictionary.
+  """
+  start = time()
+  calculate_similar_users(users)
+  exact_time = time() - start
+  exact = {user: users[user]['similars'] for user in users}
+  start = time()
+  calculate_approximate_similar_users(users, num_tables, num_bits, sample_size,
+      seed)
+  approx_time = time() - start
+  hits = sum(len(exact[user] & users[user]['similars']) for user in users)
+  num_exact = sum(len(exact[user]) for user in users)
+  num_approx = sum(len(users[user]['similars']) for user in users)
+  report = {}
+  report['recall'] = float(hits) / num_exact if num_exact else 1.0
+  report['precision'] = float(hits) / num_approx if num_approx else 1.0
+  report['exact_time'] = exact_time
+  report['approx_time'] = approx_time
+  return report
+
+
+class UserStatistics(object):
+  """ Mergeable sufficient statistics of users over a set of training votes:
+      authored reviews, counts, sums and sums of squares of votes received and
+      given. The set of votes may be changed by adding and removing votes, so
+      that sliding windows of votes are modeled without aggregating all votes
+      again.
+
+      Args:
+        self: the UserStatistics object.
+        reviews: a dictionary with modeled reviews, whose "rel_rating" may
+      change between updates.
+  """
 
-def model_users(reviews, train, test_users, trusts):
+  def __init__(self, reviews):
+    self.reviews = reviews
+    self.votes = {}
+    self.review_count = {}
+    self.review_sum = {}
+    self.review_voters = {}
+    self.authored = {}
+    self.rec = {}
+    self.giv = {}
+
+  def update(self, train):
+    """ Changes the set of modeled votes to the given one, removing votes which
+        left and adding votes which entered the set. Votes are identified by
+        object identity, thus consecutive sets should share vote dictionaries.
+
+        Args:
+          self: the UserStatistics object.
+          train: a list of votes used as train.
+
+        Returns:
+          None. The statistics are updated in place.
+    """
+    train = {id(vote): vote for vote in train}
+    removed = [self.votes[v] for v in self.votes if v not in train]
+    added = [train[v] for v in train if v not in self.votes]
+    touched = set([vote['review'] for vote in removed + added])
+    for r_id in touched:
+      self._add_review_avg(r_id, -1.0)
+    for vote in removed:
+      self._add_vote(vote, -1)
+    for vote in added:
+      self._add_vote(vote, 1)
+    for r_id in touched:
+      self._add_review_avg(r_id, 1.0)
+    self.votes = train
+
+  def _add_vote(self, vote, sign):
+    """ Adds or removes a vote from the statistics.
+
+        Args:
+          self: the UserStatistics object.
+          vote: a vote dictionary.
+          sign: 1 for adding and -1 for removing.
+
+        Returns:
+          None. The statistics are updated in place.
+    """
+    r_id = vote['review']
+    author = self.reviews[r_id]['author']
+    voter = vote['voter']
+    value = int(vote['vote'])
+    self.review_count[r_id] = self.review_count.get(r_id, 0) + sign
+    self.review_sum[r_id] = self.review_sum.get(r_id, 0) + sign * value
+    voters = self.review_voters.setdefault(r_id, {})
+    voters[voter] = voters.get(voter, 0) + sign
+    if not voters[voter]:
+      del voters[voter]
+    if not self.review_count[r_id]:
+      del self.review_count[r_id], self.review_sum[r_id], \
+          self.review_voters[r_id]
+      self.authored[author].discard(r_id)
+    else:
+      self.authored.setdefault(author, set()).add(r_id)
+    self._add_stats(self.rec, author, value, sign)
+    self._add_stats(self.giv, voter, value, sign)
+
+  def _add_stats(self, stats, user, value, sign):
+    """ Adds or removes a vote value from the statistics of a user.
+
+        Args:
+          self: the UserStatistics object.
+          stats: the dictionary of statistics of votes received or given.
+          user: the id of the user.
+          value: the vote value.
+          sign: 1 for adding and -1 for removing.
+
+        Returns:
+          None. The statistics are updated in place.
+    """
+    if user not in stats:
+      stats[user] = {'count': 0, 'sum': 0, 'sq_sum': 0, 'avg_sum': 0.0}
+    stats[user]['count'] += sign
+    stats[user]['sum'] += sign * value
+    stats[user]['sq_sum'] += sign * value * value
+
+  def _add_review_avg(self, r_id, sign):
+    """ Adds or removes the average vote of a review to the sum of review
+        averages of each of its voters, used by the relative helpfulness given.
+
+        Args:
+          self: the UserStatistics object.
+          r_id: the id of the review.
+          sign: 1.0 for adding and -1.0 for removing.
+
+        Returns:
+          None. The statistics are updated in place.
+    """
+    if r_id not in self.review_count:
+      return
+    avg_help = float(self.review_sum[r_id]) / self.review_count[r_id]
+    for voter, count in self.review_voters[r_id].iteritems():
+      self.giv[voter]['avg_sum'] += sign * count * avg_help
+
+  def get_users(self):
+    """ Gets the users with finalized vote related features, as produced by
+        aggregating the current votes from scratch.
+
+        Args:
+          self: the UserStatistics object.
+
+        Returns:
+          A dictionary of users indexed by user ids.
+    """
+    users = {}
+    for author in self.authored.keys():
+      if not self.authored[author]:
+        del self.authored[author]
+        continue
+      user = users[author] = create_user(author)
+      for r_id in sorted(self.authored[author]):
+        review = self.reviews[r_id]
+        add_user_rating(user, review['rating'], review['rel_rating'],
+            review['product'])
+    for stats in [self.rec, self.giv]:
+      for u_id in stats.keys():
+        if not stats[u_id]['count']:
+          del stats[u_id]
+        elif u_id not in users:
+          users[u_id] = create_user(u_id)
+    finalize_vote_related_features(users)
+    for u_id in users:
+      user = users[u_id]
+      for field, stats in [('rec', self.rec), ('giv', self.giv)]:
+        if u_id not in stats:
+          continue
+        count, total = stats[u_id]['count'], stats[u_id]['sum']
+        user['num_votes_%s' % field] = count
+        user['avg_help_%s' % field] = float(total) / count
+        user['sd_help_%s' % field] = get_sample_std(count, total,
+            stats[u_id]['sq_sum'])
+      if u_id in self.giv:
+        user['avg_rel_help_giv'] = (self.giv[u_id]['sum'] -
+            self.giv[u_id]['avg_sum']) / self.giv[u_id]['count']
+    return users
+
+
+def get_sample_std(count, total, sq_total):
+  """ Gets the sample standard deviation (ddof=1) from sufficient statistics.
+
+      Args:
+        count: the number of values.
+        total: the sum of values.
+        sq_total: the sum of squared values.
+
+      Returns:
+        A float with the standard deviation, which is zero for a single value.
+  """
+  if count < 2:
+    return 0.0
+  variance = (sq_total - float(total) * total / count) / (count - 1)
+  return sqrt(variance) if variance > 0 else 0.0
+
+
+class UserTable(object):
+  """ Struct-of-arrays table of user features derived from train votes. Users
+      are interned into int indices and each vote related feature is a float
+      array indexed by them, computed by grouped reductions. Missing values are
+      nan, as in finalize_vote_related_features. When an author has several
+      reviews of a product, the ratings map keeps the one with greatest id, as
+      add_user_rating.
+  """
+
+  _FEATURES = ['num_reviews', 'avg_rating', 'avg_rel_rating', 'sd_rating',
+      'num_votes_rec', 'avg_help_rec', 'sd_help_rec', 'num_votes_giv',
+      'avg_help_giv', 'avg_rel_help_giv', 'sd_help_giv']
+
+  def __init__(self, reviews, train):
+    """ Aggregates train votes and the ratings of voted reviews into the table.
+
+        Args:
+          reviews: a dictionary with modeled reviews.
+          train: a list of votes used as train.
+
+        Returns:
+          None.
+    """
+    self.ids = []
+    self._index = {}
+    review_index = {}
+    review_ids = []
+    vote_review = []
+    vote_voter = []
+    vote_value = []
+    for vote in train:
+      if vote['review'] not in review_index:
+        review_index[vote['review']] = len(review_ids)
+        review_ids.append(vote['review'])
+      vote_review.append(review_index[vote['review']])
+      vote_voter.append(self._intern(vote['voter']))
+      vote_value.append(float(vote['vote']))
+    review_author = array([self._intern(reviews[r_id]['author']) for r_id in
+        review_ids], dtype=int32)
+    vote_review = array(vote_review, dtype=int32)
+    vote_voter = array(vote_voter, dtype=int32)
+    vote_value = array(vote_value, dtype=float64)
+    vote_author = review_author[vote_review]
+    num_users = len(self.ids)
+
+    review_help = group_mean(vote_review, vote_value, len(review_ids))
+    vote_rel_help = vote_value - review_help[vote_review]
+
+    self.num_reviews = bincount(review_author, minlength=num_users)
+    ratings = [float(reviews[r_id]['rating']) for r_id in review_ids]
+    rel_ratings = array([reviews[r_id]['rel_rating'] for r_id in review_ids],
+        dtype=float64)
+    self.avg_rating = group_mean(review_author, array(ratings), num_users)
+    self.avg_rel_rating = group_mean(review_author, rel_ratings, num_users)
+    self.ratings = [{} for _ in xrange(num_users)]
+    for r_id, author, rating in sorted(zip(review_ids, review_author,
+        ratings)):
+      self.ratings[author][reviews[r_id]['product']] = rating
+    map_author = array([u for u in xrange(num_users) for _ in
+        self.ratings[u]], dtype=int32)
+    map_rating = array([r for u in xrange(num_users) for r in
+        self.ratings[u].itervalues()], dtype=float64)
+    self.sd_rating = group_std(map_author, map_rating, num_users)
+    map_count = bincount(map_author, minlength=num_users)
+    self.sd_rating[(self.num_reviews > 1) & (map_count == 1)] = nan
+    self.sd_rating[self.num_reviews == 1] = 0.0
+
+    self.num_votes_rec = bincount(vote_author, minlength=num_users)
+    self.avg_help_rec = group_mean(vote_author, vote_value, num_users)
+    self.sd_help_rec = group_std(vote_author, vote_value, num_users)
+    self.num_votes_giv = bincount(vote_voter, minlength=num_users)
+    self.avg_help_giv = group_mean(vote_voter, vote_value, num_users)
+    self.avg_rel_help_giv = group_mean(vote_voter, vote_rel_help, num_users)
+    self.sd_help_giv = group_std(vote_voter, vote_value, num_users)
+
+  def __len__(self):
+    """ Gets the number of users in the table.
+
+        Args:
+          None.
+
+        Returns:
+          An integer with the number of users.
+    """
+    return len(self.ids)
+
+  def _intern(self, user):
+    """ Interns a user id into an integer index.
+
+        Args:
+          user: the id of the user.
+
+        Returns:
+          An integer with the index of the user.
+    """
+    if user not in self._index:
+      self._index[user] = len(self.ids)
+      self.ids.append(user)
+    return self._index[user]
+
+  def to_dicts(self):
+    """ Exports the table to the dictionary format of model_users.
+
+        Args:
+          None.
+
+        Returns:
+          A dictionary of users indexed by user ids.
+    """
+    users = {}
+    columns = [(feat, getattr(self, feat).tolist()) for feat in self._FEATURES]
+    for i, u_id in enumerate(self.ids):
+      user = users[u_id] = create_user(u_id)
+      for feat, values in columns:
+        user[feat] = values[i]
+      user['ratings'] = self.ratings[i]
+    return users
+
+
+def group_mean(groups, values, num_groups):
+  """ Calculates the mean of values by group.
+
+      Args:
+        groups: an int array with the group of each value.
+        values: a float array of values.
+        num_groups: the number of groups.
+
+      Returns:
+        A float array with the mean of each group, nan for empty groups.
+  """
+  counts = bincount(groups, minlength=num_groups)
+  sums = bincount(groups, weights=values, minlength=num_groups)
+  with errstate(divide='ignore', invalid='ignore'):
+    return where(counts > 0, sums / counts, nan)
+
+
+def group_std(groups, values, num_groups):
+  """ Calculates the sample standard deviation (ddof=1) of values by group, in
+      two passes as numpy.std.
+
+      Args:
+        groups: an int array with the group of each value.
+        values: a float array of values.
+        num_groups: the number of groups.
+
+      Returns:
+        A float array with the deviation of each group, zero for groups with a
+      single value and nan for empty groups.
+  """
+  counts = bincount(groups, minlength=num_groups)
+  means = group_mean(groups, values, num_groups)
+  squares = bincount(groups, weights=(values - means[groups]) ** 2,
+      minlength=num_groups)
+  with errstate(divide='ignore', invalid='ignore'):
+    deviations = sqrt(squares / (counts - 1))
+  deviations[counts == 1] = 0.0
+  deviations[counts == 0] = nan
+  return deviations
+
+
+def model_users(reviews, train, test_users, trusts, approximate=False,
+    statistics=None, analytics=None):
   """ Models users, aggregating information from reviews and trust relations.
 
       Args:
@@ -258,33 +865,43 @@ def model_users(reviews, train, test_users, trusts):
         train: a list of votes used as train.
         test_users: a list of ids of users which are in test set.
         trusts: a networkx DiGraph object.
+        approximate: whether to find similar users approximately, by LSH (refer
+      to calculate_approximate_similar_users).
+        statistics: an optional UserStatistics object, kept across calls, which
+      is updated to train votes instead of aggregating them from scratch.
+        analytics: an optional TrustAnalytics object of trusts, shared across
+      calls.
 
       Returns:
         A dictionary of users indexed by user ids.
   """
-  users = {}
-
-  grouped_train = group_votes_by_review(train)
-  for review_id in grouped_train:
-    review = reviews[review_id]
-    if review['author'] not in users:
-      rev_dict = create_user(review['author'])
-      users[review['author']] = rev_dict
-    add_user_rating(users[review['author']], review['rating'],
-        review['rel_rating'], review['product'])
-    avg_help = float(sum([v['vote'] for v in grouped_train[review_id]])) / \
-        len(grouped_train[review_id])
-    for vote in grouped_train[review_id]:
-      if vote['voter'] not in users:
-        rat_dict = create_user(vote['voter'])
-        users[vote['voter']] = rat_dict
-      add_user_vote(users[review['author']], users[vote['voter']], vote['vote'],
-          avg_help)
-  calculate_trust_features(users, test_users, trusts)
-  finalize_vote_related_features(users)
-  calculate_network_agg_features(users, trusts)
-  calculate_similar_users(users)
+  if analytics is None:
+    analytics = TrustAnalytics(trusts)
+  if statistics is not None:
+    statistics.update(train)
+    users = statistics.get_users()
+  else:
+    users = aggregate_users(reviews, train)
+  calculate_trust_features(users, test_users, trusts, analytics)
+  calculate_network_agg_features(users, trusts, analytics)
+  if approximate:
+    calculate_approximate_similar_users(users)
+  else:
+    calculate_similar_users(users)
   calculate_similar_agg_features(users)
 
   return users
 
+
+def aggregate_users(reviews, train):
+  """ Aggregates votes and ratings of users in train votes.
+
+      Args:
+        reviews: a dictionary with modeled reviews.
+        train: a list of votes used as train.
+
+      Returns:
+        A dictionary of users indexed by user ids, with finalized vote related
+      features.
+  """
+  return UserTable(reviews, train).to_dicts()
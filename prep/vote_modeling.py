@@ -11,8 +11,11 @@
 
 from math import ceil
 from datetime import datetime
-from random import shuffle
 
+from numpy import array, int32
+
+
+_DATE_FORMAT = '%d.%m.%Y'
 _SLIDE = 0.1
 _SPLITS = 5
 _TRAIN_RATIO = 0.4
@@ -44,30 +47,49 @@ def model_votes(reviews):
   return votes
 
 
+def get_date_ordinals(votes):
+  """ Gets the date ordinal of each vote, parsing each distinct date once.
+
+      Args:
+        votes: list of modeled votes, represented as dictionaries.
+
+      Returns:
+        An int array with the proleptic Gregorian ordinal of the date of each
+      vote.
+  """
+  ordinals = {}
+  for vote in votes:
+    if vote['date'] not in ordinals:
+      ordinals[vote['date']] = datetime.strptime(vote['date'],
+          _DATE_FORMAT).toordinal()
+  return array([ordinals[vote['date']] for vote in votes], dtype=int32)
+
+
 def split_votes(votes):
-  """ Splits votes between train and test sets. They are sorted chronologically
-      (by review date) and the first half is used for train and the second,
-      for test.
+  """ Sorts votes chronologically (by review date) and splits them in sliding
+      windows, each one divided between train, validation and test sets. Sets
+      are ranges over the sorted votes, so that votes are stored only once.
 
       Args:
         votes: list of modeled votes, represented as dictionaries.
 
       Returns:
-        Three lists of vote dictionaries, the first representing the train set
-      with 50% of votes, the second representing the validation set with 10% of
-      votes, and the third is the test set with 40% of votes.
+        A pair with the list of votes in chronological order and the list of
+      splits, each a dictionary from set type ('train', 'validation' and
+      'test') to a (start, stop) range of votes. In each window, the train set
+      has 40% of votes, the validation set has 10% and the test set has the
+      remaining 50%.
   """
-  votes = sorted(votes, key=lambda v: datetime.strptime(v['date'], '%d.%m.%Y'))
-  sets = []
+  ordinals = get_date_ordinals(votes)
+  votes = [votes[i] for i in ordinals.argsort(kind='mergesort')] # stable
+  splits = []
   size = len(votes)
   delta = int(ceil(size * _SLIDE))
   w_size = size - delta * (_SPLITS - 1)
   for i in xrange(_SPLITS):
     start = delta * i
-    window = votes[start:start+w_size]
-    train_cut = int(ceil(w_size * _TRAIN_RATIO))
+    train_cut = start + int(ceil(w_size * _TRAIN_RATIO))
     val_cut = train_cut + int(ceil(w_size * _VAL_RATIO))
-    set_split = window[:train_cut], window[train_cut:val_cut], \
-        window[val_cut:]
-    sets.append(set_split)
-  return sets 
+    splits.append({'train': (start, train_cut), 'validation': (train_cut,
+        val_cut), 'test': (val_cut, start + w_size)})
+  return votes, splits
@@ -1,8 +1,15 @@
-from pickle import load, dump
+from pickle import load
 
+from numpy import array, int32
+
+from util.splits import load_votes, load_split_offsets, dump_split_offsets, \
+    get_split_views
+
+votes = load_votes()
+splits = load_split_offsets()
 for i in xrange(5):
   reviews = load(open('out/pkl/reviews-%d.pkl' % i, 'r'))
-  test = load(open('out/pkl/test-%d.pkl' % i, 'r'))
+  test = get_split_views(votes, splits[i])[2]
   pair_votes = {}
   for vote in test:
     voter = vote['voter']
@@ -15,11 +22,12 @@ for i in xrange(5):
     if pair_votes[key] >= 5:
       sel_keys.add(key)
   new_test = []
-  for vote in test:
+  for index, vote in zip(test.get_indices(), test):
     voter = vote['voter']
     product = reviews[vote['review']]['product']
     if (product, voter) in sel_keys:
-      new_test.append(vote)
+      new_test.append(index)
   print 'Size of old test #%d: %d' % (i + 1, len(test))
   print 'Size of new test #%d: %d' % (i + 1, len(new_test))
-  dump(new_test, open('out/pkl/test-%d.pkl' % i, 'w'))
+  splits[i]['test'] = array(new_test, dtype=int32)
+dump_split_offsets(splits)
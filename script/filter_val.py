@@ -1,8 +1,15 @@
-from pickle import load, dump
+from pickle import load
 
+from numpy import array, int32
+
+from util.splits import load_votes, load_split_offsets, dump_split_offsets, \
+    get_split_views
+
+votes = load_votes()
+splits = load_split_offsets()
 for i in xrange(5):
   reviews = load(open('out/pkl/reviews-%d.pkl' % i, 'r'))
-  val = load(open('out/pkl/validation-%d.pkl' % i, 'r'))
+  val = get_split_views(votes, splits[i])[1]
   pair_votes = {}
   for vote in val:
     voter = vote['voter']
@@ -15,11 +22,12 @@ for i in xrange(5):
     if pair_votes[key] >= 5:
       sel_keys.add(key)
   new_val = []
-  for vote in val:
+  for index, vote in zip(val.get_indices(), val):
     voter = vote['voter']
     product = reviews[vote['review']]['product']
     if (product, voter) in sel_keys:
-      new_val.append(vote)
+      new_val.append(index)
   print 'Size of old val #%d: %d' % (i + 1, len(val))
   print 'Size of new val #%d: %d' % (i + 1, len(new_val))
-  dump(new_val, open('out/pkl/validation-%d.pkl' % i, 'w'))
+  splits[i]['validation'] = array(new_val, dtype=int32)
+dump_split_offsets(splits)
@@ -6,14 +6,17 @@
 from pickle import load, dump
 
 from numpy import zeros, mean, array, nan
-from networkx import single_source_shortest_path_length, closeness_centrality, \
-    betweenness_centrality, eigenvector_centrality
 
 from util.aux import cosine
 from util.avg_model import compute_avg_user
+from util.splits import load_split
+from lib.trust.analytics import load_trust_analytics
+from lib.trust.distance import GraphDistance
 
 _OUTPUT_DIR = 'data/'
 _PKL_DIR = 'out/pkl'
+_TRUST_ANALYTICS = '%s/trust-analytics.pkl' % _PKL_DIR
+_EXACT_DISTANCES = False
 
 def main():
   """ Models the whole dataset using features and output to a file. 
@@ -24,21 +27,20 @@ def main():
       Returns:
         None.
   """
+  trusts = load(open('%s/trusts.pkl' % _PKL_DIR, 'r'))
+  analytics = load_trust_analytics(trusts, '%s/trusts.pkl' % _PKL_DIR,
+      _TRUST_ANALYTICS)
+  distances = GraphDistance(analytics, _EXACT_DISTANCES)
   for i in xrange(1, 5):
     print 'Reading data'
-    trusts = load(open('%s/trusts.pkl' % _PKL_DIR, 'r'))
     reviews = load(open('%s/reviews-%d.pkl' % (_PKL_DIR, i), 'r'))
     users = load(open('%s/users-%d.pkl' % (_PKL_DIR, i), 'r'))
-    train = load(open('%s/train-%d.pkl' % (_PKL_DIR, i), 'r'))
-    validation = load(open('%s/validation-%d.pkl' % (_PKL_DIR, i), 'r'))
-    test = load(open('%s/test-%d.pkl' % (_PKL_DIR, i), 'r'))
+    train, validation, test = load_split(i, _PKL_DIR)
     sim = load(open('%s/sim-%d.pkl' % (_PKL_DIR, i), 'r'))
     conn = load(open('%s/conn-%d.pkl' % (_PKL_DIR, i), 'r'))
 
     print 'Generating similarity'
     avg_user = compute_avg_user(users)
-    close = {}
-    eigen = eigenvector_centrality(trusts) 
     for author, voter in sim:
       author_dic = users[author] if author in users else avg_user
       voter_dic = users[voter] if voter in users else avg_user
@@ -49,35 +51,25 @@ def main():
           voter_dic['num_reviews'] 
       sim[(author, voter)]['diff_pagerank'] = author_dic['pagerank'] - \
           voter_dic['pagerank']
-      if voter not in close:
-        close[voter] = closeness_centrality(trusts, voter) if voter in trusts \
-            else nan
-      if author not in close:
-        close[author] = closeness_centrality(trusts, author) if author in trusts\
-            else nan
-      sim[(author, voter)]['diff_close'] = close[author] - close[voter] 
-      if voter not in eigen:
-        eigen[voter] = nan
-      if author not in eigen:
-        eigen[author] = nan
-      conn[(author, voter)]['diff_eigen'] = eigen[author] - eigen[voter] 
+      sim[(author, voter)]['diff_close'] = distances.closeness(author) - \
+          distances.closeness(voter)
+      conn[(author, voter)]['diff_eigen'] = \
+          analytics.get_value('eigenvector', author) - \
+          analytics.get_value('eigenvector', voter)
     dump(sim, open('%s/new-sim-%d.pkl' % (_PKL_DIR, i), 'w'))
 
     print 'Generating connection'
-    paths = {}
     for author, voter in conn:
       conn[(author, voter)]['voter_trust'] = 1 if \
           trusts.has_edge(voter, author) else 0
       conn[(author, voter)]['author_trust'] = 1 if \
           trusts.has_edge(author, voter) else 0
-      if voter not in paths and voter in trusts:
-        paths[voter] = single_source_shortest_path_length(trusts, voter) 
-      if author not in paths and author in trusts:
-        paths[author] = single_source_shortest_path_length(trusts, author)
-      conn[(author, voter)]['inv_from_vot_path'] = 0 if voter not in trusts \
-          or author not in paths[voter] else (1.0 / float(paths[voter][author]))
-      conn[(author, voter)]['inv_from_aut_path'] = 0 if author not in trusts \
-          or voter not in paths[author] else (1.0 / float(paths[author][voter]))
+      from_voter = distances.distance(voter, author)
+      from_author = distances.distance(author, voter)
+      conn[(author, voter)]['inv_from_vot_path'] = 0 if not from_voter else \
+          (1.0 / float(from_voter))
+      conn[(author, voter)]['inv_from_aut_path'] = 0 if not from_author else \
+          (1.0 / float(from_author))
     dump(conn, open('%s/new-conn-%d.pkl' % (_PKL_DIR, i), 'w')) 
 
 if __name__ == '__main__':
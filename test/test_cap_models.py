@@ -10,11 +10,15 @@
 
 from unittest import TestCase, main
 from numpy import array, reshape, identity, vstack, diagonal, zeros
+from numpy import cov as cov_matrix
+from numpy.random import normal, seed
 from numpy import testing as ntest
 from numpy.linalg import pinv, lstsq
 from random import random
+from math import sqrt
 
-from algo.cap import models, const
+from algo.cap import models, const, em
+from algo.cap.state import CapState
 from util import aux
 
 
@@ -118,6 +122,7 @@ class SmallScenarioTestCase(TestCase):
   """ Test case for a scalar variance parameter. """
 
   def setUp(self):
+    seed(0)
     const.K = 10
     self.reviews = {
         'r1': array([50, 3, 0.5, 16.67, 1.0, 0.2, 0.3, 0.2, 0.6, 0.3, 0.01,
@@ -325,6 +330,50 @@ class SmallScenarioTestCase(TestCase):
               2.291666667, 3.3, 4.491666667, 5.866666667, 7.425]]),
               (10, 1)), rtol=1, atol=1e-7)
 
+  def test_burn_in_empiric_stats(self):
+    for stream in [False, True]:
+      self._assert_burn_in_stats(stream)
+
+  def _assert_burn_in_stats(self, stream):
+    for group in self.groups.itervalues():
+      for variable in group.iter_variables():
+        variable.reset_samples(stream)
+        for i in xrange(13):
+          sample = 0.1 * (i - 3) if isinstance(variable, models.ScalarVariable) \
+              else array([[0.1 * j * (i - 3)] for j in xrange(const.K)])
+          variable.add_sample(sample, burn_in=i < 3)
+        self.assertEqual(variable.num_samples, 10)
+        self.assertEqual(len(variable.samples), 0 if stream else 10)
+        ntest.assert_allclose(variable.get_last_sample(), sample)
+        variable.calculate_empiric_mean()
+        variable.calculate_empiric_var()
+        if isinstance(variable, models.ScalarVariable):
+          self.assertAlmostEqual(variable.empiric_mean, 0.45)
+          self.assertAlmostEqual(variable.empiric_var, 0.091666667)
+        else:
+          ntest.assert_allclose(variable.empiric_mean, array([[0.45 * j] for
+              j in xrange(const.K)]), atol=1e-12)
+          ntest.assert_allclose(variable.empiric_var, array([[0.091666667 * j
+              * j] for j in xrange(const.K)]), atol=1e-7)
+
+  def test_streaming_e_step(self):
+    results = []
+    for stream in [False, True]:
+      seed(5)
+      self.groups = {}
+      self.var_H = models.PredictionVarianceParameter('var_H')
+      self._create_groups()
+      self.groups['u'].set_pair_name('v')
+      self.groups['v'].set_pair_name('u')
+      em.perform_e_step(self.groups, self.votes, 10, 5, stream)
+      self.assertEqual(self.groups['u'].get_num_samples(), 10)
+      self.var_H.optimize(self.groups, self.votes)
+      results.append([self.var_H.value] + [variable.empiric_var for name in
+          sorted(self.groups) for variable in
+          self.groups[name].iter_variables()])
+    for stored, streamed in zip(*results):
+      ntest.assert_allclose(streamed, stored, rtol=1e-6)
+
   def test_get_instance_sample(self):
     for g_id, group in self.groups.iteritems():
       for variable in group.iter_variables():
@@ -556,6 +605,125 @@ class SmallScenarioTestCase(TestCase):
     ntest.assert_allclose(zeros(param.value.shape), 
         param.get_derivative_1(param.value, group), rtol=1, atol=1e-3)
 
+  def test_vote_index(self):
+    for group in self.groups.itervalues():
+      for variable in group.iter_variables():
+        self.assertEqual(list(variable.related_votes),
+            variable.get_related_votes(self.votes))
+    index = models.VoteIndex(self.votes, ('author', 'voter'))
+    self.assertEqual(len(index.get(('a9', 'v9'))), 0)
+
+  def _assert_state_rest(self, state):
+    for name, group in self.groups.iteritems():
+      for j, variable in enumerate(state.variables[name]):
+        pair_values = state.get_pair_values(name, j) if group.pair_name \
+            else None
+        rest = [variable.get_rest_value(self.groups, self.votes[i]) for i in
+            variable.related_votes]
+        ntest.assert_allclose(state.get_rest(name, j, pair_values), rest,
+            atol=1e-12)
+
+  def test_state_rest(self):
+    for group in self.groups.itervalues():
+      for variable in group.iter_variables():
+        variable.value = array([[random()] for _ in xrange(const.K)]) if \
+            group.pair_name else random()
+    state = CapState(self.groups, self.votes)
+    self._assert_state_rest(state)
+    for name in ['alpha', 'u', 'gamma']:
+      variable = state.variables[name][0]
+      pair_values = state.get_pair_values(name, 0) if name == 'u' else None
+      sample = array([random() for _ in xrange(const.K)]) if name == 'u' \
+          else random()
+      state.update(name, 0, sample, pair_values)
+      variable.add_sample(sample.reshape(const.K, 1) if name == 'u' else
+          sample)
+    self._assert_state_rest(state)
+
+  def test_blocked_scalar_sampling(self):
+    state = CapState(self.groups, self.votes)
+    n_samples = 2000
+    for name in ['alpha', 'beta', 'xi', 'gamma', 'lambda']:
+      group = self.groups[name]
+      means, variances = state.get_cond_means_and_vars(name)
+      for j, variable in enumerate(state.variables[name]):
+        mean, var = variable.calculate_cond_mean_and_var(group,
+            state.get_rest(name, j))
+        self.assertAlmostEqual(means[j], mean)
+        self.assertAlmostEqual(variances[j], var)
+      blocked, single = [], []
+      for _ in xrange(n_samples):
+        em.sample_scalar_group(state, name)
+        blocked.append(state.values[name].copy())
+        for j, variable in enumerate(state.variables[name]):
+          mean, var = variable.calculate_cond_mean_and_var(group,
+              state.get_rest(name, j))
+          sample = normal(mean, sqrt(var))
+          state.update(name, j, sample)
+          variable.add_sample(sample)
+        single.append(state.values[name].copy())
+      blocked, single = array(blocked), array(single)
+      ntest.assert_allclose(blocked.mean(axis=0), single.mean(axis=0),
+          atol=5 * sqrt(2 * variances.max() / n_samples))
+      ntest.assert_allclose(blocked.var(axis=0), variances, rtol=0.15)
+      ntest.assert_allclose(single.var(axis=0), variances, rtol=0.15)
+      self._assert_state_rest(state)
+
+  def test_blocked_array_sampling(self):
+    state = CapState(self.groups, self.votes)
+    n_samples = 2000
+    for name in ['u', 'v']:
+      group = self.groups[name]
+      precisions, shifts = state.get_cond_precisions(name)
+      for j, variable in enumerate(state.variables[name]):
+        pair_values = state.get_pair_values(name, j)
+        mean, var = variable.calculate_cond_mean_and_var(group,
+            state.get_rest(name, j, pair_values), pair_values)
+        ntest.assert_allclose(pinv(precisions[j]), var, atol=1e-10)
+        ntest.assert_allclose(var.dot(shifts[j]), mean.reshape(-1),
+            atol=1e-10)
+      samples = []
+      for _ in xrange(n_samples):
+        em.sample_array_group(state, name)
+        samples.append(state.values[name].copy())
+      samples = array(samples)
+      for j in xrange(len(state.variables[name])):
+        cov = pinv(precisions[j])
+        ntest.assert_allclose(samples[:, j].mean(axis=0),
+            cov.dot(shifts[j]), atol=5 * sqrt(cov.max() / n_samples))
+        ntest.assert_allclose(diagonal(cov_matrix(samples[:, j],
+            rowvar=False)), diagonal(cov), rtol=0.15)
+      self._assert_state_rest(state)
+
+  def test_singular_array_sampling(self):
+    self.groups['u'].var_param.value = 0.0
+    state = CapState(self.groups, self.votes)
+    em.sample_array_group(state, 'u')
+    for variable in state.variables['u']:
+      self.assertEqual(variable.num_samples, 1)
+    self._assert_state_rest(state)
+
+  def test_mixed_array_sampling(self):
+    state = CapState(self.groups, self.votes)
+    precisions, shifts = state.get_cond_precisions('u')
+    precisions[0] = zeros((const.K, const.K))
+    precisions[2] = -identity(const.K)
+    state.get_cond_precisions = lambda name: (precisions, shifts)
+    singles = []
+    sample_array_variables = em.sample_array_variables
+    def record_array_variables(state, g_name, positions, burn_in=False):
+      singles.extend(positions)
+      sample_array_variables(state, g_name, positions, burn_in)
+    em.sample_array_variables = record_array_variables
+    try:
+      em.sample_array_group(state, 'u')
+    finally:
+      em.sample_array_variables = sample_array_variables
+    self.assertEqual(sorted(singles), [0, 2])
+    for variable in state.variables['u']:
+      self.assertEqual(variable.num_samples, 1)
+    self._assert_state_rest(state)
+
 
 if __name__ == '__main__':
   main()
@@ -0,0 +1,74 @@
+""" Test of Filtering
+    -----------------
+
+    Test the one-pass filtering of the raw reviews file.
+
+    Usage:
+    $ python -m test.test_filtering
+"""
+
+
+from os import remove
+from tempfile import mkstemp
+from unittest import TestCase, main
+
+from lib.wordnet.lemma_index import LemmaIndex, POS_LIST
+from prep import filtering
+
+
+class FilterReviewsTestCase(TestCase):
+  """ Test case of filtering a tiny raw reviews file. """
+
+  def setUp(self):
+    self.lemmas = filtering._LEMMAS
+    index = LemmaIndex()
+    index.lemmas = {pos: frozenset() for pos in POS_LIST}
+    index.lemmas['n'] = frozenset(['good', 'product', 'camera'])
+    index.all_lemmas = index.lemmas['n']
+    index.exceptions = {pos: {} for pos in POS_LIST}
+    index.substitutions = {pos: [] for pos in POS_LIST}
+    filtering._LEMMAS = index
+    handle, self.input_file = mkstemp()
+    handle, self.output_file = mkstemp()
+    lines = [
+        ('a1', 'p1', 40, 'Good product.', 'v1:4:::v2:3'),
+        ('a2', 'p1', 30, 'Good camera.', 'v1:5:::v3:2'),
+        ('a3', 'p1', 50, 'Good good camera.', 'v2:1:::v4:5:::a3:5'),
+        ('a4', 'p2', 20, 'Good product.', 'v1:3'),
+        ('a5', 'p1', 90, 'Good product.', 'v3:4'),
+        ('a6', 'p1', 40, 'Zzq xxw camera.', 'v3:4'),
+        ('a7', 'p1', 40, 'Good product.', ''),
+    ]
+    output = open(self.input_file, 'w')
+    for author, product, rating, text, votes in lines:
+      print >> output, '%s::::%s::::c1::::%d::::x::::01.02.2003::::%s::::' \
+          '%s:::</endperson>' % (author, product, rating, text, votes)
+    output.close()
+
+  def tearDown(self):
+    filtering._LEMMAS = self.lemmas
+    remove(self.input_file)
+    remove(self.output_file)
+
+  def test_filter_reviews(self):
+    outputs = []
+    for num_procs in [1, 2]:
+      type_ignored = filtering.filter_reviews(self.input_file,
+          self.output_file, foreign_ratio=0.4, min_group=2,
+          num_procs=num_procs)
+      self.assertEqual(type_ignored['rating'], 1)
+      self.assertEqual(type_ignored['text'], 1)
+      self.assertEqual(type_ignored['votes'], 1)
+      self.assertEqual(sum(type_ignored.values()), 3)
+      with open(self.output_file) as f:
+        outputs.append([line.strip().split('::::') for line in f])
+    self.assertEqual(outputs[0], outputs[1])
+    self.assertEqual([fields[0] for fields in outputs[0]], ['a1', 'a2',
+        'a3'])
+    self.assertEqual([fields[7] for fields in outputs[0]], [
+        'v1:4:::v2:3:::</endperson>', 'v1:5:::</endperson>',
+        'v2:1:::</endperson>'])
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,51 @@
+""" Test of Graph Distance
+    ----------------------
+
+    Test pair distances and closeness of the trust network against networkx.
+
+    Usage:
+    $ python -m test.test_graph_distance
+"""
+
+
+from unittest import TestCase, main
+
+from networkx import gnp_random_graph, closeness_centrality, \
+    single_source_shortest_path_length
+
+from lib.trust.analytics import TrustAnalytics
+from lib.trust.distance import GraphDistance
+
+
+class GraphDistanceTestCase(TestCase):
+  """ Test case of the distance service over a random network. """
+
+  def setUp(self):
+    self.graph = gnp_random_graph(60, 0.03, seed=7, directed=True)
+    self.analytics = TrustAnalytics(self.graph)
+
+  def test_distance(self):
+    exact = GraphDistance(self.analytics, exact=True)
+    bounded = GraphDistance(self.analytics, max_hops=3)
+    for source in self.graph:
+      paths = single_source_shortest_path_length(self.graph, source)
+      for target in self.graph:
+        self.assertEqual(exact.distance(source, target), paths.get(target))
+        self.assertEqual(bounded.distance(source, target), paths.get(target)
+            if paths.get(target, 4) <= 3 else None)
+    self.assertIsNone(exact.distance(0, 100))
+
+  def test_closeness(self):
+    exact = GraphDistance(self.analytics, exact=True)
+    sampled = GraphDistance(self.analytics, num_pivots=60, seed=1)
+    for node in self.graph:
+      answer = closeness_centrality(self.graph, node)
+      self.assertAlmostEqual(exact.closeness(node), answer)
+      self.assertAlmostEqual(sampled.closeness(node), answer)
+      lower, upper = sampled.closeness_interval(node)
+      self.assertTrue(lower <= sampled.closeness(node) <= upper)
+    self.assertNotEqual(exact.closeness(100), exact.closeness(100))
+
+
+if __name__ == '__main__':
+  main()
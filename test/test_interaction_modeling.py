@@ -0,0 +1,154 @@
+""" Test of Interaction Modeling
+    ----------------------------
+
+    Test author-voter interaction features over a tiny trust network.
+
+    Usage:
+    $ python -m test.test_interaction_modeling
+"""
+
+
+from math import log
+from os import remove
+from os.path import getmtime
+from pickle import load
+from tempfile import mkstemp
+from unittest import TestCase, main
+
+from networkx import DiGraph
+
+from lib.trust.analytics import TrustAnalytics
+from lib.trust.katz import KatzIndex
+from prep.interaction_modeling import calculate_connection_strength_batch, \
+    calculate_authoring_similarity, calculate_authoring_similarity_batch, \
+    model_author_voter_connection
+
+
+class KatzTestCase(TestCase):
+  """ Test case of Katz index computed for requested pairs. """
+
+  def setUp(self):
+    self.graph = DiGraph()
+    self.graph.add_edges_from([(2, 1), (2, 3), (3, 1), (4, 2), (4, 3)])
+    self.analytics = TrustAnalytics(self.graph)
+
+  def test_katz(self):
+    katz = KatzIndex(self.analytics)
+    katz.compute_pairs([(4, 1), (4, 2), (4, 4), (4, 5), (3, 1)], block_size=1)
+    score = 2 * 0.005 ** 2 + 0.005 ** 3
+    self.assertAlmostEqual(katz.get(4, 1), score, places=15)
+    self.assertAlmostEqual(katz.get(4, 2), 0.005, places=15)
+    self.assertEqual(katz.get(4, 4), 0.0)
+    self.assertEqual(katz.get(4, 5), 0.0)
+    self.assertAlmostEqual(katz.get(3, 1), 0.005, places=15)
+    self.assertEqual(len(katz.keys), 4)
+    self.assertRaises(KeyError, katz.get, 4, 3)
+
+  def test_truncated_katz(self):
+    katz = KatzIndex(self.analytics, max_length=2)
+    katz.compute_pairs([(4, 1)])
+    self.assertAlmostEqual(katz.get(4, 1), 2 * 0.005 ** 2, places=15)
+
+  def test_cache(self):
+    handle, path = mkstemp()
+    remove(path)
+    analytics = TrustAnalytics(self.graph, fingerprint='f')
+    try:
+      katz = KatzIndex(analytics, cache_file=path, max_cached=2)
+      katz.compute_pairs([(4, 1), (4, 2)])
+      katz.dump()
+      katz = KatzIndex(analytics, cache_file=path, max_cached=2)
+      self.assertEqual(len(katz.keys), 2)
+      self.assertAlmostEqual(katz.get(4, 2), 0.005, places=15)
+      mtime = getmtime(path)
+      katz.compute_pairs([(4, 2)])
+      katz.dump()
+      self.assertEqual(getmtime(path), mtime)
+      katz.compute_pairs([(3, 1), (2, 1), (4, 3)])
+      katz.dump()
+      with open(path, 'rb') as f:
+        cache = load(f)
+      self.assertEqual(len(cache['keys']), 2)
+      katz = KatzIndex(analytics, cache_file=path, max_cached=2)
+      self.assertRaises(KeyError, katz.get, 4, 2)
+      katz.compute_pairs([(3, 1), (2, 1)])
+      self.assertAlmostEqual(katz.get(3, 1), 0.005, places=15)
+      self.assertAlmostEqual(katz.get(2, 1), 0.005 + 0.005 ** 2, places=15)
+    finally:
+      remove(path)
+
+
+class ConnectionStrengthTestCase(TestCase):
+  """ Test case of batched connection strength features. """
+
+  def setUp(self):
+    self.graph = DiGraph()
+    self.graph.add_edges_from([(3, 1), (4, 1), (1, 5), (1, 6), (1, 7), (2, 7),
+        (2, 8), (4, 2), (9, 2), (7, 2), (6, 1), (5, 7)])
+    self.analytics = TrustAnalytics(self.graph)
+    self.users = {1: {'id': 1}, 2: {'id': 2}, 10: {'id': 10}}
+    self.katz = KatzIndex(self.analytics)
+    self.katz.compute_pairs([(1, 2)])
+
+  def test_connection_strength_batch(self):
+    features = calculate_connection_strength_batch([(2, 1), (1, 10), (1, 11)],
+        self.users, self.analytics, self.katz, batch_size=1)
+    answer = {}
+    answer['jacc_trustees'] = 1.0 / 4 # {7} over {5, 6, 7, 8}
+    answer['jacc_trustors'] = 1.0 / 5 # {4} over {3, 4, 6, 7, 9}
+    answer['adamic_adar_trustees'] = 1.0 / log(self.graph.degree(7))
+    answer['adamic_adar_trustors'] = 1.0 / log(self.graph.degree(4))
+    answer['katz'] = self.katz.get(1, 2)
+    for feature in answer:
+      self.assertAlmostEqual(features[(2, 1)][feature], answer[feature])
+    self.assertGreater(features[(2, 1)]['katz'], 0.0)
+    for pair in [(1, 10), (1, 11)]:
+      self.assertEqual(set(features[pair].values()), set([0.0]))
+
+
+class AuthoringSimilarityTestCase(TestCase):
+  """ Test case of batched authoring similarity features. """
+
+  def setUp(self):
+    self.users = {
+      1: {'id': 1, 'ratings': {1: 1, 2: 2, 4: 5, 5: 2}, 'avg_rating': 2.5},
+      2: {'id': 2, 'ratings': {2: 4, 5: 2, 6: 0}, 'avg_rating': 2},
+      3: {'id': 3, 'ratings': {}, 'avg_rating': float('nan')}
+    }
+
+  def test_authoring_similarity_batch(self):
+    pairs = [(1, 2), (2, 1), (1, 3), (1, 4)]
+    features = calculate_authoring_similarity_batch(pairs, self.users,
+        batch_size=2)
+    self.assertEqual(features[(1, 2)]['common_rated'], 2)
+    for author, voter in pairs:
+      answer = calculate_authoring_similarity(self.users.get(author),
+          self.users.get(voter) if author in self.users else None)
+      for feature, value in answer.iteritems():
+        if value != value:
+          self.assertNotEqual(features[(author, voter)][feature],
+              features[(author, voter)][feature])
+        else:
+          self.assertAlmostEqual(features[(author, voter)][feature], value)
+
+
+class ParallelPairFeaturesTestCase(TestCase):
+  """ Test case of pair features computed by shards in worker processes. """
+
+  def setUp(self):
+    self.graph = DiGraph()
+    self.graph.add_edges_from([(i, (i * 7 + 3) % 20) for i in xrange(20)] +
+        [(i, (i * 3 + 1) % 20) for i in xrange(20)])
+    self.users = {i: {'id': i} for i in xrange(18)}
+    self.pairs = [(i, j) for i in xrange(22) for j in xrange(0, 22, 3)]
+
+  def test_parallel_connection(self):
+    serial = model_author_voter_connection([], self.users, self.graph,
+        self.pairs)
+    parallel = model_author_voter_connection([], self.users, self.graph,
+        self.pairs, num_procs=3)
+    self.assertEqual(parallel, serial)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,54 @@
+""" Test of Lemma Index
+    -------------------
+
+    Test the precompiled WordNet lemma index against WordNet synsets.
+
+    Usage:
+    $ python -m test.test_lemma_index
+"""
+
+
+from os import remove
+from os.path import isfile
+from pickle import dump, load
+from tempfile import mkstemp
+from unittest import TestCase, main
+
+from lib.wordnet.lemma_index import LemmaIndex, get_wordnet_version
+
+
+class LemmaIndexTestCase(TestCase):
+  """ Test case of the lemma index, skipped without the WordNet corpus. """
+
+  def setUp(self):
+    if get_wordnet_version() is None:
+      self.skipTest('WordNet corpus is not installed')
+    handle, self.path = mkstemp()
+    remove(self.path)
+
+  def tearDown(self):
+    if isfile(self.path):
+      remove(self.path)
+
+  def test_is_known(self):
+    from nltk.corpus import wordnet
+    index = LemmaIndex(self.path)
+    words = ['dog', 'dogs', 'running', 'ran', 'better', 'best', 'geese',
+        'mice', 'went', 'children', 'happier', 'boxes', 'ladies', 'sought',
+        'axes', 'data', 'was', 'the', 'xyzzy', 'bestest', 'camerass']
+    for word in words:
+      self.assertEqual(index.is_known(word), wordnet.synsets(word) != [],
+          word)
+
+  def test_version(self):
+    with open(self.path, 'wb') as f:
+      dump({'version': '0.0', 'lemmas': {}, 'exceptions': {},
+          'substitutions': {}}, f)
+    index = LemmaIndex(self.path)
+    self.assertTrue(index.is_known('dog'))
+    with open(self.path, 'rb') as f:
+      self.assertEqual(load(f)['version'], get_wordnet_version())
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,100 @@
+""" Test of Parsing
+    ---------------
+
+    Test the columnar review table and its dictionary view.
+
+    Usage:
+    $ python -m test.test_parsing
+"""
+
+
+from multiprocessing import active_children
+from os import remove
+from tempfile import mkstemp
+from unittest import TestCase, main
+
+from prep.parsing import parse_reviews_table, parse_review_line, \
+    iter_parsed_lines, create_type_ignored, get_byte_ranges
+
+
+class ReviewTableTestCase(TestCase):
+  """ Test case of parsing a tiny reviews file into a table. """
+
+  def setUp(self):
+    handle, self.path = mkstemp()
+    output = open(self.path, 'w')
+    print >> output, 'a1::::p1::::c1::::40::::x::::01.02.2003::::Nice text.' \
+        '::::v1:3:::v2:5:::a1:4:::</endperson>'
+    print >> output, 'a2::::p1::::c1::::80::::x::::01.02.2003::::Bad rating.' \
+        '::::v1:3:::</endperson>'
+    print >> output, 'a2::::p2::::c2::::30::::x::::05.03.2004::::Other text.' \
+        '::::v3:1:::v1:2:::v3:4:::</endperson>'
+    output.close()
+
+  def tearDown(self):
+    remove(self.path)
+
+  def test_columns(self):
+    table = parse_reviews_table(input_file=self.path)
+    self.assertEqual(len(table), 2)
+    self.assertListEqual(table.id.tolist(), [0, 2])
+    self.assertListEqual(table.rating.tolist(), [4, 3])
+    self.assertListEqual(table.vote_offsets.tolist(), [0, 2, 4])
+    self.assertListEqual(table.avg_vote.tolist(), [4.0, 1.5])
+    self.assertEqual(table.users[table.author[1]], 'a2')
+    self.assertEqual(table.date_ordinal[1] - table.date_ordinal[0], 398)
+
+  def test_dictionary_view(self):
+    reviews = list(parse_reviews_table(input_file=self.path).iter_reviews())
+    self.assertDictEqual(reviews[0], {'id': 0, 'author': 'a1',
+        'product': 'p1', 'category': 'c1', 'rating': 4, 'date': '01.02.2003',
+        'text': 'Nice text.', 'votes': {'v1': 3, 'v2': 5}, 'avg_vote': 4.0})
+    self.assertDictEqual(reviews[1]['votes'], {'v3': 1, 'v1': 2})
+    self.assertEqual(reviews[1]['id'], 2)
+
+
+class ParallelParsingTestCase(TestCase):
+  """ Test case of parsing byte ranges of a file in worker processes. """
+
+  def setUp(self):
+    handle, self.path = mkstemp()
+    output = open(self.path, 'w')
+    for i in xrange(60):
+      rating = 70 if i % 5 == 0 else 10 * (i % 5)
+      votes = '' if i % 7 == 0 else 'v%d:%d:::v%d:3:::' % (i % 4, i % 6,
+          i % 9 + 4)
+      print >> output, 'a%d::::p%d::::c1::::%d::::x::::01.02.20%02d::::' \
+          'Text %d.::::%s</endperson>' % (i % 11, i % 3, rating, i % 10, i,
+          votes)
+    output.close()
+
+  def tearDown(self):
+    remove(self.path)
+
+  def _parse(self, num_procs):
+    type_ignored = create_type_ignored()
+    records = list(iter_parsed_lines(self.path, parse_review_line,
+        type_ignored, num_procs))
+    return records, type_ignored
+
+  def test_parallel_order(self):
+    records, type_ignored = self._parse(1)
+    self.assertEqual(type_ignored['rating'], 12)
+    self.assertEqual(type_ignored['votes'], 7)
+    for num_procs in [2, 3, 7]:
+      self.assertGreater(len(get_byte_ranges(self.path, num_procs)), 1)
+      self.assertEqual(self._parse(num_procs), (records, type_ignored))
+    table = parse_reviews_table(input_file=self.path, num_procs=3)
+    self.assertListEqual(table.id.tolist(), [r_id for r_id, _ in records])
+
+  def test_early_close(self):
+    lines = iter_parsed_lines(self.path, parse_review_line,
+        create_type_ignored(), 3)
+    self.assertEqual(lines.next()[0], 1)
+    self.assertNotEqual(active_children(), [])
+    lines.close()
+    self.assertEqual(active_children(), [])
+
+
+if __name__ == '__main__':
+  main()
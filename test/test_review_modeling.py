@@ -0,0 +1,144 @@
+""" Test of Review Modeling
+    -----------------------
+
+    Test textual features, the text features cache of reviews and the KL
+    divergence of review unigrams.
+
+    Usage:
+    $ python -m test.test_review_modeling
+"""
+
+
+from math import log
+from os import remove
+from os.path import isfile
+from pickle import dump
+from tempfile import mkstemp
+from unittest import TestCase, main
+
+from nltk.data import find
+from nltk.tag import UnigramTagger
+
+from lib.sentiment.sentiwordnet import SimplifiedSentiWordNet
+from prep import review_modeling
+from prep.review_modeling import load_text_cache, dump_text_cache, \
+    update_text_cache, get_text_hash, calculate_kl_divergence, \
+    normalize_unigram, add_unigrams, get_textual_features
+
+
+class TextualFeaturesTestCase(TestCase):
+  """ Test case pinning the textual features of a small text, with a fixture
+      tagger and a fixture SentiWordNet. Skipped without the punkt model. """
+
+  def setUp(self):
+    try:
+      find('tokenizers/punkt')
+    except LookupError:
+      self.skipTest('NLTK punkt model is not installed')
+    handle, self.swn_file = mkstemp()
+    handle, self.compiled_file = mkstemp(suffix='.npy')
+    remove(self.compiled_file)
+    with open(self.swn_file, 'w') as f:
+      f.write('# POS\tID\tPosScore\tNegScore\tSynsetTerms\tGloss\n'
+          'a\t00001\t0.75\t0\tgreat#1 large#2\tgloss\n'
+          'v\t00002\t0.5\t0\tlike#1\tgloss\n'
+          'n\t00003\t0\t0\tzoom#1\tgloss\n')
+    self.swn, self.tagger = review_modeling._SWN, review_modeling._TAGGER
+    review_modeling._SWN = SimplifiedSentiWordNet(self.swn_file,
+        self.compiled_file)
+    review_modeling._TAGGER = UnigramTagger(model={'the': 'DT', 'lens': 'NN',
+        'is': 'VBZ', 'great': 'JJ', '.': '.', 'i': 'PRP', 'do': 'VBP',
+        'n\'t': 'RB', 'like': 'VB', 'zoom': 'NN', '!': '.'})
+
+  def tearDown(self):
+    review_modeling._SWN, review_modeling._TAGGER = self.swn, self.tagger
+    for path in [self.swn_file, self.compiled_file, self.compiled_file +
+        '.source']:
+      if isfile(path):
+        remove(path)
+
+  def test_textual_features(self):
+    text = 'The lens is great. I don\'t like the zoom!'
+    features = get_textual_features(text)
+    answer = {'num_chars': 41, 'num_tokens': 12, 'num_words': 10,
+        'num_sents': 2, 'uni_ratio': 1.0, 'avg_sent': 6.0, 'cap_sent': 1.0,
+        'noun_ratio': 2 / 12.0, 'adj_ratio': 1 / 12.0, 'adv_ratio': 1 / 12.0,
+        'verb_ratio': 3 / 12.0, 'comp_ratio': 2 / 12.0, 'fw_ratio': 0.0,
+        'sym_ratio': 0.0, 'num_ratio': 0.0, 'punct_ratio': 0.0,
+        'pos_ratio': 0.1, 'neg_ratio': 0.1}
+    self.assertEqual(sorted(features), sorted(answer))
+    for feat in answer:
+      self.assertAlmostEqual(features[feat], answer[feat], msg=feat)
+
+
+class TextCacheTestCase(TestCase):
+  """ Test case of persisting and validating the text features cache. """
+
+  def setUp(self):
+    handle, self.path = mkstemp()
+    self.cache = {3: {'hash': get_text_hash('Nice.'), 'features':
+        {'num_tokens': 2}, 'unigram': {'nice': 1}}}
+
+  def tearDown(self):
+    remove(self.path)
+
+  def test_version(self):
+    dump_text_cache(self.cache, self.path)
+    self.assertEqual(load_text_cache(self.path), self.cache)
+    with open(self.path, 'wb') as f:
+      dump({'version': review_modeling._FEATURES_VERSION - 1, 'entries':
+          self.cache}, f)
+    self.assertEqual(load_text_cache(self.path), {})
+    with open(self.path, 'wb') as f:
+      dump(self.cache, f)
+    self.assertEqual(load_text_cache(self.path), {})
+
+  def test_missing_text(self):
+    update_text_cache(1, {3: {'product': 'p1'}}, self.cache)
+    self.assertRaises(ValueError, update_text_cache, 1, {4: {'product':
+        'p1'}}, self.cache)
+
+
+class KLDivergenceTestCase(TestCase):
+  """ Test case of KL divergence against per-product unigram models. """
+
+  def setUp(self):
+    self.counts = {
+        1: {'good': 2.0, 'lens': 1.0},
+        2: {'bad': 1.0, 'lens': 3.0, 'zoom': 1.0},
+        3: {'good': 1.0, 'zoom': 2.0, 'price': 1.0},
+        4: {'cheap': 2.0, 'price': 1.0},
+        5: {'cheap': 1.0, 'battery': 1.0},
+        6: {'battery': 4.0},
+        7: {'good': 1.0, 'strap': 1.0}
+    }
+    self.products = {1: 'p1', 2: 'p1', 3: 'p1', 4: 'p2', 5: 'p2', 6: 'p3',
+        7: 'p3'}
+    self.train = set([1, 2, 4, 5, 6])
+
+  def _get_answer(self, r_id):
+    train_counts = {}
+    for other, product in self.products.iteritems():
+      if product == self.products[r_id] and other in self.train:
+        for word, count in self.counts[other].iteritems():
+          train_counts[word] = train_counts.get(word, 0) + count
+    avg_unigram = normalize_unigram(train_counts)
+    unigram = normalize_unigram(self.counts[r_id])
+    if r_id not in self.train:
+      avg_unigram = add_unigrams(avg_unigram, unigram)
+    return sum(unigram[word] * log(unigram[word] / avg_unigram[word]) for
+        word in unigram)
+
+  def test_kl_divergence(self):
+    reviews = {r_id: {'id': r_id, 'product': product} for r_id, product in
+        self.products.iteritems()}
+    cache = {r_id: {'unigram': counts} for r_id, counts in
+        self.counts.iteritems()}
+    calculate_kl_divergence(self.train, reviews, cache)
+    for r_id in reviews:
+      self.assertAlmostEqual(reviews[r_id]['kl'], self._get_answer(r_id),
+          places=12)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,85 @@
+""" Test of SentiWordNet
+    --------------------
+
+    Test the compiled SentiWordNet lexicon against the parsed data file.
+
+    Usage:
+    $ python -m test.test_sentiwordnet
+"""
+
+
+from os import remove, utime
+from os.path import isfile, getmtime
+from tempfile import mkstemp
+from unittest import TestCase, main
+
+from lib.sentiment.sentiwordnet import SimplifiedSentiWordNet, \
+    parse_sentiwordnet
+
+
+_LINES = [
+    '# POS\tID\tPosScore\tNegScore\tSynsetTerms\tGloss\n',
+    '# fixture of SentiWordNet data\n',
+    'a\t00001\t0.75\t0\tgood#1 nice#3\tgloss\n',
+    'a\t00002\t0.125\t0.25\tgood#2\tgloss\n',
+    'a\t00003\t0\t0.625\tbad#1 poor#1\tgloss\n',
+    'n\t00004\t0.25\t0.5\tgood#1\tgloss\n',
+    'v\t00005\t0.5\t0\tlike#1\tgloss\n',
+    'n\t00006\t0\t0.375\tzoom_lens#1\tgloss\n',
+    '\t\n',
+    'r\t00007\t0.375\t0.125\twell#1 very_well#2\tgloss\n',
+]
+
+
+class SentiWordNetTestCase(TestCase):
+  """ Test case of the compiled lexicon of a tiny data file. """
+
+  def setUp(self):
+    handle, self.input_file = mkstemp()
+    handle, self.compiled_file = mkstemp(suffix='.npy')
+    remove(self.compiled_file)
+    with open(self.input_file, 'w') as f:
+      f.writelines(_LINES)
+
+  def tearDown(self):
+    for path in [self.input_file, self.compiled_file, self.compiled_file +
+        '.source']:
+      if isfile(path):
+        remove(path)
+
+  def test_scores(self):
+    sentiment = parse_sentiwordnet(self.input_file)
+    swn = SimplifiedSentiWordNet(self.input_file, self.compiled_file)
+    words, tags = [], []
+    for word in sentiment.keys() + ['nice', 'very_well', 'missing', 'zz',
+        'goo', 'goods', '']:
+      for tag in ['a', 'n', 'v', 'r']:
+        words.append(word)
+        tags.append(tag)
+        answer = sentiment.get(word, {}).get(tag)
+        self.assertEqual(swn.scores(word, tag), answer, (word, tag))
+    pos, neg, found = swn.scores_array(words, tags)
+    for i, (word, tag) in enumerate(zip(words, tags)):
+      answer = sentiment.get(word, {}).get(tag)
+      self.assertEqual(found[i], answer is not None)
+      if answer is not None:
+        self.assertEqual(pos[i], answer['pos_score'])
+        self.assertEqual(neg[i], answer['neg_score'])
+      else:
+        self.assertEqual((pos[i], neg[i]), (0.0, 0.0))
+    self.assertEqual(swn.scores(u'good', 'a'), sentiment['good']['a'])
+
+  def test_recompile(self):
+    SimplifiedSentiWordNet(self.input_file, self.compiled_file).load()
+    self.assertTrue(isfile(self.compiled_file))
+    with open(self.input_file, 'a') as f:
+      f.write('a\t00008\t1\t0\tgreat#1\tgloss\n')
+    mtime = getmtime(self.input_file) + 10
+    utime(self.input_file, (mtime, mtime))
+    swn = SimplifiedSentiWordNet(self.input_file, self.compiled_file)
+    self.assertEqual(swn.scores('great', 'a'), {'pos_score': 1.0,
+        'neg_score': 0.0})
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,90 @@
+""" Test of Similar Users
+    ---------------------
+
+    Test the blocked sparse calculation of similar users against the pairwise
+  definition, as well as the approximate calculation by LSH.
+
+    Usage:
+    $ python -m test.test_similar_users
+"""
+
+
+from unittest import TestCase, main
+
+from numpy import mean
+from numpy.random import RandomState
+
+from prep.user_modeling import calculate_similar_users, \
+    calculate_approximate_similar_users, report_approximate_similar_users
+from util.aux import cosine, vectorize
+
+
+class SimilarUsersTestCase(TestCase):
+  """ Test case of similar users calculation. """
+
+  def setUp(self):
+    self.users = {
+      1: {'id': 1, 'ratings': {1: 1, 2: 2, 4: 5, 5: 2}},
+      2: {'id': 2, 'ratings': {2: 4, 5: 2, 6: 0}},
+      3: {'id': 3, 'ratings': {2: 5, 4: 5, 5: 4}},
+      4: {'id': 4, 'ratings': {1: 3, 3: 4, 6: 5}},
+      5: {'id': 5, 'ratings': {3: 2, 4: 4, 5: 4, 6: 3}},
+      6: {'id': 6, 'ratings': {}}
+    }
+
+  def get_pairwise_similars(self):
+    similars = {}
+    for user_a in self.users:
+      sim = {}
+      for user_b in self.users:
+        if user_b != user_a:
+          vec_a, vec_b = vectorize(self.users[user_a]['ratings'],
+              self.users[user_b]['ratings'])
+          sim[user_b] = cosine(vec_a, vec_b)
+      avg = mean(sim.values())
+      similars[user_a] = set([u for u in sim if sim[u] > avg])
+    return similars
+
+  def test_calculate_similar_users(self):
+    expected = self.get_pairwise_similars()
+    for block_size in [1, 4, 100]:
+      calculate_similar_users(self.users, block_size)
+      for user in self.users:
+        self.assertEqual(self.users[user]['similars'], expected[user])
+
+  def test_single_user(self):
+    users = {1: {'id': 1, 'ratings': {1: 3}}}
+    calculate_similar_users(users)
+    self.assertEqual(users[1]['similars'], set())
+
+  def test_approximate_single_bucket(self):
+    expected = self.get_pairwise_similars()
+    calculate_approximate_similar_users(self.users, num_tables=1, num_bits=0,
+        sample_size=len(self.users), seed=0)
+    for user in self.users:
+      self.assertEqual(self.users[user]['similars'], expected[user])
+
+  def test_planted_clusters(self):
+    random = RandomState(0)
+    users = {}
+    for cluster in xrange(4):
+      for u_id in xrange(25 * cluster, 25 * (cluster + 1)):
+        products = random.choice(10, 6, replace=False) + 10 * cluster
+        users[u_id] = {'id': u_id, 'ratings': {p: random.randint(1, 6) for p
+            in products}}
+    report = report_approximate_similar_users(users, num_tables=8,
+        num_bits=2, sample_size=len(users), seed=0)
+    self.assertGreaterEqual(report['recall'], 0.95)
+    self.assertEqual(report['precision'], 1.0)
+    similars = {u_id: users[u_id]['similars'] for u_id in users}
+    for u_id in users:
+      for other in similars[u_id]:
+        self.assertEqual(u_id / 25, other / 25)
+    calculate_approximate_similar_users(users, num_tables=8, num_bits=2,
+        sample_size=len(users), seed=0, block_size=7)
+    for u_id in users:
+      self.assertEqual(users[u_id]['similars'], similars[u_id])
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,43 @@
+""" Test of Splits
+    --------------
+
+    Test chronological splits of votes as views over the vote table.
+
+    Usage:
+    $ python -m test.test_splits
+"""
+
+
+from unittest import TestCase, main
+
+from prep.vote_modeling import split_votes
+from util.splits import VoteView, get_split_views
+
+
+class SplitVotesTestCase(TestCase):
+  """ Test case of sliding window splits over chronologically sorted votes. """
+
+  def setUp(self):
+    self.votes = [{'id': i, 'date': '%02d.01.20%02d' % (i % 28 + 1, 10 - i %
+        7)} for i in xrange(100)]
+
+  def test_split_votes(self):
+    table, splits = split_votes(self.votes)
+    answer = sorted(self.votes, key=lambda v: (v['date'][-4:], v['date']))
+    self.assertEqual([v['id'] for v in table], [v['id'] for v in answer])
+    self.assertEqual(len(splits), 5)
+    for i, split in enumerate(splits):
+      train, val, test = get_split_views(table, split)
+      self.assertEqual((len(train), len(val), len(test)), (24, 6, 30))
+      self.assertIs(train[0], table[10 * i])
+      self.assertIs(test[-1], table[10 * i + 59])
+      self.assertEqual(val + test, table[10 * i + 24:10 * i + 60])
+
+  def test_index_view(self):
+    view = VoteView(self.votes, [5, 1, 7])
+    self.assertEqual([v['id'] for v in view], [5, 1, 7])
+    self.assertEqual(view[1:], [self.votes[1], self.votes[7]])
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,84 @@
+""" Test of Trust Analytics
+    -----------------------
+
+    Test the cache of trust analytics, keyed by network fingerprint and by
+  version of the analytics.
+
+    Usage:
+    $ python -m test.test_trust_analytics
+"""
+
+
+from os import remove
+from os.path import isfile
+from pickle import dump, HIGHEST_PROTOCOL
+from tempfile import mkstemp
+from unittest import TestCase, main
+
+from networkx import DiGraph
+
+from lib.trust.analytics import TrustAnalytics, load_trust_analytics, \
+    get_fingerprint
+
+
+class TrustAnalyticsCacheTestCase(TestCase):
+  """ Test case of loading and invalidating cached trust analytics. """
+
+  def setUp(self):
+    self.trusts = DiGraph()
+    self.trusts.add_edges_from([(1, 2), (2, 3), (3, 1), (4, 1), (4, 3)])
+    handle, self.trusts_file = mkstemp()
+    handle, self.cache_file = mkstemp()
+    remove(self.cache_file)
+    with open(self.trusts_file, 'wb') as f:
+      dump(self.trusts, f, HIGHEST_PROTOCOL)
+
+  def tearDown(self):
+    for path in [self.trusts_file, self.cache_file]:
+      if isfile(path):
+        remove(path)
+
+  def dump_cache(self, analytics):
+    with open(self.cache_file, 'wb') as f:
+      dump(analytics, f, HIGHEST_PROTOCOL)
+
+  def test_same_version(self):
+    analytics = load_trust_analytics(self.trusts, self.trusts_file,
+        self.cache_file)
+    self.assertEqual(analytics.version, TrustAnalytics.VERSION)
+    analytics.marker = True
+    self.dump_cache(analytics)
+    cached = load_trust_analytics(self.trusts, self.trusts_file,
+        self.cache_file)
+    self.assertTrue(getattr(cached, 'marker', False))
+    self.assertEqual(list(cached.pagerank), list(analytics.pagerank))
+
+  def test_other_version(self):
+    analytics = TrustAnalytics(self.trusts, get_fingerprint(self.trusts_file))
+    analytics.version = TrustAnalytics.VERSION - 1
+    analytics.marker = True
+    self.dump_cache(analytics)
+    loaded = load_trust_analytics(self.trusts, self.trusts_file,
+        self.cache_file)
+    self.assertFalse(hasattr(loaded, 'marker'))
+    self.assertEqual(loaded.version, TrustAnalytics.VERSION)
+    del analytics.version
+    self.dump_cache(analytics)
+    loaded = load_trust_analytics(self.trusts, self.trusts_file,
+        self.cache_file)
+    self.assertFalse(hasattr(loaded, 'marker'))
+
+  def test_missing_adjacency(self):
+    analytics = TrustAnalytics(self.trusts, get_fingerprint(self.trusts_file))
+    analytics.version = 1
+    del analytics.adjacency
+    self.dump_cache(analytics)
+    loaded = load_trust_analytics(self.trusts, self.trusts_file,
+        self.cache_file)
+    adjacency = loaded.get_user_adjacency([4, 1, 5, 3]).toarray()
+    self.assertEqual(adjacency.tolist(), [[0, 1, 0, 1], [0, 0, 0, 0], [0, 0,
+        0, 0], [0, 1, 0, 0]])
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,100 @@
+""" Test of User Statistics
+    -----------------------
+
+    Test that user statistics updated over sliding windows of votes match the
+  aggregation of each window from scratch, and that the aggregation matches
+  the loop of create_user, add_user_rating, add_user_vote and
+  finalize_vote_related_features.
+
+    Usage:
+    $ python -m test.test_user_statistics
+"""
+
+
+from random import Random
+from unittest import TestCase, main
+
+from numpy import isnan
+
+from prep.user_modeling import UserStatistics, aggregate_users, \
+    create_user, add_user_rating, add_user_vote, \
+    finalize_vote_related_features, group_votes_by_review
+
+
+class UserStatisticsTestCase(TestCase):
+  """ Test case of incremental user statistics. """
+
+  def setUp(self):
+    random = Random(0)
+    self.reviews = {}
+    for r_id in xrange(60):
+      self.reviews[r_id] = {'id': r_id, 'author': 'u%d' % random.randint(0, 15),
+          'rating': random.randint(1, 5), 'product': 'p%d' % r_id,
+          'rel_rating': 0.0}
+    self.votes = []
+    for _ in xrange(600):
+      r_id = random.randint(0, 59)
+      self.votes.append({'review': r_id, 'voter': 'u%d' % random.randint(0, 30),
+          'vote': random.randint(0, 5)})
+
+  def assertUsersEqual(self, users, expected):
+    self.assertEqual(set(users), set(expected))
+    for u_id in expected:
+      for feat, value in expected[u_id].iteritems():
+        if isinstance(value, float) and isnan(value):
+          self.assertTrue(isnan(users[u_id][feat]))
+        elif isinstance(value, float):
+          self.assertAlmostEqual(users[u_id][feat], value, places=10)
+        else:
+          self.assertEqual(users[u_id][feat], value)
+
+  def test_sliding_windows(self):
+    statistics = UserStatistics(self.reviews)
+    for start in xrange(0, 300, 60):
+      for r_id in self.reviews:
+        self.reviews[r_id]['rel_rating'] = r_id * 0.01 - start * 0.001
+      train = self.votes[start:start+300]
+      statistics.update(train)
+      self.assertUsersEqual(statistics.get_users(),
+          aggregate_users(self.reviews, train))
+
+
+class AggregateUsersTestCase(UserStatisticsTestCase):
+  """ Test case of user aggregation with authors rating a product repeatedly,
+      against the loop over dictionaries of users. """
+
+  def setUp(self):
+    super(AggregateUsersTestCase, self).setUp()
+    random = Random(1)
+    for r_id in self.reviews:
+      self.reviews[r_id]['product'] = 'p%d' % random.randint(0, 9)
+      self.reviews[r_id]['rel_rating'] = random.random() - 0.5
+
+  def aggregate_by_loop(self, train):
+    users = {}
+    grouped_train = group_votes_by_review(train)
+    for r_id in sorted(grouped_train):
+      review = self.reviews[r_id]
+      if review['author'] not in users:
+        users[review['author']] = create_user(review['author'])
+      add_user_rating(users[review['author']], review['rating'],
+          review['rel_rating'], review['product'])
+      avg_help = float(sum([v['vote'] for v in grouped_train[r_id]])) / \
+          len(grouped_train[r_id])
+      for vote in grouped_train[r_id]:
+        if vote['voter'] not in users:
+          users[vote['voter']] = create_user(vote['voter'])
+        add_user_vote(users[review['author']], users[vote['voter']],
+            vote['vote'], avg_help)
+    finalize_vote_related_features(users)
+    return users
+
+  def test_aggregate_users(self):
+    for start in xrange(0, 600, 100):
+      train = self.votes[start:start+100]
+      self.assertUsersEqual(aggregate_users(self.reviews, train),
+          self.aggregate_by_loop(train))
+
+
+if __name__ == '__main__':
+  main()
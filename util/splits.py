@@ -0,0 +1,169 @@
+""" Splits Module
+    -------------
+
+    Contains views of train, validation and test sets over the vote table, the
+  list of votes in chronological order, which is persisted once with the
+  offsets of each split instead of copied lists of votes by set.
+
+    Usage:
+      Used only as a module, not directly callable.
+"""
+
+
+from pickle import load, dump
+
+
+_PKL_DIR = 'out/pkl'
+_SET_TYPES = ['train', 'validation', 'test']
+_TABLES = {} # vote tables already loaded, indexed by file path
+
+
+class VoteView(object):
+  """ Read-only sequence of votes of a set, which is either a (start, stop)
+      range or an array of indices over the vote table.
+
+      Args:
+        self: the VoteView object.
+        votes: the list of votes in chronological order.
+        selection: a (start, stop) tuple or an array of indices of votes.
+  """
+
+  def __init__(self, votes, selection):
+    self.votes = votes
+    self.selection = selection
+
+  def get_indices(self):
+    """ Gets the indices of the votes of the view over the table.
+
+        Args:
+          self: the VoteView object.
+
+        Returns:
+          A sequence of integer indices.
+    """
+    if isinstance(self.selection, tuple):
+      return xrange(*self.selection)
+    return self.selection
+
+  def __len__(self):
+    return len(self.get_indices())
+
+  def __iter__(self):
+    for index in self.get_indices():
+      yield self.votes[index]
+
+  def __getitem__(self, key):
+    indices = self.get_indices()
+    if isinstance(key, slice):
+      return [self.votes[indices[i]] for i in xrange(*key.indices(
+          len(indices)))]
+    return self.votes[indices[key]]
+
+  def __add__(self, other):
+    return list(self) + list(other)
+
+  def __radd__(self, other):
+    return list(other) + list(self)
+
+
+def get_split_views(votes, split):
+  """ Gets the views of the sets of a split.
+
+      Args:
+        votes: the list of votes in chronological order.
+        split: a dictionary from set type ('train', 'validation' or 'test') to
+      the selection of its votes.
+
+      Returns:
+        A triple of VoteView objects of train, validation and test sets.
+  """
+  return tuple(VoteView(votes, split[set_type]) for set_type in _SET_TYPES)
+
+
+def dump_splits(votes, splits, pkl_dir=_PKL_DIR):
+  """ Writes the vote table and the selections of the splits.
+
+      Args:
+        votes: the list of votes in chronological order.
+        splits: a list of dictionaries from set type to the selection of its
+      votes.
+        pkl_dir: the directory of the pickle files.
+
+      Returns:
+        None.
+  """
+  with open('%s/votes.pkl' % pkl_dir, 'w') as votes_file:
+    dump(votes, votes_file)
+  dump_split_offsets(splits, pkl_dir)
+
+
+def dump_split_offsets(splits, pkl_dir=_PKL_DIR):
+  """ Writes the selections of the splits.
+
+      Args:
+        splits: a list of dictionaries from set type to the selection of its
+      votes.
+        pkl_dir: the directory of the pickle files.
+
+      Returns:
+        None.
+  """
+  with open('%s/splits.pkl' % pkl_dir, 'w') as splits_file:
+    dump(splits, splits_file)
+
+
+def load_votes(pkl_dir=_PKL_DIR):
+  """ Loads the vote table, once per directory.
+
+      Args:
+        pkl_dir: the directory of the pickle files.
+
+      Returns:
+        The list of votes in chronological order.
+  """
+  path = '%s/votes.pkl' % pkl_dir
+  if path not in _TABLES:
+    with open(path, 'r') as votes_file:
+      _TABLES[path] = load(votes_file)
+  return _TABLES[path]
+
+
+def load_split_offsets(pkl_dir=_PKL_DIR):
+  """ Loads the selections of the splits.
+
+      Args:
+        pkl_dir: the directory of the pickle files.
+
+      Returns:
+        A list of dictionaries from set type to the selection of its votes.
+  """
+  with open('%s/splits.pkl' % pkl_dir, 'r') as splits_file:
+    return load(splits_file)
+
+
+def load_split(index, pkl_dir=_PKL_DIR):
+  """ Loads the sets of a split as views over the vote table.
+
+      Args:
+        index: integer with the index of the split.
+        pkl_dir: the directory of the pickle files.
+
+      Returns:
+        A triple of VoteView objects of train, validation and test sets.
+  """
+  splits = load_split_offsets(pkl_dir)
+  return get_split_views(load_votes(pkl_dir), splits[index])
+
+
+def load_split_set(set_type, index, pkl_dir=_PKL_DIR):
+  """ Loads a set of a split as a view over the vote table.
+
+      Args:
+        set_type: 'train', 'validation' or 'test'.
+        index: integer with the index of the split.
+        pkl_dir: the directory of the pickle files.
+
+      Returns:
+        A VoteView object of the set.
+  """
+  return load_split(index, pkl_dir)[_SET_TYPES.index(set_type)]